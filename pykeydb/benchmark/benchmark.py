@@ -3,21 +3,40 @@ import threading
 import random
 import string
 import os
+import subprocess
+import sys
 from statistics import mean
 
 from pykeydb.db.pyKeyDB import get_pykey_db, dispose_pykey_db
 from pykeydb.db.writeAheadLog import get_write_ahead_log, dispose_write_ahead_log
+from pykeydb.db.sortedSet import ScoreRange
 
 # Config
 NUM_THREADS = 4
 OPS_PER_THREAD = 10_000
+STARTUP_KEYS = 20_000
+STARTUP_OVERWRITES = 10
+
+# Run in a fresh interpreter so peak RSS only reflects loading the DB
+_STARTUP_SCRIPT = """
+import resource, sys, time
+from pykeydb.db.pyKeyDB import get_pykey_db
+from pykeydb.db.writeAheadLog import get_write_ahead_log
+start = time.perf_counter()
+db = get_pykey_db(
+    get_write_ahead_log(sys.argv[1]), sys.argv[1], replay_last_writer_wins=sys.argv[2] == "1"
+)
+elapsed = time.perf_counter() - start
+# ru_maxrss is in KiB on Linux (bytes on macOS)
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, db.dbsize())
+"""
 
 
 def random_key():
     return "".join(random.choices(string.ascii_lowercase, k=16))
 
 
-def setup_db(wal_path="benchmark.wal", use_fsync=False):
+def setup_db(wal_path="benchmark.wal", use_fsync=False, fsync_policy=None, num_shards=None):
     """Setup a fresh DB instance for benchmarking"""
     # Clean up old instances (this also removes from factory caches)
     dispose_pykey_db(wal_path)
@@ -28,9 +47,10 @@ def setup_db(wal_path="benchmark.wal", use_fsync=False):
         os.remove(wal_path)
 
     # Create new instances
-    wal = get_write_ahead_log(wal_path, use_fsync=use_fsync)
-    db = get_pykey_db(wal, wal_path)
-    return db
+    wal = get_write_ahead_log(wal_path, use_fsync=use_fsync, fsync_policy=fsync_policy)
+    if num_shards is None:
+        return get_pykey_db(wal, wal_path)
+    return get_pykey_db(wal, wal_path, num_shards=num_shards)
 
 
 def benchmark_set(db, thread_id, latencies):
@@ -49,6 +69,24 @@ def benchmark_get(db, keys, latencies):
         latencies.append(time.perf_counter() - start)
 
 
+def benchmark_incr(db, thread_id, latencies):
+    for i in range(OPS_PER_THREAD):
+        key = f"counter-{i % 100}"
+        start = time.perf_counter()
+        db.incrby(key, 1)
+        latencies.append(time.perf_counter() - start)
+
+
+def benchmark_get_set_counter(db, thread_id, latencies):
+    # What a counter costs without INCR: GET + SET as one transaction
+    for i in range(OPS_PER_THREAD):
+        key = f"txn-counter-{i % 100}"
+        start = time.perf_counter()
+        with db.locked(key, write=True):
+            db.set(key, str(int(db.get(key) or 0) + 1))
+        latencies.append(time.perf_counter() - start)
+
+
 def benchmark_lpush(db, thread_id, latencies):
     for i in range(OPS_PER_THREAD):
         key = f"list-{thread_id}"
@@ -170,16 +208,72 @@ def benchmark_srem(db, set_keys, latencies):
         latencies.append(time.perf_counter() - start)
 
 
+def benchmark_zadd(db, thread_id, latencies):
+    for i in range(OPS_PER_THREAD):
+        key = f"zset-{thread_id}"
+        start = time.perf_counter()
+        db.zadd(key, {f"member{i}": random.random() * OPS_PER_THREAD})
+        latencies.append(time.perf_counter() - start)
+
+
+def benchmark_zrank(db, zset_keys, latencies):
+    for _ in range(OPS_PER_THREAD):
+        key = random.choice(zset_keys)
+        member = f"member{random.randint(0, OPS_PER_THREAD - 1)}"
+        start = time.perf_counter()
+        db.zrank(key, member)
+        latencies.append(time.perf_counter() - start)
+
+
+def benchmark_zrangebyscore(db, zset_keys, latencies):
+    for _ in range(OPS_PER_THREAD):
+        key = random.choice(zset_keys)
+        low = random.random() * OPS_PER_THREAD
+        start = time.perf_counter()
+        # A top-10 window starting at a random score, like a leaderboard page
+        db.zrangebyscore(key, ScoreRange(low, float("inf")), 0, 10)
+        latencies.append(time.perf_counter() - start)
+
+
+def build_startup_wal(wal_path="startup.wal"):
+    """Write a WAL where every key is overwritten STARTUP_OVERWRITES times"""
+    db = setup_db(wal_path)
+    value = "x" * 100
+    for _ in range(STARTUP_OVERWRITES):
+        for i in range(STARTUP_KEYS):
+            db.set(f"key-{i}", value)
+    dispose_pykey_db(wal_path)
+    dispose_write_ahead_log(wal_path)
+    return wal_path
+
+
+def run_startup_benchmark(wal_path, last_writer_wins):
+    name = "last-writer-wins" if last_writer_wins else "full"
+    print(f"\n=== Startup benchmark ({name} replay) ===")
+    result = subprocess.run(
+        [sys.executable, "-c", _STARTUP_SCRIPT, wal_path, "1" if last_writer_wins else "0"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, max_rss_kb, keys = result.stdout.split()
+    print(f"WAL size: {os.path.getsize(wal_path) / 1e6:.1f} MB")
+    print(f"Keys loaded: {int(keys):,}")
+    print(f"Startup time: {float(elapsed):.2f}s")
+    print(f"Peak RSS: {int(max_rss_kb) / 1024:.1f} MB")
+
+
 # Runner
-def run_benchmark(name, target, *args):
-    print(f"\n=== {name} ===")
+def run_benchmark(name, target, *args, num_threads=NUM_THREADS, quiet=False):
+    if not quiet:
+        print(f"\n=== {name} ===")
 
     latencies = []
     threads = []
 
     start_time = time.perf_counter()
 
-    for thread_id in range(NUM_THREADS):
+    for thread_id in range(num_threads):
         t = threading.Thread(target=target, args=(*args, thread_id, latencies))
         threads.append(t)
         t.start()
@@ -194,12 +288,118 @@ def run_benchmark(name, target, *args):
         return
 
     total_ops = len(latencies)
+    if quiet:
+        return total_ops / duration
 
     print(f"Total ops: {total_ops}")
     print(f"Total time: {duration:.2f}s")
     print(f"Throughput: {total_ops / duration:,.0f} ops/sec")
     print(f"Avg latency: {mean(latencies) * 1e6:.2f} µs")
     print(f"P95 latency: {sorted(latencies)[int(0.95 * total_ops)] * 1e6:.2f} µs")
+    return total_ops / duration
+
+
+def run_scaling_benchmark(thread_counts=(1, 2, 4, 8), shard_counts=(1, 16)):
+    """Throughput of SET/GET as threads are added, with a single lock vs striped shards"""
+    print("\nops/sec by thread count (GIL builds serialize bytecode; free-threaded builds scale with shards)")
+    header = f"{'shards':>8} {'op':>5}" + "".join(f"{t:>12}" for t in thread_counts)
+    print(header)
+    for shards in shard_counts:
+        set_row, get_row = [], []
+        for threads in thread_counts:
+            db = setup_db(num_shards=shards)
+            set_row.append(run_benchmark("SET", benchmark_set, db, num_threads=threads, quiet=True))
+            keys = db.keys()
+
+            def get_wrapper(db, thread_id, latencies):
+                benchmark_get(db, keys, latencies)
+
+            get_row.append(run_benchmark("GET", get_wrapper, db, num_threads=threads, quiet=True))
+        print(f"{shards:>8} {'SET':>5}" + "".join(f"{v:>12,.0f}" for v in set_row))
+        print(f"{shards:>8} {'GET':>5}" + "".join(f"{v:>12,.0f}" for v in get_row))
+
+
+LARGE_HASH_FIELDS = 10_000
+SNAPSHOT_READ_SECONDS = 2.0
+
+
+def run_snapshot_read_benchmark(readers=2, writers=2):
+    """
+    HGETALL readers iterating a large hash while writers HSET into it. Readers
+    get a copy-on-write view; for comparison, the same readers copy the hash
+    while holding its lock, which is what a safe read costs without views.
+    """
+    print(f"\n{readers} readers + {writers} writers on one {LARGE_HASH_FIELDS:,}-field hash for {SNAPSHOT_READ_SECONDS:.0f}s")
+    print(f"{'read path':>18} {'reads/s':>10} {'writes/s':>10} {'write p95':>12} {'errors':>7}")
+
+    def copy_under_lock(db):
+        with db.locked("big-hash"):
+            return dict(db.hgetall("big-hash"))
+
+    for name, read in (("copy-on-write view", lambda db: db.hgetall("big-hash")), ("copy under lock", copy_under_lock)):
+        db = setup_db()
+        db.hset("big-hash", {f"field-{i}": str(i) for i in range(LARGE_HASH_FIELDS)})
+        stop = threading.Event()
+        reads, write_latencies, errors = [], [], []
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    # Iterating the result is what races with writers when it is a live reference
+                    sum(len(value) for value in read(db).values())
+                    reads.append(1)
+                except RuntimeError as e:
+                    errors.append(e)
+
+        def writer(thread_id):
+            i = 0
+            while not stop.is_set():
+                start = time.perf_counter()
+                db.hset("big-hash", {f"field-{(thread_id * 7919 + i) % LARGE_HASH_FIELDS}": str(i)})
+                write_latencies.append(time.perf_counter() - start)
+                i += 1
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        for t in threads:
+            t.start()
+        time.sleep(SNAPSHOT_READ_SECONDS)
+        stop.set()
+        for t in threads:
+            t.join()
+        p95 = sorted(write_latencies)[int(0.95 * len(write_latencies))] * 1e6 if write_latencies else 0
+        print(
+            f"{name:>18} {len(reads) / SNAPSHOT_READ_SECONDS:>10,.0f} "
+            f"{len(write_latencies) / SNAPSHOT_READ_SECONDS:>10,.0f} {p95:>10.0f}µs {len(errors):>7}"
+        )
+
+
+def run_alternating_read_write_benchmark(rounds=2000):
+    """
+    One client alternating HGETALL and HSET on a large hash. As in the server,
+    the reply is built from the view and the view dropped before the write,
+    so the write changes the hash in place; for comparison, the view is kept
+    alive across the write, which makes it copy the hash first.
+    """
+    print(f"\nHGETALL then HSET, alternating on one {LARGE_HASH_FIELDS:,}-field hash ({rounds:,} rounds)")
+    print(f"{'during the write':>18} {'write p50':>12} {'write p95':>12}")
+    for name, keep_view in (("view released", False), ("view still held", True)):
+        db = setup_db()
+        db.hset("big-hash", {f"field-{i}": str(i) for i in range(LARGE_HASH_FIELDS)})
+        latencies = []
+        for i in range(rounds):
+            view = db.hgetall("big-hash")
+            dict(view.items())
+            if not keep_view:
+                view = None
+            start = time.perf_counter()
+            db.hset("big-hash", {f"field-{i % LARGE_HASH_FIELDS}": str(i)})
+            latencies.append(time.perf_counter() - start)
+            view = None
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1e6
+        p95 = latencies[int(0.95 * len(latencies))] * 1e6
+        print(f"{name:>18} {p50:>10.0f}µs {p95:>10.0f}µs")
 
 
 if __name__ == "__main__":
@@ -215,12 +415,14 @@ if __name__ == "__main__":
     db = setup_db()
     run_benchmark("SET benchmark", benchmark_set, db)
 
-    keys = list(db._db.keys())
+    keys = db.keys()
 
     def get_wrapper(db, thread_id, latencies):
         benchmark_get(db, keys, latencies)
 
     run_benchmark("GET benchmark", get_wrapper, db)
+    run_benchmark("INCR benchmark", benchmark_incr, db)
+    run_benchmark("GET+SET transaction benchmark", benchmark_get_set_counter, db)
 
     # List operations
     print("\n" + "=" * 60)
@@ -230,7 +432,7 @@ if __name__ == "__main__":
     db = setup_db()
     run_benchmark("LPUSH benchmark", benchmark_lpush, db)
 
-    list_keys = [k for k in db._db.keys() if k.startswith("list-")]
+    list_keys = [k for k in db.keys() if k.startswith("list-")]
 
     def lrange_wrapper(db, thread_id, latencies):
         benchmark_lrange(db, list_keys, latencies)
@@ -240,7 +442,7 @@ if __name__ == "__main__":
     db = setup_db()
     run_benchmark("RPUSH benchmark", benchmark_rpush, db)
 
-    list_keys = [k for k in db._db.keys() if k.startswith("list-")]
+    list_keys = [k for k in db.keys() if k.startswith("list-")]
 
     def lpop_wrapper(db, thread_id, latencies):
         benchmark_lpop(db, list_keys, latencies)
@@ -255,7 +457,7 @@ if __name__ == "__main__":
     db = setup_db()
     run_benchmark("HSET benchmark", benchmark_hset, db)
 
-    hash_keys = [k for k in db._db.keys() if k.startswith("hash-")]
+    hash_keys = [k for k in db.keys() if k.startswith("hash-")]
 
     def hget_wrapper(db, thread_id, latencies):
         benchmark_hget(db, hash_keys, latencies)
@@ -285,7 +487,7 @@ if __name__ == "__main__":
     db = setup_db()
     run_benchmark("SADD benchmark", benchmark_sadd, db)
 
-    set_keys = [k for k in db._db.keys() if k.startswith("set-")]
+    set_keys = [k for k in db.keys() if k.startswith("set-")]
 
     def sismember_wrapper(db, thread_id, latencies):
         benchmark_sismember(db, set_keys, latencies)
@@ -307,6 +509,60 @@ if __name__ == "__main__":
 
     run_benchmark("SREM benchmark", srem_wrapper, db)
 
+    # Sorted set operations
+    print("\n" + "=" * 60)
+    print("Sorted Set Operations")
+    print("=" * 60)
+
+    db = setup_db()
+    run_benchmark("ZADD benchmark", benchmark_zadd, db)
+
+    zset_keys = [k for k in db.keys() if k.startswith("zset-")]
+
+    def zrank_wrapper(db, thread_id, latencies):
+        benchmark_zrank(db, zset_keys, latencies)
+
+    run_benchmark("ZRANK benchmark", zrank_wrapper, db)
+
+    def zrangebyscore_wrapper(db, thread_id, latencies):
+        benchmark_zrangebyscore(db, zset_keys, latencies)
+
+    run_benchmark("ZRANGEBYSCORE benchmark", zrangebyscore_wrapper, db)
+
+    # Thread scaling (lock striping)
+    print("\n" + "=" * 60)
+    print("Thread Scaling")
+    print("=" * 60)
+
+    run_scaling_benchmark()
+
+    # Snapshot reads (copy-on-write views of large collections)
+    print("\n" + "=" * 60)
+    print("Snapshot Reads")
+    print("=" * 60)
+
+    run_snapshot_read_benchmark()
+    run_alternating_read_write_benchmark()
+
+    # Startup (WAL replay)
+    print("\n" + "=" * 60)
+    print("Startup")
+    print("=" * 60)
+
+    startup_wal = build_startup_wal()
+    run_startup_benchmark(startup_wal, last_writer_wins=False)
+    run_startup_benchmark(startup_wal, last_writer_wins=True)
+    os.remove(startup_wal)
+
+    # Durability policies (group commit batches fsyncs under "always")
+    print("\n" + "=" * 60)
+    print("Durability Policies")
+    print("=" * 60)
+
+    for policy in ("no", "everysec", "always"):
+        db = setup_db(fsync_policy=policy)
+        run_benchmark(f"SET benchmark (fsync={policy})", benchmark_set, db)
+
     print("\n" + "=" * 60)
     print("Benchmark Complete!")
     print("=" * 60)
@@ -0,0 +1,105 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional
+
+# Command flags (as reported by COMMAND INFO)
+WRITE = "write"  # may modify the dataset (and the WAL)
+READONLY = "readonly"  # only reads the dataset
+ADMIN = "admin"  # server administration (persistence, introspection)
+FAST = "fast"  # O(1) or O(log N)
+MULTI_KEY = "multi-key"  # may touch more than one key
+DENYOOM = "denyoom"  # may grow the dataset: refused when over maxmemory and nothing can be evicted
+CONNECTION = "connection"  # handled by the client session, not the DB (MULTI, HELLO, ...)
+MOVABLE_KEYS = "movablekeys"  # key positions depend on the arguments (e.g. a numkeys argument)
+BLOCKING = "blocking"  # may block the client until a key is ready; its last argument is the timeout
+KEYSPACE = "keyspace"  # works on the whole keyspace (every shard) rather than on named keys
+
+
+@dataclass
+class Command:
+    """
+    A registered command. arity follows Redis: a positive number is the exact
+    argument count (including the command name), a negative one the minimum.
+    first_key/last_key/key_step locate the key arguments (last_key -1 means the
+    last argument, first_key 0 means the command takes no keys; find_keys
+    replaces them when the key positions depend on the arguments).
+    """
+
+    name: str
+    handler: Optional[Callable]
+    arity: int
+    flags: FrozenSet[str]
+    first_key: int = 1
+    last_key: int = 1
+    key_step: int = 1
+    max_args: Optional[int] = None
+    # For commands whose key positions depend on their arguments: cmd -> keys
+    find_keys: Optional[Callable[[List[str]], List[str]]] = None
+    # Precomputed bounds: callers validate with min_argc <= len(cmd) <= max_argc
+    min_argc: int = field(init=False)
+    max_argc: float = field(init=False)
+
+    def __post_init__(self):
+        self.min_argc = abs(self.arity)
+        if self.arity > 0:
+            self.max_argc = self.arity
+        else:
+            self.max_argc = self.max_args if self.max_args is not None else float("inf")
+
+    @property
+    def is_write(self) -> bool:
+        return WRITE in self.flags
+
+    @property
+    def is_denyoom(self) -> bool:
+        return DENYOOM in self.flags
+
+    @property
+    def is_blocking(self) -> bool:
+        return BLOCKING in self.flags
+
+    @property
+    def is_keyspace(self) -> bool:
+        return KEYSPACE in self.flags
+
+    def keys(self, cmd: List[str]) -> List[str]:
+        """The key arguments of an invocation of this command"""
+        if self.find_keys is not None:
+            return self.find_keys(cmd)
+        if not self.first_key:
+            return []
+        last = self.last_key if self.last_key >= 0 else len(cmd) + self.last_key
+        return cmd[self.first_key : last + 1 : self.key_step]
+
+    def info(self) -> list:
+        """COMMAND INFO entry: name, arity, flags, first key, last key, step"""
+        return [self.name.lower(), self.arity, sorted(self.flags), self.first_key, self.last_key, self.key_step]
+
+
+# Upper-case command name -> Command
+COMMANDS: Dict[str, Command] = {}
+
+
+def command(
+    name: str,
+    arity: int,
+    flags: Iterable[str],
+    first_key: int = 1,
+    last_key: int = 1,
+    key_step: int = 1,
+    max_args: Optional[int] = None,
+    find_keys: Optional[Callable[[List[str]], List[str]]] = None,
+):
+    """Decorator registering handler(db, cmd) -> reply under name"""
+
+    def register(handler: Optional[Callable]):
+        command_flags = frozenset(flags) | ({MOVABLE_KEYS} if find_keys is not None else frozenset())
+        COMMANDS[name] = Command(
+            name, handler, arity, command_flags, first_key, last_key, key_step, max_args, find_keys
+        )
+        return handler
+
+    return register
+
+
+def lookup_command(name: str) -> Optional[Command]:
+    return COMMANDS.get(name.upper())
@@ -1,6 +1,13 @@
+from decimal import Decimal
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 from dataclasses import dataclass
+from pykeydb.db.encodings import SmallHash, new_hash, new_list, new_set
+from pykeydb.db.sortedSet import SortedSet
+
+
+# Initial LFU counter of a new key (see eviction.py)
+LFU_INIT_VAL = 5
 
 
 class DataType(Enum):
@@ -8,26 +15,57 @@ class DataType(Enum):
     LIST = "list"
     HASH = "hash"
     SET = "set"
+    ZSET = "zset"
     INT = "int"
     FLOAT = "float"
 
 
-@dataclass
+# Counters written by INCR and friends are stored as numbers but are strings to clients
+NUMERIC_TYPES = (DataType.INT, DataType.FLOAT)
+
+
+def format_number(value) -> str:
+    """A counter as clients see it: floats in plain notation without a trailing .0, like Redis"""
+    if isinstance(value, int):
+        return str(value)
+    text = repr(value)
+    if "e" in text:
+        text = format(Decimal(text), "f")
+    return text[:-2] if text.endswith(".0") else text
+
+
+@dataclass(slots=True)
 class TypedValue:
+    # Slots instead of a per-instance __dict__: one of these exists per key
     value: Any
     data_type: DataType
-
-    def __init__(self, value, data_type):
-        self.value = value
-        self.data_type = data_type
+    # Absolute expiry time in Unix milliseconds (None = no TTL)
+    expire_at: Optional[int] = None
+    # Eviction metadata, maintained only while maxmemory is set: last access
+    # (monotonic seconds), LFU counter and estimated size in bytes
+    last_access: float = 0.0
+    freq: int = LFU_INIT_VAL
+    size: int = 0
+    # Weak reference to the read-only view of value last handed to a reader:
+    # while the view is alive, the next write replaces value with a copy
+    # instead of mutating it (copy-on-write)
+    shared: Optional[Callable[[], Any]] = None
 
     def to_dict(self) -> Dict:
-        return {"type": self.data_type.value, "value": self._serialize_value()}
+        data = {"type": self.data_type.value, "value": self._serialize_value()}
+        if self.expire_at is not None:
+            data["expire_at"] = self.expire_at
+        return data
 
     def _serialize_value(self):
-        # Convert set to list (for storing in JSON in WAL)
-        if self.data_type == DataType.SET:
+        # Convert sets and lists (any encoding) to list, hashes to dict (for storing in JSON in WAL)
+        if self.data_type == DataType.SET or self.data_type == DataType.LIST:
             return list(self.value)
+        if self.data_type == DataType.HASH and type(self.value) is SmallHash:
+            return dict(self.value.items())
+        # Sorted sets as {member: score}, lowest score first
+        if self.data_type == DataType.ZSET:
+            return dict(self.value.items())
         # Rest, integers and lists can be stored as it is. Dicts are also stored as it is.
         return self.value
 
@@ -37,16 +75,20 @@ class TypedValue:
         data_type = DataType(data["type"])
         value = data["value"]
 
+        # Collections get the most compact encoding that fits them (see encodings.py)
         if data_type == DataType.SET:
-            value = set(value)
+            value = new_set(value)
         elif data_type == DataType.LIST:
-            value = list(value)
+            # Large lists are deques: O(1) push/pop at both ends
+            value = new_list(value)
         elif data_type == DataType.HASH:
-            value = dict(value)
+            value = new_hash(value)
+        elif data_type == DataType.ZSET:
+            value = SortedSet(value.items())
         elif data_type == DataType.INT:
             value = int(value)
         elif data_type == DataType.FLOAT:
             value = float(value)
         elif data_type == DataType.STRING:
             value = str(value)
-        return TypedValue(value=value, data_type=data_type)
+        return TypedValue(value=value, data_type=data_type, expire_at=data.get("expire_at"))
@@ -0,0 +1,557 @@
+import random
+import sys
+from array import array
+from bisect import bisect_left
+from collections import deque
+from collections.abc import Mapping, Set as AbstractSet
+from itertools import islice
+from typing import Iterable, Optional, Tuple
+from pykeydb.db.sortedSet import SortedSet
+
+# Small collections are stored in compact encodings and converted to the full
+# structure (deque / IndexedDict / RandomSet) once they outgrow these limits (Redis defaults)
+LIST_MAX_ENTRIES = 128
+HASH_MAX_ENTRIES = 128
+SET_MAX_ENTRIES = 128
+SET_MAX_INTSET_ENTRIES = 512
+# Longest string (in characters) a compact encoding may hold
+MAX_VALUE_LENGTH = 64
+
+# IndexedDict generations wrap around at this many bits (the share of a SCAN cursor they take)
+GENERATION_BITS = 16
+
+# Range of integer set members and counters
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+
+
+def _short(items: Iterable[str]) -> bool:
+    return all(len(item) <= MAX_VALUE_LENGTH for item in items)
+
+
+def _grows_past(value, items, limit: int) -> bool:
+    """Whether adding items takes a hash or set past limit entries (repeats and ones it holds do not count)"""
+    if len(value) + len(items) <= limit:
+        return False
+    return len(value) + sum(1 for item in set(items) if item not in value) > limit
+
+
+def as_int64(member: str) -> Optional[int]:
+    """The integer a string spells in canonical form (no sign, spaces or zero padding tricks), else None"""
+    # Cheap rejection first: raising ValueError costs more than the whole check
+    if not member.lstrip("-").isdigit():
+        return None
+    try:
+        number = int(member)
+    except ValueError:
+        return None
+    if not INT64_MIN <= number <= INT64_MAX or str(number) != member:
+        return None
+    return number
+
+
+# Unbound list methods: SmallHash overrides the dunders with field semantics
+_list_index = list.index
+_list_getitem = list.__getitem__
+
+
+class SmallList(list):
+    """A short list stored as a plain Python list, with the deque methods PyKeyDB uses"""
+
+    __slots__ = ()
+
+    def appendleft(self, item):
+        self.insert(0, item)
+
+    def popleft(self):
+        return self.pop(0)
+
+    def extendleft(self, items):
+        # Like deque.extendleft: each item is prepended in turn, so they end up reversed
+        items = list(items)
+        items.reverse()
+        self[0:0] = items
+
+
+class SmallHash(list):
+    """
+    A small hash stored as one flat list [field, value, field, value, ...].
+    Lookups scan the list in C (list.index); with at most HASH_MAX_ENTRIES
+    fields this is as fast as hashing, at a fraction of a dict's memory.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, fields=()):
+        super().__init__()
+        for field, value in fields.items() if hasattr(fields, "items") else fields:
+            self[field] = value
+
+    def _find(self, field) -> int:
+        """Index of field in the flat list, or -1; values equal to field are skipped"""
+        start = 0
+        while True:
+            try:
+                i = _list_index(self, field, start)
+            except ValueError:
+                return -1
+            if not i & 1:
+                return i
+            start = i + 1
+
+    def __len__(self):
+        return list.__len__(self) // 2
+
+    def __iter__(self):
+        return islice(list.__iter__(self), 0, None, 2)
+
+    def __contains__(self, field):
+        return self._find(field) >= 0
+
+    def __getitem__(self, field):
+        i = self._find(field)
+        if i < 0:
+            raise KeyError(field)
+        return _list_getitem(self, i + 1)
+
+    def __setitem__(self, field, value):
+        i = self._find(field)
+        if i < 0:
+            list.append(self, field)
+            list.append(self, value)
+        else:
+            list.__setitem__(self, i + 1, value)
+
+    def __delitem__(self, field):
+        i = self._find(field)
+        if i < 0:
+            raise KeyError(field)
+        list.__delitem__(self, slice(i, i + 2))
+
+    def get(self, field, default=None):
+        # Fast path for the common case: the first match is a field, not a value
+        try:
+            i = _list_index(self, field)
+        except ValueError:
+            return default
+        if i & 1:
+            i = self._find(field)
+            if i < 0:
+                return default
+        return _list_getitem(self, i + 1)
+
+    def pop(self, field, *default):
+        i = self._find(field)
+        if i < 0:
+            if default:
+                return default[0]
+            raise KeyError(field)
+        value = list.__getitem__(self, i + 1)
+        list.__delitem__(self, slice(i, i + 2))
+        return value
+
+    def update(self, fields):
+        for field, value in fields.items():
+            self[field] = value
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return list(islice(list.__iter__(self), 1, None, 2))
+
+    def items(self):
+        flat = list.__iter__(self)
+        return zip(flat, flat)
+
+    def __repr__(self):
+        return f"SmallHash({dict(self.items())!r})"
+
+
+class SmallSet(list):
+    """A small set of strings stored as a list; membership is a C-level scan"""
+
+    __slots__ = ()
+
+    def add(self, member):
+        if not list.__contains__(self, member):
+            self.append(member)
+
+    def discard(self, member):
+        if list.__contains__(self, member):
+            list.remove(self, member)
+
+    def remove(self, member):
+        if not list.__contains__(self, member):
+            raise KeyError(member)
+        list.remove(self, member)
+
+    def update(self, members):
+        for member in members:
+            self.add(member)
+
+    def difference_update(self, members):
+        for member in members:
+            self.discard(member)
+
+    def random_member(self):
+        return random.choice(self)
+
+    def sample(self, count: int) -> list:
+        """count distinct random members (count <= len)"""
+        return random.sample(self, count)
+
+    def choices(self, count: int) -> list:
+        """count random members, possibly repeated"""
+        return random.choices(self, k=count)
+
+
+class IntSet(array):
+    """
+    A set of integer-like strings stored as a sorted array of int64, 8 bytes per
+    member. Members go in and come out as strings, like every other set.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, members=()):
+        numbers = sorted({as_int64(member) for member in members})
+        return super().__new__(cls, "q", numbers)
+
+    def _position(self, member):
+        """(index, number) for a member; index is None if it is not in the set"""
+        number = as_int64(member)
+        if number is None:
+            return None, None
+        i = bisect_left(self, number)
+        if i < len(self) and self[i] == number:
+            return i, number
+        return None, number
+
+    def __contains__(self, member):
+        # Inlined _position: membership is the hot path
+        number = as_int64(member)
+        if number is None:
+            return False
+        i = bisect_left(self, number)
+        return i < len(self) and self[i] == number
+
+    def __iter__(self):
+        return map(str, array.__iter__(self))
+
+    def add(self, member):
+        i, number = self._position(member)
+        if i is None:
+            self.insert(bisect_left(self, number), number)
+
+    def discard(self, member):
+        i, _ = self._position(member)
+        if i is not None:
+            array.pop(self, i)
+
+    def remove(self, member):
+        i, _ = self._position(member)
+        if i is None:
+            raise KeyError(member)
+        array.pop(self, i)
+
+    def update(self, members):
+        for member in members:
+            self.add(member)
+
+    def difference_update(self, members):
+        for member in members:
+            self.discard(member)
+
+    def random_member(self):
+        return str(random.choice(self))
+
+    def sample(self, count: int) -> list:
+        return [str(number) for number in random.sample(self, count)]
+
+    def choices(self, count: int) -> list:
+        return [str(number) for number in random.choices(self, k=count)]
+
+    def __repr__(self):
+        return f"IntSet({list(self)!r})"
+
+
+class RandomSet(AbstractSet):
+    """
+    A large set that can pick a uniformly random member in O(1): members are
+    kept in a list, with a dict mapping each member to its index. A removal
+    moves the last member into the hole (swap-remove), so both stay dense.
+    This is the "hashtable" encoding of sets.
+    """
+
+    __slots__ = ("_members", "_positions")
+
+    def __init__(self, members=()):
+        self._members = list(dict.fromkeys(members))
+        self._positions = {member: i for i, member in enumerate(self._members)}
+
+    def __contains__(self, member):
+        return member in self._positions
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self._members) + sys.getsizeof(self._positions)
+
+    def add(self, member):
+        if member not in self._positions:
+            self._positions[member] = len(self._members)
+            self._members.append(member)
+
+    def discard(self, member):
+        index = self._positions.pop(member, None)
+        if index is None:
+            return
+        last = self._members.pop()
+        if index < len(self._members):
+            self._members[index] = last
+            self._positions[last] = index
+
+    def remove(self, member):
+        if member not in self._positions:
+            raise KeyError(member)
+        self.discard(member)
+
+    def update(self, members):
+        for member in members:
+            self.add(member)
+
+    def difference_update(self, members):
+        for member in members:
+            self.discard(member)
+
+    def copy(self) -> "RandomSet":
+        clone = RandomSet.__new__(RandomSet)
+        clone._members = self._members.copy()
+        clone._positions = self._positions.copy()
+        return clone
+
+    def random_member(self):
+        return random.choice(self._members)
+
+    def sample(self, count: int) -> list:
+        return random.sample(self._members, count)
+
+    def choices(self, count: int) -> list:
+        return random.choices(self._members, k=count)
+
+    def scan(self, end: int, count: int) -> Tuple[list, int]:
+        """
+        The count members before index end (end 0: the last ones), and the new
+        end, 0 once the walk is done. Walking down from the end, a swap-remove
+        only ever moves the last member, one the walk has already returned, so
+        no member that stays in the set can be missed.
+        """
+        end = len(self._members) if not end else min(end, len(self._members))
+        start = max(end - count, 0)
+        return self._members[start:end], start
+
+    def __repr__(self):
+        return f"RandomSet({self._members!r})"
+
+
+class IndexedDict(dict):
+    """
+    A dict that also lists its keys, append-only: a deleted key stays in the
+    list, skipped by readers, until the list is rebuilt once such stale entries
+    dominate it. Between rebuilds (counted by generation) a key's position in
+    the list never changes, so a SCAN cursor can be just a position, and a
+    random list entry samples a key in O(1) for eviction. It costs one pointer
+    per key. This is every shard's key table and the "hashtable" encoding of hashes.
+    """
+
+    __slots__ = ("_keys", "generation")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._keys = list(self)
+        self.generation = 0
+
+    def __setitem__(self, key, value):
+        new = key not in self
+        dict.__setitem__(self, key, value)
+        if new:
+            self._keys.append(key)
+            if len(self._keys) > 2 * len(self) + 1024:
+                self._rebuild()
+
+    def __sizeof__(self):
+        return dict.__sizeof__(self) + sys.getsizeof(self._keys)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._rebuild()
+
+    def copy(self) -> "IndexedDict":
+        return IndexedDict(self)
+
+    def _rebuild(self):
+        self._keys = list(self)
+        self.generation = (self.generation + 1) % (1 << GENERATION_BITS)
+
+    def scan(self, position: int, count: int) -> Tuple[list, int]:
+        """
+        The live keys among the count list entries from position, and the
+        position after them. Positions from an older generation mean nothing:
+        callers restart at 0 (returning keys again, but missing none).
+        """
+        batch = self._keys[position : position + count]
+        return [key for key in batch if key in self], position + len(batch)
+
+    @property
+    def scan_end(self) -> int:
+        """Length of the key list: a scan is done once it reaches it"""
+        return len(self._keys)
+
+    def random_key(self) -> Optional[str]:
+        # A key deleted and set again is listed twice until the next rebuild,
+        # which only skews sampling slightly
+        for attempt in range(4):
+            if attempt == 3:
+                self._rebuild()
+            if not self._keys:
+                return None
+            key = random.choice(self._keys)
+            if key in self:
+                return key
+        return None
+
+
+class HashView(Mapping):
+    """
+    Read-only view of a hash, like MappingProxyType but weakly referenceable,
+    so the hash can tell whether a reader still holds it (see PyKeyDB._unshare)
+    """
+
+    __slots__ = ("_fields", "__weakref__")
+
+    def __init__(self, fields):
+        self._fields = fields
+
+    def __getitem__(self, field):
+        return self._fields[field]
+
+    def __contains__(self, field):
+        return field in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def get(self, field, default=None):
+        return self._fields.get(field, default)
+
+    # The dict's own views, iterated in C
+    def keys(self):
+        return self._fields.keys()
+
+    def values(self):
+        return self._fields.values()
+
+    def items(self):
+        return self._fields.items()
+
+    def __repr__(self):
+        return f"HashView({dict(self._fields)!r})"
+
+
+class SetView(AbstractSet):
+    """Read-only view of a set, what HashView is to a hash"""
+
+    __slots__ = ("_members", "__weakref__")
+
+    def __init__(self, members):
+        self._members = members
+
+    def __contains__(self, member):
+        return member in self._members
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def __repr__(self):
+        return f"SetView({self._members!r})"
+
+
+def new_list(items) -> list:
+    items = list(items)
+    if len(items) <= LIST_MAX_ENTRIES and _short(items):
+        return SmallList(items)
+    return deque(items)
+
+
+def list_for_write(value, items) -> list:
+    """The list to apply a write adding items to: value itself, or value converted to a deque"""
+    if type(value) is SmallList and (len(value) + len(items) > LIST_MAX_ENTRIES or not _short(items)):
+        return deque(value)
+    return value
+
+
+def new_hash(fields: dict):
+    if len(fields) <= HASH_MAX_ENTRIES and _short(fields) and _short(fields.values()):
+        return SmallHash(fields)
+    return IndexedDict(fields)
+
+
+def hash_for_write(value, fields: dict):
+    """The hash to apply a write of fields to: value itself, or value converted to an IndexedDict"""
+    if type(value) is SmallHash and (
+        _grows_past(value, fields, HASH_MAX_ENTRIES) or not (_short(fields) and _short(fields.values()))
+    ):
+        return IndexedDict(value.items())
+    return value
+
+
+def new_set(members):
+    members = set(members)
+    if len(members) <= SET_MAX_INTSET_ENTRIES and all(as_int64(m) is not None for m in members):
+        return IntSet(members)
+    if len(members) <= SET_MAX_ENTRIES and _short(members):
+        return SmallSet(members)
+    return RandomSet(members)
+
+
+def set_for_write(value, members):
+    """The set to apply a write adding members to: value itself, or value converted up an encoding"""
+    if type(value) is IntSet:
+        if not _grows_past(value, members, SET_MAX_INTSET_ENTRIES) and all(as_int64(m) is not None for m in members):
+            return value
+        value = SmallSet(value)
+    if type(value) is SmallSet and (_grows_past(value, members, SET_MAX_ENTRIES) or not _short(members)):
+        return RandomSet(value)
+    return value
+
+
+def encoding_of(value) -> str:
+    """Name of a value's encoding, as reported by OBJECT ENCODING"""
+    if isinstance(value, (SmallList, SmallHash, SmallSet)):
+        return "listpack"
+    if isinstance(value, IntSet):
+        return "intset"
+    if isinstance(value, deque):
+        return "quicklist"
+    if isinstance(value, (dict, RandomSet)):
+        return "hashtable"
+    if isinstance(value, SortedSet):
+        return "skiplist"
+    if isinstance(value, int):
+        return "int"
+    return "raw"
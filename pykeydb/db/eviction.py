@@ -0,0 +1,98 @@
+import random
+import re
+import sys
+from itertools import islice
+from pykeydb.db.dataTypes import LFU_INIT_VAL, DataType, TypedValue
+from pykeydb.db.encodings import IntSet
+
+# maxmemory-policy values (same names and meaning as Redis)
+NOEVICTION = "noeviction"
+EVICTION_POLICIES = (
+    NOEVICTION,
+    "allkeys-lru",
+    "allkeys-lfu",
+    "allkeys-random",
+    "volatile-lru",
+    "volatile-lfu",
+    "volatile-random",
+    "volatile-ttl",
+)
+
+# Keys sampled per eviction, and how many of the best candidates seen are remembered
+DEFAULT_MAXMEMORY_SAMPLES = 5
+EVICTION_POOL_SIZE = 16
+
+# LFU counter: starts at LFU_INIT_VAL so new keys are not evicted straight away,
+# grows logarithmically (LFU_LOG_FACTOR) and decays by one per LFU_DECAY_TIME idle seconds
+LFU_LOG_FACTOR = 10
+LFU_DECAY_TIME = 60
+LFU_MAX = 255
+
+# Rough per-key cost on top of the key and value objects: the TypedValue
+# instance and the key's slot in the shard dict
+ENTRY_OVERHEAD = sys.getsizeof(TypedValue(None, DataType.STRING)) + 48
+# Collection elements measured to extrapolate a collection's size
+SIZE_SAMPLES = 5
+COLLECTION_TYPES = (DataType.LIST, DataType.SET, DataType.HASH, DataType.ZSET)
+
+_MEMORY_UNITS = {"": 1, "b": 1, "k": 1000, "kb": 1024, "m": 1000**2, "mb": 1024**2, "g": 1000**3, "gb": 1024**3}
+
+
+def parse_memory(value: str) -> int:
+    """Parse a memory size such as 100mb or 1gb (Redis units) into bytes"""
+    match = re.fullmatch(r"\s*(\d+)\s*([a-zA-Z]*)\s*", str(value))
+    if not match or match.group(2).lower() not in _MEMORY_UNITS:
+        raise ValueError(f"invalid memory size {value!r}")
+    return int(match.group(1)) * _MEMORY_UNITS[match.group(2).lower()]
+
+
+def estimate_size(key: str, typed_val: TypedValue) -> int:
+    """
+    Approximate bytes used by a key. O(1): a collection's elements are
+    extrapolated from a few samples instead of being measured one by one.
+    """
+    value = typed_val.value
+    size = ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(value)
+    # An intset's members are packed in its own buffer, already counted by getsizeof
+    # A sorted set's nodes are counted by its __sizeof__; only member strings are sampled
+    if typed_val.data_type in COLLECTION_TYPES and value and not isinstance(value, IntSet):
+        if typed_val.data_type == DataType.HASH:
+            sample = [sys.getsizeof(f) + sys.getsizeof(v) for f, v in islice(value.items(), SIZE_SAMPLES)]
+        else:
+            sample = [sys.getsizeof(item) for item in islice(value, SIZE_SAMPLES)]
+        size += sum(sample) * len(value) // len(sample)
+    return size
+
+
+def lfu_decay(typed_val: TypedValue, now: float) -> int:
+    """The key's LFU counter after decaying it for the time since its last access"""
+    periods = int((now - typed_val.last_access) // LFU_DECAY_TIME)
+    return max(typed_val.freq - periods, 0)
+
+
+def lfu_log_incr(counter: int) -> int:
+    """Probabilistically increment an LFU counter: the higher it is, the less likely"""
+    if counter >= LFU_MAX:
+        return LFU_MAX
+    base = max(counter - LFU_INIT_VAL, 0)
+    if random.random() < 1.0 / (base * LFU_LOG_FACTOR + 1):
+        return counter + 1
+    return counter
+
+
+def touch(typed_val: TypedValue, now: float, lfu: bool):
+    """Record an access to a key for the eviction policy"""
+    if lfu:
+        typed_val.freq = lfu_log_incr(lfu_decay(typed_val, now))
+    typed_val.last_access = now
+
+
+def eviction_score(policy: str, typed_val: TypedValue, now: float) -> float:
+    """Higher is a better eviction candidate"""
+    if policy.endswith("lru"):
+        return now - typed_val.last_access
+    if policy.endswith("lfu"):
+        return LFU_MAX - lfu_decay(typed_val, now)
+    # volatile-ttl: the sooner it expires the better
+    return -typed_val.expire_at
+
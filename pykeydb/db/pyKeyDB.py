@@ -1,19 +1,139 @@
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from collections import deque
+from collections.abc import Mapping
+from contextlib import contextmanager, nullcontext, ExitStack
+from itertools import islice
+import heapq
+import math
+import os
 import threading
 import random
+import weakref
+import time
 from logging import getLogger
 from pykeydb.db.writeAheadLog import WriteAheadLog
+from pykeydb.db.walCodec import BATCH_OPERATION
 from pykeydb.db.keyValueDBInterface import KeyValueDBInterface
-from pykeydb.db.dataTypes import TypedValue, DataType
+from pykeydb.db.dataTypes import NUMERIC_TYPES, TypedValue, DataType, format_number
+from pykeydb.db.encodings import (
+    INT64_MAX,
+    INT64_MIN,
+    HashView,
+    IndexedDict,
+    SmallHash,
+    RandomSet,
+    SetView,
+    SmallList,
+    as_int64,
+    encoding_of,
+    hash_for_write,
+    list_for_write,
+    new_hash,
+    new_list,
+    new_set,
+    set_for_write,
+)
+from pykeydb.db.setOps import difference, intersect, union
+from pykeydb.db.sortedSet import ScoreRange, SortedSet
+from pykeydb.db.scan import DEFAULT_SCAN_COUNT, compile_pattern, pack_cursor, unpack_cursor
+from pykeydb.db.snapshot import BackgroundSave, write_snapshot, read_snapshot, fork_snapshot
+from pykeydb.db.eviction import (
+    DEFAULT_MAXMEMORY_SAMPLES,
+    EVICTION_POLICIES,
+    EVICTION_POOL_SIZE,
+    NOEVICTION,
+    estimate_size,
+    eviction_score,
+    touch,
+)
 
 logger = getLogger(__name__)
 
+DEFAULT_NUM_SHARDS = 16
+# Upper bound on expiry index entries examined by one active expire cycle
+ACTIVE_EXPIRE_KEYS_PER_CYCLE = 200
+
+
+def now_ms() -> int:
+    """Current Unix time in milliseconds (the clock key expiry times are kept in)"""
+    return int(time.time() * 1000)
+
+
+class Shard:
+    """One hash partition of the keyspace, guarded by its own lock"""
+
+    __slots__ = ("data", "lock", "expiry_heap", "watched", "used_memory", "expired_keys", "evicted_keys")
+
+    def __init__(self):
+        # Lists its keys in a stable order, for SCAN and eviction sampling
+        self.data: Dict[str, TypedValue] = IndexedDict()
+        self.lock = threading.RLock()
+        # Min-heap of (expire_at, key) for keys with a TTL. Entries are not removed
+        # when a TTL changes; an entry is stale unless it matches the key's expire_at.
+        self.expiry_heap: list = []
+        # key -> [version, watchers] for keys some client WATCHes; other keys have no version
+        self.watched: Dict[str, list] = {}
+        # The shard's part of PyKeyDB's counters, updated under the lock (summed on read)
+        self.used_memory = 0
+        self.expired_keys = 0
+        self.evicted_keys = 0
+
+    def __enter__(self) -> Dict[str, TypedValue]:
+        self.lock.acquire()
+        return self.data
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+
+class _HiddenKey(Mapping):
+    """A shard's dict as a read-only mapping without one key"""
+
+    __slots__ = ("_data", "_key")
+
+    def __init__(self, data: Dict[str, TypedValue], key: str):
+        self._data = data
+        self._key = key
+
+    def __getitem__(self, key: str) -> TypedValue:
+        if key == self._key:
+            raise KeyError(key)
+        return self._data[key]
+
+    def __iter__(self):
+        return (key for key in self._data if key != self._key)
+
+    def __len__(self) -> int:
+        return len(self._data) - 1
+
+
+class _ExpiredOnReplica:
+    """
+    A shard as seen by a reader of one of its keys whose TTL passed on a replica:
+    the key reads as missing, but stays until the leader's DEL removes it
+    """
+
+    __slots__ = ("data", "lock", "expiry_heap", "watched")
+
+    def __init__(self, shard: Shard, key: str):
+        self.data = _HiddenKey(shard.data, key)
+        self.lock = shard.lock
+        self.expiry_heap = shard.expiry_heap
+        self.watched = shard.watched
+
+    def __enter__(self) -> Mapping:
+        self.lock.acquire()
+        return self.data
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
 
 class PyKeyDB(KeyValueDBInterface):
     _instances: Dict[str, "PyKeyDB"] = {}
     _lock = threading.RLock()
 
-    def __new__(cls, write_ahead_log: WriteAheadLog):
+    def __new__(cls, write_ahead_log: WriteAheadLog, *args, **kwargs):
         wal_path = write_ahead_log.path
         with cls._lock:
             if wal_path not in cls._instances:
@@ -22,48 +142,434 @@ class PyKeyDB(KeyValueDBInterface):
                 cls._instances[wal_path] = instance
             return cls._instances[wal_path]
 
-    def __init__(self, write_ahead_log: WriteAheadLog):
+    def __init__(
+        self,
+        write_ahead_log: WriteAheadLog,
+        snapshot_path: Optional[str] = None,
+        compact_threshold: Optional[int] = None,
+        replay_last_writer_wins: bool = False,
+        num_shards: int = DEFAULT_NUM_SHARDS,
+        maxmemory: int = 0,
+        maxmemory_policy: str = NOEVICTION,
+        maxmemory_samples: int = DEFAULT_MAXMEMORY_SAMPLES,
+    ):
         if self._initialized:
             return
 
         with type(self)._lock:
             if self._initialized:
                 return
-            self._db: Dict[str, TypedValue] = {}
-            self._db_lock = threading.RLock()
+            # The keyspace is hash-partitioned into shards with one lock each, so
+            # threads touching unrelated keys do not serialize on a single lock
+            self._shards = [Shard() for _ in range(num_shards)]
+            # Per-thread nesting depth of locked(), see _writing
+            self._local = threading.local()
             self.wal = write_ahead_log
-            for record in self.wal.replay():
+            # Snapshot of the keyspace written by save(); the WAL is rotated after each one
+            self.snapshot_path = snapshot_path or write_ahead_log.path + ".snapshot"
+            # Save automatically once the WAL grows past this many bytes (None = only on SAVE)
+            self.compact_threshold = compact_threshold
+            # BGSAVE child currently writing a snapshot, and the outcome of the last save
+            self._bgsave: Optional[BackgroundSave] = None
+            self.last_save_time: Optional[float] = None
+            self.last_bgsave_status = "ok"
+            # Where the next active expire cycle starts
+            self._expire_cursor = 0
+            # Memory limit (0 = unlimited). used_memory is the estimated dataset size,
+            # tracked only while a limit is set, as is per-key access metadata.
+            self.maxmemory = 0
+            self.maxmemory_policy = NOEVICTION
+            self.maxmemory_samples = DEFAULT_MAXMEMORY_SAMPLES
+            self._accounting = False
+            self._lfu = False
+            # Best eviction candidates seen so far, as (score, key, last_access) in ascending order
+            self._eviction_pool: list = []
+            self._eviction_lock = threading.Lock()
+            # Called with a list's key after every push to it; the server uses it
+            # to wake clients blocked on the list (see server/blocking.py)
+            self.on_list_push: Optional[Callable[[str], None]] = None
+            # Fields of INFO's replication section; the server sets it (see server/replication.py)
+            self.replication_info: Optional[Callable[[], Dict[str, Any]]] = None
+            # Set while this is a replica (see server/replication.py): apply_replicated is
+            # then the only writer, and keys whose TTL passed read as missing but are
+            # only removed by the DEL the leader logs for them
+            self.replica = False
+
+            checkpoint = self._load_snapshot()
+            # Records are streamed from disk; see WriteAheadLog.replay for last_writer_wins
+            replay = self.wal.replay(since=checkpoint, last_writer_wins=replay_last_writer_wins)
+            for record in replay:
                 if record:
                     try:
-                        op = record["operation"]
-                        key = record["key"]
-
-                        if op == "SET":
-                            value = record["value"]
-                            # Check if value is a dict with type info (new format)
-                            if isinstance(value, dict) and "type" in value:
-                                self._db[key] = TypedValue.from_dict(value)
-                            else:
-                                # Legacy format - treat as string
-                                self._db[key] = TypedValue(value, DataType.STRING)
-
-                        elif op == "DEL":
-                            if key in self._db:
-                                del self._db[key]
-
-                        elif op in ["LPUSH", "RPUSH", "LPOP", "RPOP", "HSET", "HDEL", "SADD", "SREMOVE", "SPOP"]:
-                            # List, hash, and set operations store full state
-                            value = record["value"]
-                            if isinstance(value, dict) and "type" in value:
-                                self._db[key] = TypedValue.from_dict(value)
-
+                        self._replay_record(record)
                     except Exception as e:
                         logger.warning(f"Failed to replay WAL entry: {e}")
 
             logger.info("WAL entries replayed and updated in PyKeyDB...")
+            self.configure_memory(maxmemory, maxmemory_policy, maxmemory_samples)
             logger.info("PyKeyDB Store Initialized...")
             self._initialized = True
 
+    # Counters are kept per shard, so writers on different shards never update
+    # the same one; a sum read while they run is at worst slightly stale
+    @property
+    def used_memory(self) -> int:
+        """Estimated dataset size in bytes (only tracked while maxmemory is set)"""
+        return sum(shard.used_memory for shard in self._shards)
+
+    @property
+    def expired_keys(self) -> int:
+        """Keys removed because their TTL passed"""
+        return sum(shard.expired_keys for shard in self._shards)
+
+    @property
+    def evicted_keys(self) -> int:
+        """Keys removed to stay under maxmemory"""
+        return sum(shard.evicted_keys for shard in self._shards)
+
+    def _load_snapshot(self):
+        """Load the snapshot file, returning the WAL checkpoint it covers (None if absent)"""
+        snapshot = read_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return None
+        checkpoint, records = snapshot
+        for record in records:
+            self._replay_record(record)
+        logger.info(f"Loaded {self.dbsize()} keys from snapshot {self.snapshot_path}")
+        return checkpoint
+
+    def save(self) -> int:
+        """
+        Write a snapshot of the whole store and rotate the WAL, so the next start
+        loads the snapshot plus only the records logged after it. Blocks writers
+        while the snapshot is written. Returns the number of keys saved.
+        """
+        with self._all_locked():
+            if self._bgsave is not None:
+                raise RuntimeError("Background save already in progress")
+            epoch, offset = self.wal.checkpoint()
+            count = write_snapshot(
+                self.snapshot_path, self._items(), epoch, offset, self.wal.wal_format
+            )
+            self.wal.rotate(offset)
+            self.last_save_time = time.time()
+            logger.info(f"Saved {count} keys to snapshot {self.snapshot_path}")
+            return count
+
+    def bgsave(self):
+        """
+        Fork a child that writes the snapshot from a copy-on-write view of memory.
+        The DB lock is held only for the fork itself; poll_background_save() swaps
+        the finished snapshot in and rotates the WAL.
+        """
+        if not hasattr(os, "fork"):
+            raise RuntimeError("BGSAVE is not supported on this platform")
+        with self._all_locked():
+            if self._bgsave is not None:
+                raise RuntimeError("Background save already in progress")
+            epoch, offset = self.wal.checkpoint()
+            self._bgsave = fork_snapshot(
+                self.snapshot_path + ".bgsave",
+                self._items(),
+                self.dbsize(),
+                epoch,
+                offset,
+                self.wal.wal_format,
+            )
+            logger.info(f"Background save started by pid {self._bgsave.pid}")
+
+    def poll_background_save(self) -> Optional[bool]:
+        """
+        Check on a running BGSAVE without blocking. When the child has finished, the
+        new snapshot is atomically renamed into place and the WAL is rotated to hold
+        only records written since the fork. Returns None while nothing finished,
+        otherwise whether the save succeeded.
+        """
+        bgsave = self._bgsave
+        if bgsave is None:
+            return None
+        with self._all_locked():
+            if self._bgsave is not bgsave:
+                return None
+            succeeded = bgsave.poll()
+            if succeeded is None:
+                return None
+            self._bgsave = None
+
+            if succeeded and self.wal.epoch == bgsave.epoch:
+                os.replace(bgsave.path, self.snapshot_path)
+                self.wal.rotate(bgsave.offset)
+                self.last_save_time = time.time()
+                self.last_bgsave_status = "ok"
+                logger.info(f"Background save finished ({bgsave.keys_written} keys)")
+                return True
+
+            self.last_bgsave_status = "err"
+            logger.error(f"Background save by pid {bgsave.pid} failed")
+            if os.path.exists(bgsave.path):
+                os.remove(bgsave.path)
+            return False
+
+    def info(self) -> Dict[str, Dict[str, Any]]:
+        """Server statistics, grouped by section"""
+        self.poll_background_save()
+        bgsave = self._bgsave
+        persistence = {
+            "bgsave_in_progress": int(bgsave is not None),
+            "bgsave_keys_written": bgsave.read_progress() if bgsave else 0,
+            "bgsave_keys_total": bgsave.total_keys if bgsave else 0,
+            "bgsave_elapsed_sec": round(time.time() - bgsave.started_at, 3) if bgsave else 0,
+            "last_bgsave_status": self.last_bgsave_status,
+            "last_save_time": int(self.last_save_time) if self.last_save_time else -1,
+            "snapshot_path": self.snapshot_path,
+            "wal_format": self.wal.wal_format,
+            "wal_fsync_policy": self.wal.fsync_policy,
+            "wal_epoch": self.wal.epoch,
+            "wal_size": self.wal.size,
+        }
+        keyspace = {"keys": self.dbsize(), "shards": len(self._shards)}
+        memory = {
+            "used_memory": self.used_memory if self._accounting else -1,
+            "maxmemory": self.maxmemory,
+            "maxmemory_policy": self.maxmemory_policy,
+            "maxmemory_samples": self.maxmemory_samples,
+        }
+        stats = {"expired_keys": self.expired_keys, "evicted_keys": self.evicted_keys}
+        replication = self.replication_info() if self.replication_info else {"role": "master"}
+        return {
+            "memory": memory,
+            "persistence": persistence,
+            "stats": stats,
+            "replication": replication,
+            "keyspace": keyspace,
+        }
+
+    def replication_snapshot(self, path: str, start: Callable[[], int]) -> Optional[BackgroundSave]:
+        """
+        Write a snapshot for a replica's full sync. start() runs while every shard
+        is locked and returns the replication offset the snapshot covers: records
+        logged before it are in the snapshot, records logged after it are not.
+        Where fork is available a child writes the file and the BackgroundSave to
+        poll is returned; otherwise it is written before returning None.
+        """
+        with self._all_locked():
+            offset = start()
+            if hasattr(os, "fork"):
+                return fork_snapshot(path, self._items(), self.dbsize(), 0, offset, self.wal.wal_format)
+            write_snapshot(path, self._items(), 0, offset, self.wal.wal_format)
+            return None
+
+    def replace_dataset(self, records: Iterable[Dict]) -> int:
+        """
+        Drop every key and load the SET records of a leader's snapshot instead (a
+        replica's full sync), then save, so a restart does not bring back the old
+        dataset. A BGSAVE still writing the old dataset is cancelled first. Watched
+        keys all count as changed. Returns the number of keys.
+        """
+        with self._all_locked():
+            if self._bgsave is not None:
+                logger.warning(f"Cancelling background save by pid {self._bgsave.pid}: dataset replaced")
+                self._bgsave.cancel()
+                self._bgsave = None
+            for shard in self._shards:
+                shard.data.clear()
+                shard.expiry_heap.clear()
+                for entry in shard.watched.values():
+                    entry[0] += 1
+            for record in records:
+                self._replay_record(record)
+            if self._accounting:
+                self._measure_dataset()
+            return self.save()
+
+    def apply_replicated(self, record: Dict):
+        """
+        Apply a record streamed from a leader through the replay path, under the
+        locks of every key it touches (a BATCH applies as a whole). It is logged
+        to this WAL as is, so the replica restarts with the data and replicas of
+        the replica receive it too.
+        """
+        op = record["operation"]
+        batched = record["records"] if op == BATCH_OPERATION else (record,)
+        keys = list(dict.fromkeys(item["key"] for item in batched))
+        with self.locked(*keys, write=True):
+            before = {key: self._raw_shard(key).data.get(key) for key in keys} if self._accounting else None
+            for key in keys:
+                entry = self._raw_shard(key).watched.get(key)
+                if entry is not None:
+                    entry[0] += 1
+            fields = {field: value for field, value in record.items() if field not in ("operation", "key")}
+            self.wal.log_operation(op, record["key"], **fields)
+            self._replay_record(record)
+            if before is not None:
+                for key in keys:
+                    self._account(key, before[key], self._raw_shard(key).data.get(key))
+
+    def _maybe_compact(self):
+        # Finish a background save that was started earlier, if it is done
+        self.poll_background_save()
+        if self.wal.size < self.compact_threshold or self._bgsave is not None:
+            return
+        with self._all_locked():
+            # Another writer may have compacted while we waited for the lock
+            if self.wal.size >= self.compact_threshold and self._bgsave is None:
+                if hasattr(os, "fork"):
+                    self.bgsave()
+                else:
+                    self.save()
+
+    def _replay_record(self, record: Dict):
+        """Re-apply a single WAL record to the in-memory store (no logging)"""
+        op = record["operation"]
+        key = record["key"]
+        value = record.get("value")
+        db = self._raw_shard(key).data
+
+        # Full-state records: typed SET values and collection writes from older WALs
+        if isinstance(value, dict) and "type" in value:
+            typed_val = TypedValue.from_dict(value)
+            db[key] = typed_val
+            if typed_val.expire_at is not None:
+                self._index_expiry(key, typed_val.expire_at)
+            return
+
+        if op == BATCH_OPERATION:
+            # One frame: either every record of the batch made it to disk or none did
+            for batched in record["records"]:
+                try:
+                    self._replay_record(batched)
+                except Exception as e:
+                    logger.warning(f"Failed to replay batched WAL entry: {e}")
+            return
+
+        if op == "SET":
+            # Legacy format - treat as string
+            db[key] = TypedValue(value, DataType.STRING)
+
+        elif op == "DEL":
+            db.pop(key, None)
+
+        # Keys that expired were logged as DEL, so a past expiry time here is harmless
+        elif op == "PEXPIREAT" or op == "PERSIST":
+            typed_val = db.get(key)
+            if typed_val is not None:
+                typed_val.expire_at = record.get("at")
+                if typed_val.expire_at is not None:
+                    self._index_expiry(key, typed_val.expire_at)
+            return
+
+        # Counters: the result is recomputed from the logged increment
+        elif op == "INCRBY" or op == "INCRBYFLOAT":
+            typed_val = db.get(key)
+            if op == "INCRBY":
+                current = 0 if typed_val is None else self._integer_value(typed_val)
+                data_type = DataType.INT
+            else:
+                current = 0.0 if typed_val is None else self._float_value(typed_val)
+                data_type = DataType.FLOAT
+            if typed_val is None:
+                db[key] = TypedValue(current + record["delta"], data_type)
+            else:
+                typed_val.value = current + record["delta"]
+                typed_val.data_type = data_type
+            return
+
+        # Delta records: re-apply the operation with its logged arguments
+        # Collections are created empty in their compact encoding and converted
+        # by *_for_write exactly as on the live path
+        elif op == "LPUSH":
+            typed_val = self._replay_container(key, DataType.LIST, SmallList)
+            typed_val.value = list_for_write(typed_val.value, record["values"])
+            typed_val.value.extendleft(reversed(record["values"]))
+
+        elif op == "RPUSH":
+            typed_val = self._replay_container(key, DataType.LIST, SmallList)
+            typed_val.value = list_for_write(typed_val.value, record["values"])
+            typed_val.value.extend(record["values"])
+
+        elif op == "LPOP":
+            typed_val = self._replay_container(key, DataType.LIST, SmallList)
+            if typed_val.value:
+                typed_val.value.popleft()
+
+        elif op == "RPOP":
+            typed_val = self._replay_container(key, DataType.LIST, SmallList)
+            if typed_val.value:
+                typed_val.value.pop()
+
+        elif op == "LSET":
+            typed_val = self._replay_container(key, DataType.LIST, SmallList)
+            typed_val.value = list_for_write(typed_val.value, (record["element"],))
+            typed_val.value[record["index"]] = record["element"]
+
+        elif op == "LTRIM":
+            typed_val = self._replay_container(key, DataType.LIST, SmallList)
+            self._trim_list(typed_val.value, record["start"], record["stop"])
+
+        elif op == "LINSERT":
+            typed_val = self._replay_container(key, DataType.LIST, SmallList)
+            typed_val.value = list_for_write(typed_val.value, (record["element"],))
+            typed_val.value.insert(record["index"], record["element"])
+
+        elif op == "HSET":
+            typed_val = self._replay_container(key, DataType.HASH, SmallHash)
+            typed_val.value = hash_for_write(typed_val.value, record["fields"])
+            typed_val.value.update(record["fields"])
+
+        elif op == "HINCRBY":
+            typed_val = self._replay_container(key, DataType.HASH, SmallHash)
+            current = self._integer_field(typed_val.value.get(record["field"], "0"))
+            typed_val.value = hash_for_write(typed_val.value, {record["field"]: ""})
+            typed_val.value[record["field"]] = str(current + record["delta"])
+
+        elif op == "HDEL":
+            typed_val = self._replay_container(key, DataType.HASH, SmallHash)
+            for field in record["fields"]:
+                typed_val.value.pop(field, None)
+
+        elif op == "SADD":
+            typed_val = self._replay_container(key, DataType.SET, lambda: new_set(()))
+            typed_val.value = set_for_write(typed_val.value, record["members"])
+            typed_val.value.update(record["members"])
+
+        elif op == "SREM":
+            typed_val = self._replay_container(key, DataType.SET, lambda: new_set(()))
+            typed_val.value.difference_update(record["members"])
+
+        elif op == "SPOP":
+            typed_val = self._replay_container(key, DataType.SET, lambda: new_set(()))
+            typed_val.value.discard(record["member"])
+
+        elif op == "ZADD":
+            typed_val = self._replay_container(key, DataType.ZSET, SortedSet)
+            for member, score in record["members"].items():
+                typed_val.value.add(member, float(score))
+
+        elif op == "ZREM":
+            typed_val = self._replay_container(key, DataType.ZSET, SortedSet)
+            for member in record["members"]:
+                typed_val.value.discard(member)
+
+        else:
+            raise ValueError(f"unknown WAL operation {op}")
+
+        # Collections emptied by a delta are removed, just like on the live path
+        if op != "SET" and op != "DEL" and not db[key].value:
+            del db[key]
+
+    def _replay_container(self, key: str, data_type: DataType, factory) -> TypedValue:
+        db = self._raw_shard(key).data
+        typed_val = db.get(key)
+        if typed_val is None:
+            typed_val = TypedValue(factory(), data_type)
+            db[key] = typed_val
+        elif typed_val.data_type != data_type:
+            raise TypeError(
+                f"WRONGTYPE -> key is {typed_val.data_type.value}, not {data_type.value}"
+            )
+        self._unshare(typed_val)
+        return typed_val
+
     @classmethod
     def dispose(cls, wal_path: Optional[str] = None):
         """Dispose PyKeyDB instance(s). If wal_path is None, dispose all instances."""
@@ -87,33 +593,595 @@ class PyKeyDB(KeyValueDBInterface):
                         pass
                 cls._instances.clear()
 
-    def set(self, key, value):
-        with self._db_lock:
+    def _raw_shard(self, key: str) -> Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _shard(self, key: str) -> Shard:
+        """The key's shard, after lazily removing the key if its TTL has passed (hiding it on a replica)"""
+        shard = self._shards[hash(key) % len(self._shards)]
+        typed_val = shard.data.get(key)
+        if typed_val is None:
+            return shard
+        if typed_val.expire_at is not None and typed_val.expire_at <= now_ms():
+            if self.replica:
+                return _ExpiredOnReplica(shard, key)
+            with self._wal_batch(), shard.lock:
+                # Re-check under the lock: another thread may have expired or replaced it
+                typed_val = shard.data.get(key)
+                if typed_val is not None and typed_val.expire_at is not None and typed_val.expire_at <= now_ms():
+                    self._delete_expired(shard, key)
+        elif self._accounting:
+            # Access metadata for LRU/LFU eviction; a lost update in a race is harmless
+            touch(typed_val, time.monotonic(), self._lfu)
+        return shard
+
+    def _wal_batch(self):
+        """Defer the WAL fsync wait of the records logged inside until the block (and its locks) exits"""
+        return self.wal.deferred_sync() if self.wal.use_fsync else nullcontext()
+
+    def _log(self, operation: str, key: str, value_dict: Optional[Dict] = None, **kwargs) -> int:
+        """
+        Log a mutation of key to the WAL; caller holds the key's shard lock. Every
+        mutation is logged exactly once, so this is also where a watched key's
+        version is bumped (an empty dict check for keys nobody watches).
+        """
+        watched = self._raw_shard(key).watched
+        if watched:
+            entry = watched.get(key)
+            if entry is not None:
+                entry[0] += 1
+        return self.wal.log_operation(operation, key, value_dict, **kwargs)
+
+    def _delete_expired(self, shard: Shard, key: str):
+        # Logged as a DEL so replay never brings the key back; caller holds the shard lock
+        self._log("DEL", key)
+        typed_val = shard.data.pop(key)
+        if self._accounting:
+            shard.used_memory -= typed_val.size
+        shard.expired_keys += 1
+
+    def _index_expiry(self, key: str, expire_at: int):
+        """Add a key to its shard's expiry heap; caller holds the shard lock"""
+        shard = self._raw_shard(key)
+        heap = shard.expiry_heap
+        heapq.heappush(heap, (expire_at, key))
+        # TTL updates leave stale entries behind; rebuild once they dominate the heap
+        if len(heap) > 2 * len(shard.data) + 1024:
+            self._rebuild_expiry_heap(shard)
+
+    @staticmethod
+    def _rebuild_expiry_heap(shard: Shard):
+        """Drop stale entries from a shard's expiry heap; caller holds the shard lock"""
+        heap = shard.expiry_heap
+        heap[:] = [
+            (typed_val.expire_at, key)
+            for key, typed_val in shard.data.items()
+            if typed_val.expire_at is not None
+        ]
+        heapq.heapify(heap)
+
+    def _account(self, key: str, before: Optional[TypedValue], after: Optional[TypedValue]):
+        """Update used_memory after a write changed a key from before to after; caller holds its shard lock"""
+        shard = self._raw_shard(key)
+        if before is not None:
+            shard.used_memory -= before.size
+        if after is not None:
+            after.size = estimate_size(key, after)
+            shard.used_memory += after.size
+            if after is not before:
+                touch(after, time.monotonic(), self._lfu)
+
+    def configure_memory(
+        self,
+        maxmemory: Optional[int] = None,
+        policy: Optional[str] = None,
+        samples: Optional[int] = None,
+    ):
+        """
+        Change the memory limit (bytes, 0 = unlimited), the eviction policy or the
+        eviction sample size. Enabling a limit measures the whole dataset once;
+        after that used_memory is updated incrementally by every write.
+        """
+        if policy is not None and policy not in EVICTION_POLICIES:
+            raise ValueError(f"unknown maxmemory-policy {policy}")
+        if maxmemory is not None and maxmemory < 0:
+            raise ValueError("maxmemory must not be negative")
+        if samples is not None and samples <= 0:
+            raise ValueError("maxmemory-samples must be positive")
+
+        with self._all_locked():
+            if policy is not None and policy != self.maxmemory_policy:
+                self.maxmemory_policy = policy
+                self._eviction_pool.clear()
+            self._lfu = self.maxmemory_policy.endswith("lfu")
+            if samples is not None:
+                self.maxmemory_samples = samples
+            if maxmemory is None:
+                return
+            self.maxmemory = maxmemory
+            if maxmemory and not self._accounting:
+                self._measure_dataset()
+                self._accounting = True
+            elif not maxmemory:
+                self._accounting = False
+
+    def _measure_dataset(self):
+        """Estimate every key's size from scratch; caller holds _all_locked()"""
+        now = time.monotonic()
+        for shard in self._shards:
+            shard.used_memory = 0
+            for key, typed_val in shard.data.items():
+                typed_val.size = estimate_size(key, typed_val)
+                typed_val.last_access = now
+                shard.used_memory += typed_val.size
+
+    def free_memory_if_needed(self) -> bool:
+        """
+        Evict keys until used_memory is back under maxmemory. Returns False if
+        that is impossible (noeviction policy, or nothing left the policy may
+        evict), in which case commands that grow the dataset must be refused.
+        """
+        if not self.maxmemory or self.used_memory <= self.maxmemory:
+            return True
+        if self.maxmemory_policy == NOEVICTION:
+            return False
+        # Eviction locks arbitrary shards, which is only deadlock-free while
+        # holding none (EXEC checks before taking its locks)
+        if getattr(self._local, "depth", 0):
+            return True
+        with self._eviction_lock:
+            while self.used_memory > self.maxmemory:
+                if not self._evict_one():
+                    return False
+        return True
+
+    def _sample_key(self, shard: Shard, volatile: bool) -> Optional[str]:
+        """A random key of the shard (only keys with a TTL if volatile); caller holds its lock"""
+        if not volatile:
+            return shard.data.random_key()
+        # The expiry heap doubles as an index of volatile keys. Deleted and evicted
+        # keys leave stale entries in it; if they keep turning up, purge them.
+        heap = shard.expiry_heap
+        for attempt in range(6):
+            if not heap:
+                return None
+            if attempt == 3:
+                self._rebuild_expiry_heap(shard)
+                continue
+            expire_at, key = random.choice(heap)
+            typed_val = shard.data.get(key)
+            if typed_val is not None and typed_val.expire_at == expire_at:
+                return key
+        return None
+
+    def _evict_one(self) -> bool:
+        """Evict the best candidate according to the policy; False if none was found"""
+        policy = self.maxmemory_policy
+        volatile = policy.startswith("volatile")
+        now = time.monotonic()
+
+        if policy.endswith("random"):
+            for _ in range(len(self._shards)):
+                shard = random.choice(self._shards)
+                with shard.lock:
+                    key = self._sample_key(shard, volatile)
+                if key is not None and self._evict_key(key, volatile):
+                    return True
+            return False
+
+        # Approximate LRU/LFU/TTL: sample a few keys and merge them into a pool of
+        # the best candidates seen so far, then evict the best one that still exists
+        pool = self._eviction_pool
+        for _ in range(self.maxmemory_samples):
+            shard = random.choice(self._shards)
+            with shard.lock:
+                key = self._sample_key(shard, volatile)
+                if key is None:
+                    continue
+                typed_val = shard.data[key]
+                score = eviction_score(policy, typed_val, now)
+            if any(pooled_key == key for _, pooled_key, _ in pool):
+                continue
+            if len(pool) < EVICTION_POOL_SIZE or score > pool[0][0]:
+                pool.append((score, key, typed_val.last_access))
+                pool.sort()
+                del pool[:-EVICTION_POOL_SIZE]
+
+        while pool:
+            _, key, last_access = pool.pop()
+            if self._evict_key(key, volatile, last_access):
+                return True
+        return False
+
+    def _evict_key(self, key: str, volatile: bool = False, last_access: Optional[float] = None) -> bool:
+        """Delete a key chosen for eviction, unless it is gone or was accessed since it was sampled"""
+        shard = self._raw_shard(key)
+        with self._wal_batch(), shard.lock:
+            typed_val = shard.data.get(key)
+            if typed_val is None or (volatile and typed_val.expire_at is None):
+                return False
+            if last_access is not None and typed_val.last_access != last_access:
+                return False
+            self._log("DEL", key)
+            del shard.data[key]
+            shard.used_memory -= typed_val.size
+            shard.evicted_keys += 1
+            return True
+
+    def active_expire_cycle(self, max_keys: int = ACTIVE_EXPIRE_KEYS_PER_CYCLE) -> int:
+        """
+        Remove keys whose TTL has passed without waiting for them to be accessed.
+        Pops due entries from the shards' expiry heaps, examining at most max_keys
+        entries, and resumes at the next shard on the following call so a busy
+        shard cannot starve the others. Returns the number of keys expired (none
+        on a replica, which waits for the leader's DELs).
+        """
+        if self.replica:
+            return 0
+        now = now_ms()
+        num_shards = len(self._shards)
+        budget = max_keys
+        expired = 0
+        visited = 0
+        while visited < num_shards and budget > 0:
+            shard = self._shards[(self._expire_cursor + visited) % num_shards]
+            visited += 1
+            heap = shard.expiry_heap
+            if not heap or heap[0][0] > now:
+                continue
+            with self._wal_batch(), shard.lock:
+                while heap and heap[0][0] <= now and budget > 0:
+                    expire_at, key = heapq.heappop(heap)
+                    budget -= 1
+                    typed_val = shard.data.get(key)
+                    if typed_val is not None and typed_val.expire_at == expire_at:
+                        self._delete_expired(shard, key)
+                        expired += 1
+        self._expire_cursor = (self._expire_cursor + visited) % num_shards
+        return expired
+
+    @contextmanager
+    def locked(self, *keys: str, write: bool = False, every_shard: bool = False):
+        """
+        Hold the locks of every shard the keys map to, for operations spanning
+        several keys. Locks are always taken in ascending shard order, so two
+        multi-key operations can never deadlock each other. With every_shard=True
+        all shard locks are held, for callers that go on to work on the whole
+        keyspace (which would otherwise take lower shards after higher ones).
+        With write=True the WAL fsync wait for everything logged inside is done
+        once, after the locks are released.
+        """
+        if every_shard:
+            indexes = range(len(self._shards))
+        else:
+            indexes = sorted({hash(key) % len(self._shards) for key in keys})
+        local = self._local
+        local.depth = getattr(local, "depth", 0) + 1
+        try:
+            with ExitStack() as stack:
+                if write and self.wal.use_fsync:
+                    stack.enter_context(self.wal.deferred_sync())
+                for index in indexes:
+                    stack.enter_context(self._shards[index].lock)
+                yield
+        finally:
+            local.depth -= 1
+        if self.compact_threshold and not local.depth:
+            self._maybe_compact()
+
+    def watch(self, key: str) -> int:
+        """
+        Start tracking key's version (for WATCH) and return it. Each watch must be
+        paired with an unwatch; the version is dropped once nobody watches the key.
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.watched.get(key)
+            if entry is None:
+                entry = shard.watched[key] = [0, 0]
+            entry[1] += 1
+            return entry[0]
+
+    def unwatch(self, key: str):
+        shard = self._raw_shard(key)
+        with shard.lock:
+            entry = shard.watched.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                if not entry[1]:
+                    del shard.watched[key]
+
+    def watched_version(self, key: str) -> Optional[int]:
+        """
+        The current version of a watched key (None if it is not watched). A TTL
+        that ran out since the watch started counts as a change: the key is
+        expired here first. Call under locked() to act on the answer atomically.
+        """
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.watched.get(key)
+            return None if entry is None else entry[0]
+
+    @contextmanager
+    def _all_locked(self):
+        """Hold every shard lock (in ascending order), freezing the whole keyspace"""
+        with ExitStack() as stack:
+            for shard in self._shards:
+                stack.enter_context(shard.lock)
+            yield
+
+    def _items(self):
+        """(key, TypedValue) pairs across all shards; caller holds _all_locked()"""
+        for shard in self._shards:
+            yield from shard.data.items()
+
+    def keys(self, pattern: Optional[str] = None) -> list:
+        """All live keys (matching a glob pattern, if given), taking each shard lock in turn"""
+        keys = []
+        now = now_ms()
+        match = compile_pattern(pattern)
+        for shard in self._shards:
+            with shard as db:
+                # Match on the key first: it rules out most entries without looking at the value
+                candidates = db.items() if match is None else ((k, v) for k, v in db.items() if match(k))
+                keys.extend(
+                    key
+                    for key, typed_val in candidates
+                    if typed_val.expire_at is None or typed_val.expire_at > now
+                )
+        return keys
+
+    def scan(
+        self,
+        cursor: int,
+        pattern: Optional[str] = None,
+        count: int = DEFAULT_SCAN_COUNT,
+        type_name: Optional[str] = None,
+    ) -> Tuple[int, list]:
+        """
+        One step of a keyspace iteration: (next cursor, keys), where cursor 0
+        starts and ends an iteration. Examines about count entries of the
+        shards' key lists per call, holding one shard lock at a time. The cursor
+        is a shard and a position in its key list (see IndexedDict), so no state
+        is kept between calls: every key that exists for the whole iteration is
+        returned, whatever other clients write meanwhile.
+        """
+        index, generation, position = unpack_cursor(cursor, len(self._shards))
+        match = compile_pattern(pattern)
+        now = now_ms()
+        found = []
+        examined = 0
+        while examined < count and index < len(self._shards):
+            with self._shards[index] as db:
+                # The key list was rebuilt since the cursor was handed out: restart the shard
+                if generation != db.generation:
+                    generation, position = db.generation, 0
+                keys, end = db.scan(position, count - examined)
+                examined += end - position
+                position = end
+                for key in keys:
+                    typed_val = db[key]
+                    if typed_val.expire_at is not None and typed_val.expire_at <= now:
+                        continue
+                    if match is not None and not match(key):
+                        continue
+                    if type_name is not None and self._type_name(typed_val) != type_name:
+                        continue
+                    found.append(key)
+                if position >= db.scan_end:
+                    index += 1
+                    position = 0
+        if index >= len(self._shards):
+            return 0, found
+        return pack_cursor(index, generation, position, len(self._shards)), found
+
+    def _scan_collection(self, key: str, cursor: int, data_type: DataType, count: int) -> Tuple[int, Any, list]:
+        """
+        One step over a hash's fields or a set's members: (next cursor, value,
+        elements), value being the live collection (None once it is gone). Small
+        encodings are returned whole in one step, as Redis does.
+        """
+        with self._shard(key) as db:
+            typed_val = db.get(key)
+            if typed_val is None:
+                return 0, None, []
+            if typed_val.data_type != data_type:
+                raise TypeError(
+                    f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not {data_type.value}"
+                )
+            value = typed_val.value
+            if type(value) is RandomSet:
+                members, end = value.scan(cursor, count)
+                return end, value, members
+            if type(value) is not IndexedDict:
+                return 0, value, list(value)
+            _, generation, position = unpack_cursor(cursor, 1)
+            if generation != value.generation:
+                position = 0
+            fields, end = value.scan(position, count)
+            if end >= value.scan_end:
+                return 0, value, fields
+            return pack_cursor(0, value.generation, end, 1), value, fields
+
+    def hscan(
+        self, key: str, cursor: int, pattern: Optional[str] = None, count: int = DEFAULT_SCAN_COUNT
+    ) -> Tuple[int, list]:
+        """One step over a hash: (next cursor, [field, value, field, value, ...])"""
+        match = compile_pattern(pattern)
+        with self._shard(key):
+            cursor, value, fields = self._scan_collection(key, cursor, DataType.HASH, count)
+            pairs = []
+            for field in fields:
+                if match is None or match(field):
+                    pairs.append(field)
+                    pairs.append(value[field])
+            return cursor, pairs
+
+    def sscan(
+        self, key: str, cursor: int, pattern: Optional[str] = None, count: int = DEFAULT_SCAN_COUNT
+    ) -> Tuple[int, list]:
+        """One step over a set: (next cursor, members)"""
+        match = compile_pattern(pattern)
+        cursor, _, members = self._scan_collection(key, cursor, DataType.SET, count)
+        return cursor, members if match is None else [member for member in members if match(member)]
+
+    def dbsize(self) -> int:
+        return sum(len(shard.data) for shard in self._shards)
+
+    @contextmanager
+    def _writing(self, key: str):
+        """
+        Hold the key's shard lock for a mutation and yield the shard's dict. With
+        the "always" fsync policy the wait for the WAL group commit happens after
+        the lock is released, so one writer's fsync does not serialize every other writer.
+        """
+        shard = self._shard(key)
+        with self._wal_batch(), shard.lock:
+            if not self._accounting:
+                yield shard.data
+            else:
+                before = shard.data.get(key)
+                try:
+                    yield shard.data
+                finally:
+                    self._account(key, before, shard.data.get(key))
+        # Compaction takes every shard lock, so it must wait until this thread holds none
+        if self.compact_threshold and not getattr(self._local, "depth", 0):
+            self._maybe_compact()
+
+    def set(self, key, value, expire_at: Optional[int] = None):
+        """Store a string, replacing any previous value and TTL (expire_at in Unix ms)"""
+        with self._writing(key) as db:
             try:
-                typed_val = TypedValue(value, DataType.STRING)
-                self.wal.log_operation("SET", key, typed_val.to_dict())
-                self._db[key] = typed_val
+                typed_val = TypedValue(value, DataType.STRING, expire_at)
+                self._log("SET", key, typed_val.to_dict())
+                db[key] = typed_val
+                if expire_at is not None:
+                    self._index_expiry(key, expire_at)
                 return True
             except Exception as e:
                 logger.error(f"SET operation failed. Error: {e}")
                 return False
 
     def get(self, key):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
             if typed_val is None:
                 return None
+            elif typed_val.data_type in NUMERIC_TYPES:
+                return format_number(typed_val.value)
             elif typed_val.data_type != DataType.STRING:
                 return "NULL"
 
             return typed_val.value
 
+    @staticmethod
+    def _integer_value(typed_val: TypedValue) -> int:
+        """The integer held by a string or counter key, for INCRBY"""
+        if typed_val.data_type == DataType.INT:
+            return typed_val.value
+        if typed_val.data_type == DataType.STRING:
+            number = as_int64(typed_val.value)
+        elif typed_val.data_type == DataType.FLOAT and typed_val.value.is_integer():
+            number = int(typed_val.value)
+        elif typed_val.data_type == DataType.FLOAT:
+            number = None
+        else:
+            raise TypeError(
+                f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not string"
+            )
+        if number is None or not INT64_MIN <= number <= INT64_MAX:
+            raise ValueError("value is not an integer or out of range")
+        return number
+
+    @staticmethod
+    def _float_value(typed_val: TypedValue) -> float:
+        """The number held by a string or counter key, for INCRBYFLOAT"""
+        if typed_val.data_type in NUMERIC_TYPES:
+            return float(typed_val.value)
+        if typed_val.data_type != DataType.STRING:
+            raise TypeError(
+                f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not string"
+            )
+        try:
+            number = float(typed_val.value)
+        except ValueError:
+            number = math.nan
+        if not math.isfinite(number):
+            raise ValueError("value is not a valid float")
+        return number
+
+    @staticmethod
+    def _integer_field(value: str) -> int:
+        """The integer held by a hash field, for HINCRBY"""
+        number = as_int64(value)
+        if number is None:
+            raise ValueError("hash value is not an integer")
+        return number
+
+    def incrby(self, key: str, increment: int) -> int:
+        """Add increment to the integer at key (a missing key counts as 0); returns the new value"""
+        with self._writing(key) as db:
+            typed_val = db.get(key)
+            result = (0 if typed_val is None else self._integer_value(typed_val)) + increment
+            if not INT64_MIN <= result <= INT64_MAX:
+                raise ValueError("increment or decrement would overflow")
+            # The increment, not the result, is logged: a few bytes whatever the value
+            self._log("INCRBY", key, delta=increment)
+            if typed_val is None:
+                db[key] = TypedValue(result, DataType.INT)
+            else:
+                # Stored natively from now on; the TTL is kept
+                typed_val.value = result
+                typed_val.data_type = DataType.INT
+            return result
+
+    def incrbyfloat(self, key: str, increment: float) -> str:
+        """Add increment to the number at key (a missing key counts as 0); returns the new value as a string"""
+        with self._writing(key) as db:
+            typed_val = db.get(key)
+            result = (0.0 if typed_val is None else self._float_value(typed_val)) + increment
+            if not math.isfinite(result):
+                raise ValueError("increment would produce NaN or Infinity")
+            self._log("INCRBYFLOAT", key, delta=increment)
+            if typed_val is None:
+                db[key] = TypedValue(result, DataType.FLOAT)
+            else:
+                typed_val.value = result
+                typed_val.data_type = DataType.FLOAT
+            return format_number(result)
+
+    def mget(self, *keys: str) -> list:
+        """Values of several keys (None where missing), read under one acquisition of their locks"""
+        with self.locked(*keys):
+            return [self.get(key) for key in keys]
+
+    def mset(self, mapping: Dict[str, Any]) -> bool:
+        """Set several strings atomically, logged as a single WAL record"""
+        with self.locked(*mapping, write=True), self.wal.atomic_batch():
+            for key, value in mapping.items():
+                if not self.set(key, value):
+                    return False
+            return True
+
+    def msetnx(self, mapping: Dict[str, Any]) -> bool:
+        """Like mset, but sets nothing (and returns False) if any of the keys exists"""
+        with self.locked(*mapping, write=True):
+            if any(self.type(key) is not None for key in mapping):
+                return False
+            return self.mset(mapping)
+
+    def delete_many(self, *keys: str) -> int:
+        """Delete several keys atomically, logged as a single WAL record; returns how many existed"""
+        with self.locked(*keys, write=True), self.wal.atomic_batch():
+            return sum(1 for key in keys if self.delete(key))
+
     def delete(self, key):
-        with self._db_lock:
-            if key in self._db:
+        with self._writing(key) as db:
+            if key in db:
                 try:
-                    self.wal.log_operation("DEL", key)
-                    del self._db[key]
+                    self._log("DEL", key)
+                    del db[key]
                     return True
                 except Exception as e:
                     logger.error(f"Delete failed for key {key}: {e}")
@@ -122,51 +1190,117 @@ class PyKeyDB(KeyValueDBInterface):
                 return False
 
     def type(self, key):
-        with self._db_lock:
-            typed_val = self._db.get(key, None)
+        with self._shard(key) as db:
+            typed_val = db.get(key, None)
             if typed_val:
-                return typed_val.data_type.value
+                return self._type_name(typed_val)
             return None
 
+    @staticmethod
+    def _type_name(typed_val: TypedValue) -> str:
+        # Counters are strings as far as clients are concerned
+        if typed_val.data_type in NUMERIC_TYPES:
+            return DataType.STRING.value
+        return typed_val.data_type.value
+
+    def object_encoding(self, key: str) -> Optional[str]:
+        """How a key's value is stored (listpack, intset, hashtable, quicklist, int or raw); None if missing"""
+        with self._shard(key) as db:
+            typed_val = db.get(key)
+            return encoding_of(typed_val.value) if typed_val is not None else None
+
+    def expire(self, key: str, seconds: int) -> bool:
+        return self.pexpireat(key, now_ms() + seconds * 1000)
+
+    def pexpire(self, key: str, milliseconds: int) -> bool:
+        return self.pexpireat(key, now_ms() + milliseconds)
+
+    def pexpireat(self, key: str, expire_at: int) -> bool:
+        """Set a key's absolute expiry time (Unix ms). False if the key does not exist."""
+        with self._writing(key) as db:
+            typed_val = db.get(key)
+            if typed_val is None:
+                return False
+            # A time in the past deletes the key right away, as Redis does
+            if expire_at <= now_ms():
+                self._log("DEL", key)
+                del db[key]
+                return True
+            # Logged as an absolute time so replay after a restart expires it at the same moment
+            self._log("PEXPIREAT", key, at=expire_at)
+            typed_val.expire_at = expire_at
+            self._index_expiry(key, expire_at)
+            return True
+
+    def persist(self, key: str) -> bool:
+        """Remove a key's TTL. False if the key does not exist or has none."""
+        with self._writing(key) as db:
+            typed_val = db.get(key)
+            if typed_val is None or typed_val.expire_at is None:
+                return False
+            self._log("PERSIST", key)
+            typed_val.expire_at = None
+            return True
+
+    def pttl(self, key: str) -> int:
+        """Milliseconds until the key expires; -2 if it does not exist, -1 if it has no TTL"""
+        with self._shard(key) as db:
+            typed_val = db.get(key)
+            if typed_val is None:
+                return -2
+            if typed_val.expire_at is None:
+                return -1
+            return max(typed_val.expire_at - now_ms(), 0)
+
+    def ttl(self, key: str) -> int:
+        """Seconds until the key expires (rounded); -2 if it does not exist, -1 if it has no TTL"""
+        remaining = self.pttl(key)
+        return remaining if remaining < 0 else (remaining + 500) // 1000
+
     def lpush(self, key: str, *values: str):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._writing(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
-                typed_val = TypedValue(list(values), DataType.LIST)
+                typed_val = TypedValue(new_list(values), DataType.LIST)
             elif typed_val.data_type != DataType.LIST:
                 raise TypeError(
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not list"
                 )
             else:
-                typed_val.value = list(values) + typed_val.value
-
-            self.wal.log_operation("LPUSH", key, typed_val.to_dict())
-            self._db[key] = typed_val
+                # Values end up in argument order at the head of the list
+                typed_val.value = list_for_write(typed_val.value, values)
+                typed_val.value.extendleft(reversed(values))
+
+            self._log("LPUSH", key, values=list(values))
+            db[key] = typed_val
+            if self.on_list_push is not None:
+                self.on_list_push(key)
             return len(typed_val.value)
 
     def rpush(self, key: str, *values):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._writing(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
-                typed_val = TypedValue(list(values), data_type=DataType.LIST)
+                typed_val = TypedValue(new_list(values), data_type=DataType.LIST)
             elif typed_val.data_type != DataType.LIST:
                 raise TypeError(
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not list"
                 )
             else:
-                typed_val.value = typed_val.value + list(values)
+                typed_val.value = list_for_write(typed_val.value, values)
+                typed_val.value.extend(values)
 
-            self.wal.log_operation(
-                operation="RPUSH", key=key, value_dict=typed_val.to_dict()
-            )
-            self._db[key] = typed_val
+            self._log("RPUSH", key, values=list(values))
+            db[key] = typed_val
+            if self.on_list_push is not None:
+                self.on_list_push(key)
             return len(typed_val.value)
 
     def lrange(self, key, start, stop):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             # If key doesn't exist, return empty list []
             if typed_val is None:
@@ -176,15 +1310,26 @@ class PyKeyDB(KeyValueDBInterface):
                 raise TypeError(
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not list"
                 )
-            # If -1, means give me the entire list from start to end
-            if stop == -1:
-                return typed_val.value[start:]
-            # Else, normal list slicing
-            return typed_val.value[start : stop + 1]
+            items = typed_val.value
+            length = len(items)
+            # Negative indexes count from the end, out of range indexes are clamped
+            if start < 0:
+                start = max(length + start, 0)
+            if stop < 0:
+                stop = length + stop
+            stop = min(stop, length - 1)
+            if start > stop:
+                return []
+            # Walk from whichever end of the deque is closer to the range
+            if start <= length - 1 - stop:
+                return list(islice(items, start, stop + 1))
+            tail = list(islice(reversed(items), length - 1 - stop, length - start))
+            tail.reverse()
+            return tail
 
     def lpop(self, key):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._writing(key) as db:
+            typed_val = db.get(key)
 
             # If key doesn't exist
             if typed_val is None:
@@ -198,19 +1343,19 @@ class PyKeyDB(KeyValueDBInterface):
             if not typed_val.value:
                 return None
 
-            # List operations take place in reference in Python, so no need to do _db[key] = typed_val.value again
-            element = typed_val.value.pop(0)
-            self.wal.log_operation("LPOP", key, value_dict=typed_val.to_dict())
+            # List operations take place in reference in Python, so no need to do db[key] = typed_val.value again
+            element = typed_val.value.popleft()
+            self._log("LPOP", key)
 
             # If we clear entire list, we can remove the key from db
             if not typed_val.value:
-                del self._db[key]
+                del db[key]
 
             return element
 
     def rpop(self, key):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._writing(key) as db:
+            typed_val = db.get(key)
 
             # If key doesn't exist
             if typed_val is None:
@@ -224,19 +1369,37 @@ class PyKeyDB(KeyValueDBInterface):
             if not typed_val.value:
                 return None
 
-            # List operations take place in reference in Python, so no need to do _db[key] = typed_val.value again
+            # List operations take place in reference in Python, so no need to do db[key] = typed_val.value again
             element = typed_val.value.pop()
-            self.wal.log_operation("RPOP", key, value_dict=typed_val.to_dict())
+            self._log("RPOP", key)
 
             # If we clear entire list, we can remove the key from db
             if not typed_val.value:
-                del self._db[key]
+                del db[key]
+
+            return element
 
+    def lmove(self, source: str, destination: str, wherefrom: str, whereto: str) -> Optional[str]:
+        """
+        Pop an element from one end of source ("LEFT" or "RIGHT") and push it
+        onto one end of destination, atomically and as a single WAL record.
+        Returns the element, or None if source is empty.
+        """
+        with self.locked(source, destination, write=True), self.wal.atomic_batch():
+            # A destination of the wrong type fails before anything is popped
+            with self._shard(destination) as db:
+                self._get_list(db, destination)
+            element = self.lpop(source) if wherefrom == "LEFT" else self.rpop(source)
+            if element is not None:
+                if whereto == "LEFT":
+                    self.lpush(destination, element)
+                else:
+                    self.rpush(destination, element)
             return element
 
     def llen(self, key):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             # If key doesn't exist, just return 0 elements are present
             if typed_val is None:
@@ -249,13 +1412,96 @@ class PyKeyDB(KeyValueDBInterface):
             # Return length of the list
             return len(typed_val.value)
 
+    @staticmethod
+    def _get_list(db, key):
+        typed_val = db.get(key)
+        if typed_val is not None and typed_val.data_type != DataType.LIST:
+            raise TypeError(
+                f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not list"
+            )
+        return typed_val
+
+    def lindex(self, key: str, index: int):
+        with self._shard(key) as db:
+            typed_val = self._get_list(db, key)
+            if typed_val is None:
+                return None
+            # deque indexing walks from the nearer end
+            try:
+                return typed_val.value[index]
+            except IndexError:
+                return None
+
+    def lset(self, key: str, index: int, element: str) -> bool:
+        with self._writing(key) as db:
+            typed_val = self._get_list(db, key)
+            if typed_val is None:
+                raise LookupError("no such key")
+            length = len(typed_val.value)
+            if index < 0:
+                index += length
+            if not 0 <= index < length:
+                raise IndexError("index out of range")
+
+            self._log("LSET", key, index=index, element=element)
+            typed_val.value = list_for_write(typed_val.value, (element,))
+            typed_val.value[index] = element
+            return True
+
+    def ltrim(self, key: str, start: int, stop: int) -> bool:
+        with self._writing(key) as db:
+            typed_val = self._get_list(db, key)
+            if typed_val is None:
+                return True
+
+            self._log("LTRIM", key, start=start, stop=stop)
+            self._trim_list(typed_val.value, start, stop)
+            # If we clear entire list, we can remove the key from db
+            if not typed_val.value:
+                del db[key]
+            return True
+
+    @staticmethod
+    def _trim_list(items: deque, start: int, stop: int):
+        """Keep only items[start..stop] (inclusive, negative indexes allowed), in O(removed)"""
+        length = len(items)
+        if start < 0:
+            start = max(length + start, 0)
+        if stop < 0:
+            stop = length + stop
+        if start > stop or start >= length:
+            items.clear()
+            return
+        for _ in range(length - 1 - stop):
+            items.pop()
+        for _ in range(start):
+            items.popleft()
+
+    def linsert(self, key: str, before: bool, pivot: str, element: str) -> int:
+        with self._writing(key) as db:
+            typed_val = self._get_list(db, key)
+            if typed_val is None:
+                return 0
+            try:
+                index = typed_val.value.index(pivot)
+            except ValueError:
+                return -1
+            if not before:
+                index += 1
+
+            # Log the resolved position, so replay does not search for the pivot again
+            self._log("LINSERT", key, index=index, element=element)
+            typed_val.value = list_for_write(typed_val.value, (element,))
+            typed_val.value.insert(index, element)
+            return len(typed_val.value)
+
     def hset(self, key: str, fields: dict) -> int:
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._writing(key) as db:
+            typed_val = db.get(key)
 
             # If key doesn't exist, create new hash
             if typed_val is None:
-                typed_val = TypedValue(fields.copy(), DataType.HASH)
+                typed_val = TypedValue(new_hash(fields), DataType.HASH)
                 fields_set = len(fields)
             # If value data type is not hash
             elif typed_val.data_type != DataType.HASH:
@@ -265,15 +1511,17 @@ class PyKeyDB(KeyValueDBInterface):
             else:
                 # Count only new fields being set
                 fields_set = sum(1 for f in fields if f not in typed_val.value)
+                self._unshare(typed_val)
+                typed_val.value = hash_for_write(typed_val.value, fields)
                 typed_val.value.update(fields)
 
-            self.wal.log_operation("HSET", key, typed_val.to_dict())
-            self._db[key] = typed_val
+            self._log("HSET", key, fields=fields)
+            db[key] = typed_val
             return fields_set
 
     def hget(self, key, field):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             # If key doesn't exist, return empty dict {}
             if typed_val is None:
@@ -284,13 +1532,11 @@ class PyKeyDB(KeyValueDBInterface):
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not hash"
                 )
             else:
-                if field not in typed_val.value:
-                    return None
-                return typed_val.value[field]
+                return typed_val.value.get(field)
 
     def hmget(self, key, *fields):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             values = []
             # If key doesn't exist, return None for each field
@@ -309,8 +1555,8 @@ class PyKeyDB(KeyValueDBInterface):
             return values
 
     def hgetall(self, key):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             # If key doesn't exist, return empty dict {}
             if typed_val is None:
@@ -321,11 +1567,63 @@ class PyKeyDB(KeyValueDBInterface):
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not hash"
                 )
             else:
-                return typed_val.value
+                value = typed_val.value
+                # Small hashes are stored as flat lists: copying one is cheap
+                if type(value) is SmallHash:
+                    return dict(value.items())
+                # A large one is handed out as a read-only view in O(1); writers
+                # copy it before their next change, so the view never changes under the caller
+                return self._view(typed_val, HashView)
+
+    @staticmethod
+    def _view(typed_val: TypedValue, view_type):
+        """A read-only view of a collection, shared by all readers until the next write; caller holds its lock"""
+        view = typed_val.shared() if typed_val.shared is not None else None
+        if view is None:
+            view = view_type(typed_val.value)
+            typed_val.shared = weakref.ref(view)
+        return view
+
+    @staticmethod
+    def _unshare(typed_val: TypedValue):
+        """
+        Before mutating a collection: copy it if a reader still holds a view of
+        it (see hgetall). Views are usually dropped as soon as the reply is
+        built, so a write after a read normally changes the collection in place.
+        """
+        if typed_val.shared is not None:
+            if typed_val.shared() is not None:
+                typed_val.value = typed_val.value.copy()
+            typed_val.shared = None
+
+    def hincrby(self, key: str, field: str, increment: int) -> int:
+        """Add increment to the integer in a hash field (a missing field counts as 0); returns the new value"""
+        with self._writing(key) as db:
+            typed_val = db.get(key)
+            if typed_val is None:
+                current = 0
+            elif typed_val.data_type != DataType.HASH:
+                raise TypeError(
+                    f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not hash"
+                )
+            else:
+                current = self._integer_field(typed_val.value.get(field, "0"))
+            result = current + increment
+            if not INT64_MIN <= result <= INT64_MAX:
+                raise ValueError("increment or decrement would overflow")
+            self._log("HINCRBY", key, field=field, delta=increment)
+            # Hash values stay strings: HGET and HGETALL hand them out as they are
+            if typed_val is None:
+                db[key] = TypedValue(new_hash({field: str(result)}), DataType.HASH)
+            else:
+                self._unshare(typed_val)
+                typed_val.value = hash_for_write(typed_val.value, {field: ""})
+                typed_val.value[field] = str(result)
+            return result
 
     def hdel(self, key: str, *fields: str) -> int:
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._writing(key) as db:
+            typed_val = db.get(key)
 
             # If key doesn't exist, return 0
             if typed_val is None:
@@ -336,28 +1634,25 @@ class PyKeyDB(KeyValueDBInterface):
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not hash"
                 )
 
-            # Delete fields and count deletions
-            del_count = 0
-            for field in fields:
-                if field in typed_val.value:
-                    del typed_val.value[field]
-                    del_count += 1
+            # Delete fields and remember which ones actually existed
+            deleted = [field for field in dict.fromkeys(fields) if field in typed_val.value]
+            if deleted:
+                self._unshare(typed_val)
+            for field in deleted:
+                del typed_val.value[field]
 
-            # Log final state if any fields were deleted
-            if del_count > 0:
+            # Log only the removed fields if any were deleted
+            if deleted:
+                self._log("HDEL", key, fields=deleted)
                 # If hash is now empty, we can delete the key
                 if not typed_val.value:
-                    self.wal.log_operation("DEL", key)
-                    del self._db[key]
-                else:
-                    # Log updated hash state
-                    self.wal.log_operation("HDEL", key, typed_val.to_dict())
+                    del db[key]
 
-            return del_count
+            return len(deleted)
 
     def hlen(self, key: str) -> int:
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             # If key doesn't exist, return 0
             if typed_val is None:
@@ -371,8 +1666,8 @@ class PyKeyDB(KeyValueDBInterface):
             return len(typed_val.value)
 
     def hexists(self, key: str, field: str) -> bool:
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
                 return False
@@ -385,30 +1680,33 @@ class PyKeyDB(KeyValueDBInterface):
             return field in typed_val.value
 
     def sadd(self, key: str, *values: str) -> int:
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._writing(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
-                typed_val = TypedValue(value=set(values), data_type=DataType.SET)
-                elements_added = len(values)
+                typed_val = TypedValue(value=new_set(values), data_type=DataType.SET)
+                elements_added = len(typed_val.value)
             elif typed_val.data_type != DataType.SET:
                 raise TypeError(
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not set"
                 )
             else:
                 elements_added = sum(
-                    1 for value in values if value not in typed_val.value
+                    1 for value in set(values) if value not in typed_val.value
                 )
+                if elements_added:
+                    self._unshare(typed_val)
+                typed_val.value = set_for_write(typed_val.value, values)
                 for value in values:
                     typed_val.value.add(value)  # Fixed: set.add() returns None
 
-            self.wal.log_operation("SADD", key, typed_val.to_dict())
-            self._db[key] = typed_val
+            self._log("SADD", key, members=list(values))
+            db[key] = typed_val
             return elements_added
 
     def sismember(self, key, value) -> bool:
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
                 return False
@@ -420,8 +1718,8 @@ class PyKeyDB(KeyValueDBInterface):
                 return value in typed_val.value
 
     def smismember(self, key, *values):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
                 response = []
@@ -440,8 +1738,8 @@ class PyKeyDB(KeyValueDBInterface):
                 return response
 
     def smembers(self, key: str):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
                 return set()
@@ -450,11 +1748,15 @@ class PyKeyDB(KeyValueDBInterface):
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not set"
                 )
             else:
-                return typed_val.value
+                value = typed_val.value
+                if type(value) is not RandomSet:
+                    return set(value)
+                # Copy-on-write view, as in hgetall
+                return self._view(typed_val, SetView)
 
     def scard(self, key: str) -> int:
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
                 return 0
@@ -466,8 +1768,8 @@ class PyKeyDB(KeyValueDBInterface):
             return len(typed_val.value)
 
     def srandmember(self, key: str, count: Optional[int] = None):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._shard(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
                 if count is not None:
@@ -478,24 +1780,26 @@ class PyKeyDB(KeyValueDBInterface):
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not set"
                 )
 
-            if not typed_val.value:
+            value = typed_val.value
+            if not value:
                 return None if count is None else []
 
+            # Every set encoding picks random members by index, without copying the set
             if count is None:
-                return random.choice(list(typed_val.value))
-
-            count_abs = abs(count)
-            if count >= 0:
-                return random.sample(list(typed_val.value), min(count_abs, len(typed_val.value)))
-            else:
-                return random.choices(list(typed_val.value), k=count_abs)
-
-    def spop(self, key: str):
-        with self._db_lock:
-            typed_val = self._db.get(key)
+                return value.random_member()
+            if count < 0:
+                return value.choices(-count)
+            if count >= len(value):
+                return list(value)
+            return value.sample(count)
+
+    def spop(self, key: str, count: Optional[int] = None):
+        """Remove and return a random member, or up to count distinct random members as a list"""
+        with self._writing(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
-                return None
+                return None if count is None else []
 
             elif typed_val.data_type != DataType.SET:
                 raise TypeError(
@@ -503,25 +1807,35 @@ class PyKeyDB(KeyValueDBInterface):
                 )
 
             if not typed_val.value:
-                return None
+                return None if count is None else []
 
-            element = random.choice(list(typed_val.value))
-            typed_val.value.remove(element)
+            if count is None:
+                element = typed_val.value.random_member()
+                self._unshare(typed_val)
+                typed_val.value.remove(element)
+                # Log the chosen member, so replay removes the same one
+                self._log("SPOP", key, member=element)
+            else:
+                if count >= len(typed_val.value):
+                    popped = list(typed_val.value)
+                    typed_val.value = new_set(())
+                else:
+                    self._unshare(typed_val)
+                    popped = typed_val.value.sample(count)
+                    typed_val.value.difference_update(popped)
+                # Several members are logged as one SREM of exactly those members
+                if popped:
+                    self._log("SREM", key, members=popped)
 
-            # Log final state
             if not typed_val.value:
                 # Set is now empty, delete the key
-                self.wal.log_operation("DEL", key)
-                del self._db[key]
-            else:
-                # Log updated set state
-                self.wal.log_operation("SPOP", key, typed_val.to_dict())
+                del db[key]
 
-            return element
+            return element if count is None else popped
 
     def srem(self, key: str, *values: str) -> int:
-        with self._db_lock:
-            typed_val = self._db.get(key)
+        with self._writing(key) as db:
+            typed_val = db.get(key)
 
             if typed_val is None:
                 return 0
@@ -530,23 +1844,211 @@ class PyKeyDB(KeyValueDBInterface):
                     f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not set"
                 )
 
-            del_count = 0
-            for value in values:
-                if value in typed_val.value:
-                    typed_val.value.remove(value)
-                    del_count += 1
+            removed = [value for value in dict.fromkeys(values) if value in typed_val.value]
+            if removed:
+                self._unshare(typed_val)
+            for value in removed:
+                typed_val.value.remove(value)
 
-            # Log final state if any elements were deleted
-            if del_count > 0:
+            # Log only the removed members if any were deleted
+            if removed:
+                self._log("SREM", key, members=removed)
                 # If set is now empty, we can delete the key
                 if not typed_val.value:
-                    self.wal.log_operation("DEL", key)
-                    del self._db[key]
-                else:
-                    # Log updated set state
-                    self.wal.log_operation("SREMOVE", key, typed_val.to_dict())
+                    del db[key]
+
+            return len(removed)
+
+    def _set_values(self, keys) -> list:
+        """The members of each key (an empty tuple for missing keys); caller holds locked(*keys)"""
+        values = []
+        for key in keys:
+            with self._shard(key) as db:
+                typed_val = db.get(key)
+            if typed_val is None:
+                values.append(())
+            elif typed_val.data_type != DataType.SET:
+                raise TypeError(
+                    f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not set"
+                )
+            else:
+                values.append(typed_val.value)
+        return values
+
+    def sinter(self, *keys: str) -> set:
+        with self.locked(*keys):
+            return set(intersect(self._set_values(keys)))
+
+    def sintercard(self, *keys: str, limit: int = 0) -> int:
+        """Size of the intersection, counting no further than limit (0 = no limit)"""
+        with self.locked(*keys):
+            return len(intersect(self._set_values(keys), limit))
+
+    def sunion(self, *keys: str) -> set:
+        with self.locked(*keys):
+            return union(self._set_values(keys))
+
+    def sdiff(self, *keys: str) -> set:
+        with self.locked(*keys):
+            values = self._set_values(keys)
+            return difference(values[0], values[1:])
+
+    def _store_set(self, destination: str, members) -> int:
+        """Replace destination with a set of members; caller holds its lock"""
+        with self._writing(destination) as db:
+            if not members:
+                if destination in db:
+                    self._log("DEL", destination)
+                    del db[destination]
+                return 0
+            typed_val = TypedValue(new_set(members), DataType.SET)
+            # The whole result is one full-state record, like SET
+            self._log("SET", destination, typed_val.to_dict())
+            db[destination] = typed_val
+            return len(typed_val.value)
+
+    def sinterstore(self, destination: str, *keys: str) -> int:
+        with self.locked(destination, *keys, write=True):
+            return self._store_set(destination, intersect(self._set_values(keys)))
+
+    def sunionstore(self, destination: str, *keys: str) -> int:
+        with self.locked(destination, *keys, write=True):
+            return self._store_set(destination, union(self._set_values(keys)))
+
+    def sdiffstore(self, destination: str, *keys: str) -> int:
+        with self.locked(destination, *keys, write=True):
+            values = self._set_values(keys)
+            return self._store_set(destination, difference(values[0], values[1:]))
+
+    @staticmethod
+    def _get_zset(db, key):
+        typed_val = db.get(key)
+        if typed_val is not None and typed_val.data_type != DataType.ZSET:
+            raise TypeError(
+                f"ERR: WRONGTYPE -> key is {typed_val.data_type.value}, not zset"
+            )
+        return typed_val
+
+    def zadd(
+        self,
+        key: str,
+        members: Dict[str, float],
+        nx: bool = False,
+        xx: bool = False,
+        gt: bool = False,
+        lt: bool = False,
+        ch: bool = False,
+    ) -> int:
+        """
+        Add members with their scores, or update the scores of existing ones.
+        nx: only add new members, xx: only update existing ones, gt/lt: only
+        update a score upwards/downwards. Returns the number of members added
+        (with ch, the number added or changed).
+        """
+        with self._writing(key) as db:
+            typed_val = self._get_zset(db, key)
+            zset = SortedSet() if typed_val is None else typed_val.value
+            written = {}
+            added = 0
+            for member, score in members.items():
+                current = zset.score(member)
+                if current is None:
+                    if xx:
+                        continue
+                    added += 1
+                elif nx or score == current or (gt and score < current) or (lt and score > current):
+                    continue
+                written[member] = score
+            if not written:
+                return 0
+
+            # Only the members that changed are logged
+            self._log("ZADD", key, members=written)
+            if typed_val is None:
+                db[key] = TypedValue(zset, DataType.ZSET)
+            for member, score in written.items():
+                zset.add(member, score)
+            return len(written) if ch else added
+
+    def zincrby(
+        self, key: str, increment: float, member: str, nx: bool = False, xx: bool = False, gt: bool = False, lt: bool = False
+    ) -> Optional[float]:
+        """Add increment to a member's score (a missing member counts as 0); None if a flag vetoed the update"""
+        with self._writing(key) as db:
+            typed_val = self._get_zset(db, key)
+            current = None if typed_val is None else typed_val.value.score(member)
+            if (current is None and xx) or (current is not None and nx):
+                return None
+            score = (current or 0.0) + increment
+            if math.isnan(score):
+                raise ValueError("resulting score is not a number (NaN)")
+            if current is not None and ((gt and score <= current) or (lt and score >= current)):
+                return None
 
-            return del_count
+            # The resulting score is logged, so replay sets it rather than adding again
+            self._log("ZADD", key, members={member: score})
+            if typed_val is None:
+                typed_val = TypedValue(SortedSet(), DataType.ZSET)
+                db[key] = typed_val
+            typed_val.value.add(member, score)
+            return score
+
+    def zrem(self, key: str, *members: str) -> int:
+        with self._writing(key) as db:
+            typed_val = self._get_zset(db, key)
+            if typed_val is None:
+                return 0
+            removed = [member for member in dict.fromkeys(members) if typed_val.value.discard(member)]
+            if removed:
+                self._log("ZREM", key, members=removed)
+                if not typed_val.value:
+                    del db[key]
+            return len(removed)
+
+    def zpopmin(self, key: str, count: int = 1) -> list:
+        """Remove and return up to count (member, score) pairs with the lowest scores"""
+        with self._writing(key) as db:
+            typed_val = self._get_zset(db, key)
+            if typed_val is None or count <= 0:
+                return []
+            popped = typed_val.value.pop_min(count)
+            # Logged as a ZREM of exactly the popped members
+            self._log("ZREM", key, members=[member for member, _ in popped])
+            if not typed_val.value:
+                del db[key]
+            return popped
+
+    def zscore(self, key: str, member: str) -> Optional[float]:
+        with self._shard(key) as db:
+            typed_val = self._get_zset(db, key)
+            return None if typed_val is None else typed_val.value.score(member)
+
+    def zrank(self, key: str, member: str, reverse: bool = False) -> Optional[int]:
+        """0-based position of member by ascending score (descending with reverse)"""
+        with self._shard(key) as db:
+            typed_val = self._get_zset(db, key)
+            return None if typed_val is None else typed_val.value.rank(member, reverse)
+
+    def zcard(self, key: str) -> int:
+        with self._shard(key) as db:
+            typed_val = self._get_zset(db, key)
+            return 0 if typed_val is None else len(typed_val.value)
+
+    def zrange(self, key: str, start: int, stop: int, reverse: bool = False) -> list:
+        """(member, score) pairs between two ranks, inclusive; negative ranks count from the end"""
+        with self._shard(key) as db:
+            typed_val = self._get_zset(db, key)
+            return [] if typed_val is None else typed_val.value.range_by_rank(start, stop, reverse)
+
+    def zrangebyscore(
+        self, key: str, score_range: ScoreRange, offset: int = 0, count: int = -1, reverse: bool = False
+    ) -> list:
+        """(member, score) pairs within score_range, skipping offset and returning at most count (-1: all)"""
+        with self._shard(key) as db:
+            typed_val = self._get_zset(db, key)
+            if typed_val is None:
+                return []
+            return typed_val.value.range_by_score(score_range, offset, count, reverse)
 
 
 _pykey_dbs: Dict[str, PyKeyDB] = {}
@@ -554,7 +2056,15 @@ _db_factory_lock = threading.RLock()
 
 
 def get_pykey_db(
-    write_ahead_log: Optional[WriteAheadLog] = None, wal_path: str = "wal.log"
+    write_ahead_log: Optional[WriteAheadLog] = None,
+    wal_path: str = "wal.log",
+    snapshot_path: Optional[str] = None,
+    compact_threshold: Optional[int] = None,
+    replay_last_writer_wins: bool = False,
+    num_shards: int = DEFAULT_NUM_SHARDS,
+    maxmemory: int = 0,
+    maxmemory_policy: str = NOEVICTION,
+    maxmemory_samples: int = DEFAULT_MAXMEMORY_SAMPLES,
 ) -> PyKeyDB:
     """Get or create PyKeyDB instance for the given WAL (singleton per WAL path)"""
     with _db_factory_lock:
@@ -565,7 +2075,16 @@ def get_pykey_db(
 
         path = write_ahead_log.path
         if path not in _pykey_dbs:
-            _pykey_dbs[path] = PyKeyDB(write_ahead_log)
+            _pykey_dbs[path] = PyKeyDB(
+                write_ahead_log,
+                snapshot_path,
+                compact_threshold,
+                replay_last_writer_wins,
+                num_shards,
+                maxmemory,
+                maxmemory_policy,
+                maxmemory_samples,
+            )
         return _pykey_dbs[path]
 
 
@@ -0,0 +1,47 @@
+class SimpleString(str):
+    """A status reply such as OK or QUEUED (RESP simple string, not a bulk string)"""
+
+    __slots__ = ()
+
+
+class ErrorReply(str):
+    """An error reply; the text starts with an error code such as ERR"""
+
+    __slots__ = ()
+
+
+class Push(list):
+    """Out-of-band data such as a pub/sub message (RESP3 push type, a plain array in RESP2)"""
+
+    __slots__ = ()
+
+
+class NullArray:
+    """The null array reply: what BLPOP and BRPOP send when nothing was popped (*-1 in RESP2)"""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "NULL_ARRAY"
+
+
+class Replies(list):
+    """Several replies to one command, sent back to back (SUBSCRIBE confirms each channel)"""
+
+    __slots__ = ()
+
+
+OK = SimpleString("OK")
+QUEUED = SimpleString("QUEUED")
+NULL_ARRAY = NullArray()
+
+# Replies are plain Python values, encoded by the server for the client's protocol:
+#   SimpleString / ErrorReply - status and error replies
+#   str                       - bulk string
+#   int, float, bool          - numbers (bool is sent as 1/0, like Redis)
+#   None                      - null
+#   NULL_ARRAY                - null array (RESP2 *-1), a null in RESP3
+#   list, tuple, set          - arrays (sets are RESP3 sets)
+#   Push                      - RESP3 push, an array for RESP2
+#   Replies                   - each item as a reply of its own
+#   dict                      - RESP3 map, flattened to an array for RESP2
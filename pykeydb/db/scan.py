@@ -0,0 +1,81 @@
+import re
+from typing import Callable, Optional, Tuple
+from pykeydb.db.encodings import GENERATION_BITS
+
+DEFAULT_SCAN_COUNT = 10
+
+_GLOB_CHARS = frozenset("*?[\\")
+
+
+def compile_pattern(pattern: Optional[str]) -> Optional[Callable[[str], bool]]:
+    """
+    A predicate for a Redis glob pattern (*, ?, [abc], [^a-z], \\ escapes), or
+    None when it matches everything. Patterns without glob characters, and a
+    literal prefix followed by a single *, skip the regex engine.
+    """
+    if pattern is None or pattern == "*":
+        return None
+    if not _GLOB_CHARS.intersection(pattern):
+        return pattern.__eq__
+    prefix = pattern[:-1]
+    if pattern.endswith("*") and not _GLOB_CHARS.intersection(prefix):
+        return lambda key: key.startswith(prefix)
+    return re.compile(_glob_to_regex(pattern), re.DOTALL).fullmatch
+
+
+def _glob_to_regex(pattern: str) -> str:
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        i += 1
+        if char == "*":
+            out.append(".*")
+        elif char == "?":
+            out.append(".")
+        elif char == "\\" and i < n:
+            out.append(re.escape(pattern[i]))
+            i += 1
+        elif char == "[":
+            end = pattern.find("]", i + 1 if pattern[i : i + 1] == "^" else i)
+            if end < 0:
+                # Unterminated class: match the bracket literally
+                out.append(re.escape(char))
+                continue
+            body = pattern[i:end]
+            i = end + 1
+            negate = body.startswith("^")
+            if negate:
+                body = body[1:]
+            parts = []
+            j = 0
+            while j < len(body):
+                if body[j] == "\\" and j + 1 < len(body):
+                    j += 1
+                if j + 2 < len(body) and body[j + 1] == "-":
+                    low, high = sorted((body[j], body[j + 2]))
+                    parts.append(f"{re.escape(low)}-{re.escape(high)}")
+                    j += 3
+                else:
+                    parts.append(re.escape(body[j]))
+                    j += 1
+            out.append(f"[{'^' if negate else ''}{''.join(parts)}]" if parts else ("." if negate else "(?!)"))
+        else:
+            out.append(re.escape(char))
+    return "".join(out)
+
+
+def pack_cursor(source: int, generation: int, position: int, sources: int) -> int:
+    """
+    A cursor for resuming at position in the key list of one of sources
+    IndexedDicts (SCAN's shards; HSCAN has one), tagged with the generation of
+    that list. Cursor 0, source 0 at position 0, starts an iteration.
+    """
+    return ((position << GENERATION_BITS) | generation) * sources + source
+
+
+def unpack_cursor(cursor: int, sources: int) -> Tuple[int, int, int]:
+    """(source, generation, position) of a cursor made by pack_cursor"""
+    source = cursor % sources
+    rest = cursor // sources
+    return source, rest & ((1 << GENERATION_BITS) - 1), rest >> GENERATION_BITS
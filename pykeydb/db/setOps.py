@@ -0,0 +1,56 @@
+from typing import Collection, List, Sequence, Set
+
+# Set algebra over any set encoding (anything with len, iteration and `in`)
+
+
+def intersect(sets: Sequence[Collection[str]], limit: int = 0) -> List[str]:
+    """
+    Members common to every set. The smallest set is iterated and the others
+    probed from smallest to largest, so a member missing from a small set is
+    rejected early. With limit > 0, stops after finding that many.
+    """
+    if not sets:
+        return []
+    ordered = sorted(sets, key=len)
+    smallest, others = ordered[0], ordered[1:]
+    if not smallest:
+        return []
+    result = []
+    for member in smallest:
+        for other in others:
+            if member not in other:
+                break
+        else:
+            result.append(member)
+            if limit and len(result) >= limit:
+                break
+    return result
+
+
+def union(sets: Sequence[Collection[str]]) -> Set[str]:
+    result: Set[str] = set()
+    for members in sets:
+        result.update(members)
+    return result
+
+
+def difference(first: Collection[str], others: Sequence[Collection[str]]) -> Set[str]:
+    """
+    Members of first that are in none of the others. Picks the cheaper of the two
+    Redis algorithms: probe every other set for each member of first (about
+    len(first) * len(others) / 2 lookups, good when first is small), or copy
+    first and remove every member of the others (sum of all sizes).
+    """
+    others = [other for other in others if other]
+    if not first or not others:
+        return set(first)
+    probe_cost = len(first) * len(others) // 2
+    remove_cost = len(first) + sum(len(other) for other in others)
+    if probe_cost <= remove_cost:
+        return {member for member in first if not any(member in other for other in others)}
+    result = set(first)
+    for other in others:
+        result.difference_update(other)
+        if not result:
+            break
+    return result
@@ -0,0 +1,192 @@
+import gc
+import os
+import signal
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+from logging import getLogger
+from pykeydb.db.dataTypes import TypedValue
+from pykeydb.db.walCodec import get_wal_codec, detect_wal_format
+from pykeydb.db.writeAheadLog import fsync_directory
+
+logger = getLogger(__name__)
+
+# A snapshot is written with the same record codec as the WAL:
+#   SNAPSHOT header (the WAL checkpoint it covers), one SET record per key, SNAPSHOT_END trailer.
+SNAPSHOT_OPERATION = "SNAPSHOT"
+SNAPSHOT_END_OPERATION = "SNAPSHOT_END"
+
+# How often (in keys) a snapshot writer reports progress
+PROGRESS_INTERVAL = 10_000
+
+
+def write_snapshot(
+    path: str,
+    items: Iterable[Tuple[str, TypedValue]],
+    wal_epoch: int,
+    wal_offset: int,
+    wal_format: str = "json",
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Write (key, TypedValue) pairs to a snapshot file covering the WAL up to
+    (wal_epoch, wal_offset). The file is written to a temporary path, fsynced and
+    atomically renamed, so a crash never leaves a half-written snapshot behind.
+    Returns the number of keys written.
+    """
+    codec = get_wal_codec(wal_format)
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, "wb") as f:
+        f.write(codec.header)
+        f.write(
+            codec.encode(
+                {"operation": SNAPSHOT_OPERATION, "key": "", "epoch": wal_epoch, "offset": wal_offset}
+            )
+        )
+        for key, typed_val in items:
+            f.write(codec.encode({"operation": "SET", "key": key, "value": typed_val.to_dict()}))
+            count += 1
+            if progress is not None and count % PROGRESS_INTERVAL == 0:
+                progress(count)
+        f.write(codec.encode({"operation": SNAPSHOT_END_OPERATION, "key": "", "count": count}))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(path)
+    return count
+
+
+def read_snapshot(path: str) -> Optional[Tuple[Tuple[int, int], Iterator[Dict]]]:
+    """
+    Open a snapshot file. Returns ((wal_epoch, wal_offset), records) or None if
+    there is no snapshot. records is a generator of SET records; it raises
+    ValueError if the snapshot turns out to be truncated.
+    """
+    if not os.path.exists(path):
+        return None
+
+    codec = get_wal_codec(detect_wal_format(path, "json"))
+    f = open(path, "rb")
+    f.seek(len(codec.header))
+    records = codec.iter_records(f)
+    header = next(records, (None, 0))[0]
+    if not header or header.get("operation") != SNAPSHOT_OPERATION:
+        f.close()
+        raise ValueError(f"{path} is not a PyKeyDB snapshot")
+
+    def iter_keys():
+        with f:
+            count = 0
+            for record, _ in records:
+                if record["operation"] == SNAPSHOT_END_OPERATION:
+                    if record["count"] != count:
+                        raise ValueError(f"Snapshot {path} has {count} keys, expected {record['count']}")
+                    return
+                count += 1
+                yield record
+        raise ValueError(f"Snapshot {path} is truncated after {count} keys")
+
+    return (header["epoch"], header["offset"]), iter_keys()
+
+
+@dataclass
+class BackgroundSave:
+    """A snapshot being written by a forked child process"""
+
+    pid: int
+    progress_fd: int
+    path: str
+    epoch: int
+    offset: int
+    total_keys: int
+    started_at: float
+    keys_written: int = 0
+    _progress_buffer: bytes = b""
+
+    def read_progress(self) -> int:
+        """Drain progress reports from the child without blocking"""
+        while True:
+            try:
+                data = os.read(self.progress_fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self._progress_buffer += data
+        lines = self._progress_buffer.split(b"\n")
+        self._progress_buffer = lines.pop()
+        if lines:
+            self.keys_written = int(lines[-1])
+        return self.keys_written
+
+    def poll(self) -> Optional[bool]:
+        """None while the child is running, otherwise whether it succeeded"""
+        self.read_progress()
+        pid, status = os.waitpid(self.pid, os.WNOHANG)
+        if pid == 0:
+            return None
+        os.close(self.progress_fd)
+        return os.waitstatus_to_exitcode(status) == 0
+
+    def cancel(self):
+        """Kill the child, wait for it and remove what it wrote"""
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(self.pid, 0)
+        os.close(self.progress_fd)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def fork_snapshot(
+    path: str,
+    items: Iterable[Tuple[str, TypedValue]],
+    total_keys: int,
+    wal_epoch: int,
+    wal_offset: int,
+    wal_format: str = "json",
+) -> BackgroundSave:
+    """
+    Fork a child that writes the snapshot to path from its copy-on-write view of
+    memory. The caller must hold the DB lock across the call, so the child sees a
+    consistent dataset; it can release it as soon as this returns.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Child: only touch our own copy of the data, never locks, loggers or the event loop
+        status = 1
+        try:
+            os.close(read_fd)
+            os.set_blocking(write_fd, False)
+            # The collector would write to every object header and defeat copy-on-write
+            gc.disable()
+
+            def report(count):
+                try:
+                    os.write(write_fd, b"%d\n" % count)
+                except BlockingIOError:
+                    pass
+
+            count = write_snapshot(path, items, wal_epoch, wal_offset, wal_format, progress=report)
+            report(count)
+            status = 0
+        except BaseException:
+            pass
+        finally:
+            os._exit(status)
+
+    os.close(write_fd)
+    os.set_blocking(read_fd, False)
+    return BackgroundSave(
+        pid=pid,
+        progress_fd=read_fd,
+        path=path,
+        epoch=wal_epoch,
+        offset=wal_offset,
+        total_keys=total_keys,
+        started_at=time.time(),
+    )
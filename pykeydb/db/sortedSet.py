@@ -0,0 +1,336 @@
+import math
+import random
+import sys
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Skiplist shape (same as Redis): a node gets one more level with probability
+# SKIPLIST_P, so each level holds about a quarter of the nodes below it
+SKIPLIST_MAXLEVEL = 32
+SKIPLIST_P = 0.25
+
+# Rough bytes per member beyond the member string itself: the node, its two
+# level lists, the score and the dict slot (used by __sizeof__)
+_NODE_OVERHEAD = 200
+
+
+def _random_level() -> int:
+    level = 1
+    while level < SKIPLIST_MAXLEVEL and random.random() < SKIPLIST_P:
+        level += 1
+    return level
+
+
+class _Node:
+    __slots__ = ("member", "score", "backward", "forward", "span")
+
+    def __init__(self, member: Optional[str], score: float, level: int):
+        self.member = member
+        self.score = score
+        self.backward: Optional[_Node] = None
+        # forward[i] is the next node on level i; span[i] is how many nodes
+        # level 0 steps over to get there (what makes rank queries O(log n))
+        self.forward: List[Optional[_Node]] = [None] * level
+        self.span: List[int] = [0] * level
+
+
+class ScoreRange:
+    """A score interval for ZRANGEBYSCORE; either bound may be exclusive"""
+
+    __slots__ = ("min", "max", "min_exclusive", "max_exclusive")
+
+    def __init__(self, min: float, max: float, min_exclusive: bool = False, max_exclusive: bool = False):
+        self.min = min
+        self.max = max
+        self.min_exclusive = min_exclusive
+        self.max_exclusive = max_exclusive
+
+    @classmethod
+    def parse(cls, min_text: str, max_text: str) -> "ScoreRange":
+        """Bounds as clients write them: 1.5, (1.5 (exclusive), -inf, +inf"""
+        low, low_exclusive = _parse_bound(min_text)
+        high, high_exclusive = _parse_bound(max_text)
+        return cls(low, high, low_exclusive, high_exclusive)
+
+    def is_empty(self) -> bool:
+        return self.min > self.max or (self.min == self.max and (self.min_exclusive or self.max_exclusive))
+
+    def above_min(self, score: float) -> bool:
+        return score > self.min if self.min_exclusive else score >= self.min
+
+    def below_max(self, score: float) -> bool:
+        return score < self.max if self.max_exclusive else score <= self.max
+
+
+def _parse_bound(text: str) -> Tuple[float, bool]:
+    exclusive = text.startswith("(")
+    score = parse_score(text[1:] if exclusive else text, "min or max is not a float")
+    return score, exclusive
+
+
+def parse_score(text: str, error: str = "value is not a valid float") -> float:
+    """A score argument; NaN is rejected, infinities are allowed"""
+    try:
+        score = float(text)
+    except ValueError:
+        raise ValueError(error) from None
+    if math.isnan(score):
+        raise ValueError(error)
+    return score
+
+
+class SortedSet:
+    """
+    Members ordered by (score, member), stored as a skiplist plus a dict from
+    member to skiplist node, as in Redis. Score lookups go through the dict in
+    O(1); inserts, deletes, rank queries and range starts are O(log n).
+    Ranks are 0-based.
+    """
+
+    __slots__ = ("_nodes", "_header", "_level", "_length")
+
+    def __init__(self, items: Iterable[Tuple[str, float]] = ()):
+        self._nodes = {}
+        self._header = _Node(None, 0.0, SKIPLIST_MAXLEVEL)
+        self._level = 1
+        # Nodes in the skiplist (can differ from len(_nodes) while a member moves)
+        self._length = 0
+        for member, score in items:
+            self.add(member, float(score))
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, member) -> bool:
+        return member in self._nodes
+
+    def __iter__(self) -> Iterator[str]:
+        """Members in ascending order"""
+        node = self._header.forward[0]
+        while node is not None:
+            yield node.member
+            node = node.forward[0]
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sys.getsizeof(self._nodes) + len(self._nodes) * _NODE_OVERHEAD
+
+    def items(self) -> Iterator[Tuple[str, float]]:
+        """(member, score) pairs in ascending order"""
+        node = self._header.forward[0]
+        while node is not None:
+            yield node.member, node.score
+            node = node.forward[0]
+
+    def copy(self) -> "SortedSet":
+        return SortedSet(self.items())
+
+    def score(self, member: str) -> Optional[float]:
+        node = self._nodes.get(member)
+        return None if node is None else node.score
+
+    def add(self, member: str, score: float) -> bool:
+        """Insert member or move it to score; True if it was not there before"""
+        node = self._nodes.get(member)
+        if node is None:
+            self._nodes[member] = self._insert(member, score)
+            return True
+        if node.score != score:
+            # The node can keep its place if its neighbours still bracket the new score
+            backward, forward = node.backward, node.forward[0]
+            if (backward is None or backward.score < score) and (forward is None or forward.score > score):
+                node.score = score
+            else:
+                self._delete(member, node.score)
+                self._nodes[member] = self._insert(member, score)
+        return False
+
+    def discard(self, member: str) -> bool:
+        node = self._nodes.pop(member, None)
+        if node is None:
+            return False
+        self._delete(member, node.score)
+        return True
+
+    def rank(self, member: str, reverse: bool = False) -> Optional[int]:
+        node = self._nodes.get(member)
+        if node is None:
+            return None
+        score = node.score
+        rank = 0
+        x = self._header
+        for i in range(self._level - 1, -1, -1):
+            while True:
+                next_node = x.forward[i]
+                if next_node is None or next_node.score > score or (
+                    next_node.score == score and next_node.member > member
+                ):
+                    break
+                rank += x.span[i]
+                x = next_node
+            if x is node:
+                break
+        # rank counts nodes up to and including member: 1-based
+        return len(self._nodes) - rank if reverse else rank - 1
+
+    def range_by_rank(self, start: int, stop: int, reverse: bool = False) -> List[Tuple[str, float]]:
+        """(member, score) pairs from rank start to stop inclusive; negative ranks count from the end"""
+        length = len(self._nodes)
+        if start < 0:
+            start = max(length + start, 0)
+        if stop < 0:
+            stop = length + stop
+        stop = min(stop, length - 1)
+        if start > stop:
+            return []
+        first = self._node_at(length - 1 - start if reverse else start)
+        return self._walk(first, stop - start + 1, reverse)
+
+    def range_by_score(
+        self, score_range: ScoreRange, offset: int = 0, count: int = -1, reverse: bool = False
+    ) -> List[Tuple[str, float]]:
+        """
+        (member, score) pairs within score_range, lowest first (highest first
+        with reverse). LIMIT offset count skips by rank rather than by walking,
+        so a deep offset costs O(log n) too. A negative count means no limit.
+        """
+        if offset < 0 or count == 0 or score_range.is_empty():
+            return []
+        if reverse:
+            node, rank = self._last_in_range(score_range)
+        else:
+            node, rank = self._first_in_range(score_range)
+        if node is None:
+            return []
+        if offset:
+            rank = rank - offset if reverse else rank + offset
+            if not 0 <= rank < len(self._nodes):
+                return []
+            node = self._node_at(rank)
+        in_range = score_range.above_min if reverse else score_range.below_max
+        result = []
+        while node is not None and in_range(node.score) and count != len(result):
+            result.append((node.member, node.score))
+            node = node.backward if reverse else node.forward[0]
+        return result
+
+    def pop_min(self, count: int = 1) -> List[Tuple[str, float]]:
+        popped = self._walk(self._header.forward[0], count, False)
+        for member, _ in popped:
+            self.discard(member)
+        return popped
+
+    def _walk(self, node: Optional[_Node], count: int, reverse: bool) -> List[Tuple[str, float]]:
+        result = []
+        while node is not None and len(result) < count:
+            result.append((node.member, node.score))
+            node = node.backward if reverse else node.forward[0]
+        return result
+
+    def _node_at(self, rank: int) -> Optional[_Node]:
+        """The node at a 0-based rank, following spans down from the top level"""
+        target = rank + 1
+        traversed = 0
+        x = self._header
+        for i in range(self._level - 1, -1, -1):
+            while x.forward[i] is not None and traversed + x.span[i] <= target:
+                traversed += x.span[i]
+                x = x.forward[i]
+            if traversed == target:
+                return x
+        return None
+
+    def _first_in_range(self, score_range: ScoreRange) -> Tuple[Optional[_Node], int]:
+        """The lowest node within score_range and its rank, or (None, -1)"""
+        traversed = 0
+        x = self._header
+        for i in range(self._level - 1, -1, -1):
+            while x.forward[i] is not None and not score_range.above_min(x.forward[i].score):
+                traversed += x.span[i]
+                x = x.forward[i]
+        x = x.forward[0]
+        if x is None or not score_range.below_max(x.score):
+            return None, -1
+        return x, traversed
+
+    def _last_in_range(self, score_range: ScoreRange) -> Tuple[Optional[_Node], int]:
+        """The highest node within score_range and its rank, or (None, -1)"""
+        traversed = 0
+        x = self._header
+        for i in range(self._level - 1, -1, -1):
+            while x.forward[i] is not None and score_range.below_max(x.forward[i].score):
+                traversed += x.span[i]
+                x = x.forward[i]
+        if x is self._header or not score_range.above_min(x.score):
+            return None, -1
+        return x, traversed - 1
+
+    def _insert(self, member: str, score: float) -> _Node:
+        level = _random_level()
+        height = max(level, self._level)
+        # update[i]: the last node on level i before the new one; rank[i]: its rank
+        update = [self._header] * height
+        rank = [0] * height
+        x = self._header
+        traversed = 0
+        for i in range(self._level - 1, -1, -1):
+            # Locals instead of rank[i] and attribute lookups: this loop is the cost of an insert
+            forward = x.forward
+            while True:
+                next_node = forward[i]
+                if next_node is None:
+                    break
+                next_score = next_node.score
+                if next_score > score or (next_score == score and next_node.member >= member):
+                    break
+                traversed += x.span[i]
+                x = next_node
+                forward = x.forward
+            update[i] = x
+            rank[i] = traversed
+        if level > self._level:
+            for i in range(self._level, level):
+                self._header.span[i] = self._length
+            self._level = level
+
+        node = _Node(member, score, level)
+        for i in range(level):
+            node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        # Levels above the new node now span one more node
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+
+        node.backward = None if update[0] is self._header else update[0]
+        if node.forward[0] is not None:
+            node.forward[0].backward = node
+        self._length += 1
+        return node
+
+    def _delete(self, member: str, score: float):
+        update = [self._header] * self._level
+        x = self._header
+        for i in range(self._level - 1, -1, -1):
+            while True:
+                next_node = x.forward[i]
+                if next_node is None or next_node.score > score or (
+                    next_node.score == score and next_node.member >= member
+                ):
+                    break
+                x = next_node
+            update[i] = x
+        node = x.forward[0]
+        for i in range(self._level):
+            if update[i].forward[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].forward[i] = node.forward[i]
+            else:
+                update[i].span[i] -= 1
+        if node.forward[0] is not None:
+            node.forward[0].backward = node.backward
+        self._length -= 1
+        while self._level > 1 and self._header.forward[self._level - 1] is None:
+            self._level -= 1
+
+    def __repr__(self):
+        return f"SortedSet({dict(self.items())!r})"
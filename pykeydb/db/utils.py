@@ -1,173 +1,744 @@
-def apply_command(db, cmd: list[str]) -> str:
-    try:
-        op = cmd[0].upper()
-
-        # String operations
-        if op == "SET" and len(cmd) >= 3:
-            key = cmd[1]
-            value = " ".join(cmd[2:])
-            return "OK" if db.set(key, value) else "ERR"
-
-        if op == "GET" and len(cmd) == 2:
-            val = db.get(cmd[1])
-            return str(val) if val is not None else "(nil)"
-
-        # List operations
-        if op == "LPUSH" and len(cmd) >= 3:
-            key = cmd[1]
-            values = cmd[2:]
-            length = db.lpush(key, *values)
-            return f"(integer) {length}"
-
-        if op == "RPUSH" and len(cmd) >= 3:
-            key = cmd[1]
-            values = cmd[2:]
-            length = db.rpush(key, *values)
-            return f"(integer) {length}"
-
-        if op == "LPOP" and len(cmd) == 2:
-            val = db.lpop(cmd[1])
-            return str(val) if val is not None else "(nil)"
-
-        if op == "RPOP" and len(cmd) == 2:
-            val = db.rpop(cmd[1])
-            return str(val) if val is not None else "(nil)"
-
-        if op == "LRANGE" and len(cmd) == 4:
-            key = cmd[1]
-            start = int(cmd[2])
-            stop = int(cmd[3])
-            items = db.lrange(key, start, stop)
-            if not items:
-                return "(EMPTY LIST)"
-            return "\n".join(f"{i}) {v}" for i, v in enumerate(items, 1))
-
-        if op == "LLEN" and len(cmd) == 2:
-            length = db.llen(cmd[1])
-            return f"(integer) {length}"
-
-        # Hash operations
-        if op == "HSET" and len(cmd) >= 4 and len(cmd) % 2 == 0:
-            key = cmd[1]
-            values = cmd[2:]
-            hash_dict = {}
-            for i in range(0, len(values), 2):
-                hash_dict[values[i]] = values[i + 1]
-            length = db.hset(key, hash_dict)
-            return f"(integer) {length}"
-
-        if op == "HGET" and len(cmd) == 3:
-            key = cmd[1]
-            hkey = cmd[2]
-            value = db.hget(key, hkey)
-
-            return str(value) if value is not None else "(nil)"
-
-        if op == "HMGET" and len(cmd) >= 3:
-            key = cmd[1]
-            hkeys = cmd[2:]
-            values = db.hmget(key, *hkeys)
-
-            return "\n".join(
-                f"{i}) {value if value is not None else '(nil)'}"
-                for i, value in enumerate(values, 1)
-            )
-
-        if op == "HGETALL" and len(cmd) == 2:
-            key = cmd[1]
-            hash_dict = db.hgetall(key)
-            if not hash_dict:
-                return "(empty hash)"
-
-            return "\n".join(
-                f"{i}) {k}: {v}" for i, (k, v) in enumerate(hash_dict.items(), 1)
-            )
-
-        if op == "HDEL" and len(cmd) >= 3:
-            key = cmd[1]
-            fields = cmd[2:]
-            count = db.hdel(key, *fields)
-            return f"(integer) {count}"
-
-        if op == "HLEN" and len(cmd) == 2:
-            key = cmd[1]
-            count = db.hlen(key)
-            return f"(integer) {count}"
-
-        if op == "HEXISTS" and len(cmd) == 3:
-            key = cmd[1]
-            hkey = cmd[2]
-            exists = db.hexists(key, hkey)
-            return "(integer) 1" if exists else "(integer) 0"
-
-        # Set Operations
-        if op == "SADD" and len(cmd) >= 3:
-            key = cmd[1]
-            values = cmd[2:]
-            length = db.sadd(key, *values)  # Fixed: unpack values
-            return f"(integer) {length}"
-
-        if op == "SREM" and len(cmd) >= 3:
-            key = cmd[1]
-            values = cmd[2:]
-            length = db.srem(key, *values)  # Fixed: unpack values
-            return f"(integer) {length}"
-
-        if op == "SISMEMBER" and len(cmd) == 3:
-            key = cmd[1]
-            value = cmd[2]
-            is_member = db.sismember(key, value)
-            return "(bool) True" if is_member else "(bool) False"
-
-        if op == "SMISMEMBER" and len(cmd) >= 3:
-            key = cmd[1]
-            values = cmd[2:]
-            is_members = db.smismember(key, *values)  # Fixed: unpack values
-            return "\n".join(
-                f"{i}) (bool) {value}" for i, value in enumerate(is_members, 1)
-            )
-
-        if op == "SMEMBERS" and len(cmd) == 2:
-            key = cmd[1]
-            members = db.smembers(key)
-            if not members:
-                return "(empty set)"
-            return "\n".join(f"{i}) {v}" for i, v in enumerate(members, 1))  # Fixed: start from 1
-
-        if op == "SCARD" and len(cmd) == 2:
-            count = db.scard(cmd[1])
-            return f"(integer) {count}"
-
-        if op == "SRANDMEMBER" and len(cmd) >= 2:
-            key = cmd[1]
-            count = int(cmd[2]) if len(cmd) == 3 else None
-            result = db.srandmember(key, count)
-            if result is None:
-                return "(nil)"
-            if isinstance(result, list):
-                if not result:
-                    return "(empty list)"
-                return "\n".join(f"{i}) {v}" for i, v in enumerate(result, 1))
-            return str(result)
-
-        if op == "SPOP" and len(cmd) == 2:
-            key = cmd[1]
-            spop_element = db.spop(key)
-            return str(spop_element) if spop_element else "(nil)"
-
-        # General operations
-        if op == "DEL" and len(cmd) == 2:
-            return "OK" if db.delete(cmd[1]) else "NULL"
-
-        if op == "TYPE" and len(cmd) == 2:
-            t = db.type(cmd[1])
-            return t if t else "NULL"
-
-        return "ERR unknown command"
+import math
+from fnmatch import fnmatchcase
+from pykeydb.db.commands import (
+    ADMIN,
+    BLOCKING,
+    COMMANDS,
+    CONNECTION,
+    DENYOOM,
+    FAST,
+    KEYSPACE,
+    MULTI_KEY,
+    READONLY,
+    WRITE,
+    Command,
+    command,
+)
+from pykeydb.db.eviction import parse_memory
+from pykeydb.db.pyKeyDB import now_ms
+from pykeydb.db.scan import DEFAULT_SCAN_COUNT
+from pykeydb.db.sortedSet import ScoreRange, parse_score
+from pykeydb.db.replies import NULL_ARRAY, OK, ErrorReply, SimpleString
+
+OOM_ERROR = "OOM command not allowed when used memory > 'maxmemory'."
+
 
+def apply_command(db, cmd: list[str]):
+    """Execute one command and return its reply as a Python value (see replies.py)"""
+    spec = COMMANDS.get(cmd[0].upper())
+    if spec is None:
+        return ErrorReply(f"ERR unknown command '{cmd[0]}'")
+    if not spec.min_argc <= len(cmd) <= spec.max_argc:
+        return ErrorReply(f"ERR wrong number of arguments for '{cmd[0].lower()}' command")
+    return call_command(db, spec, cmd)
+
+
+def call_command(db, spec: Command, cmd: list[str]):
+    """Run an already looked-up and arity-checked command, turning exceptions into error replies"""
+    if spec.handler is None:
+        return ErrorReply(f"ERR {spec.name} is only valid on a client connection")
+    # Over the memory limit, writes first make room by evicting keys
+    if spec.is_write and db.maxmemory and not db.free_memory_if_needed() and spec.is_denyoom:
+        return ErrorReply(OOM_ERROR)
+    try:
+        return spec.handler(db, cmd)
     except TypeError as e:
-        return f"ERR {e}"
+        return ErrorReply(f"ERR {e}")
     except ValueError as e:
-        return f"ERR invalid argument: {e}"
+        return ErrorReply(f"ERR invalid argument: {e}")
     except Exception as e:
-        return f"ERR {e}"
+        return ErrorReply(f"ERR {e}")
+
+
+# String operations
+@command("SET", -3, [WRITE, DENYOOM])
+def set_command(db, cmd):
+    """SET key value [EX seconds | PX milliseconds]"""
+    key, value = cmd[1], cmd[2]
+    expire_at = None
+    options = cmd[3:]
+    if options:
+        if len(options) != 2 or options[0].upper() not in ("EX", "PX"):
+            return ErrorReply("ERR syntax error")
+        ttl = int(options[1])
+        if ttl <= 0:
+            return ErrorReply("ERR invalid expire time in 'set' command")
+        expire_at = now_ms() + (ttl * 1000 if options[0].upper() == "EX" else ttl)
+    return OK if db.set(key, value, expire_at) else ErrorReply("ERR")
+
+
+@command("GET", 2, [READONLY, FAST])
+def get_command(db, cmd):
+    return db.get(cmd[1])
+
+
+@command("INCR", 2, [WRITE, DENYOOM, FAST])
+def incr_command(db, cmd):
+    return db.incrby(cmd[1], 1)
+
+
+@command("DECR", 2, [WRITE, DENYOOM, FAST])
+def decr_command(db, cmd):
+    return db.incrby(cmd[1], -1)
+
+
+@command("INCRBY", 3, [WRITE, DENYOOM, FAST])
+def incrby_command(db, cmd):
+    return db.incrby(cmd[1], int(cmd[2]))
+
+
+@command("DECRBY", 3, [WRITE, DENYOOM, FAST])
+def decrby_command(db, cmd):
+    return db.incrby(cmd[1], -int(cmd[2]))
+
+
+@command("INCRBYFLOAT", 3, [WRITE, DENYOOM, FAST])
+def incrbyfloat_command(db, cmd):
+    increment = float(cmd[2])
+    if not math.isfinite(increment):
+        return ErrorReply("ERR value is not a valid float")
+    return db.incrbyfloat(cmd[1], increment)
+
+
+@command("MGET", -2, [READONLY, FAST, MULTI_KEY], last_key=-1)
+def mget_command(db, cmd):
+    return db.mget(*cmd[1:])
+
+
+def _pairs(cmd):
+    """key value [key value ...] arguments as a dict, or None if a value is missing"""
+    if len(cmd) % 2 == 0:
+        return None
+    return dict(zip(cmd[1::2], cmd[2::2]))
+
+
+@command("MSET", -3, [WRITE, DENYOOM, MULTI_KEY], last_key=-1, key_step=2)
+def mset_command(db, cmd):
+    mapping = _pairs(cmd)
+    if mapping is None:
+        return ErrorReply("ERR wrong number of arguments for 'mset' command")
+    return OK if db.mset(mapping) else ErrorReply("ERR")
+
+
+@command("MSETNX", -3, [WRITE, DENYOOM, MULTI_KEY], last_key=-1, key_step=2)
+def msetnx_command(db, cmd):
+    mapping = _pairs(cmd)
+    if mapping is None:
+        return ErrorReply("ERR wrong number of arguments for 'msetnx' command")
+    return int(db.msetnx(mapping))
+
+
+# List operations
+@command("LPUSH", -3, [WRITE, DENYOOM, FAST])
+def lpush_command(db, cmd):
+    return db.lpush(cmd[1], *cmd[2:])
+
+
+@command("RPUSH", -3, [WRITE, DENYOOM, FAST])
+def rpush_command(db, cmd):
+    return db.rpush(cmd[1], *cmd[2:])
+
+
+@command("LPOP", 2, [WRITE, FAST])
+def lpop_command(db, cmd):
+    return db.lpop(cmd[1])
+
+
+@command("RPOP", 2, [WRITE, FAST])
+def rpop_command(db, cmd):
+    return db.rpop(cmd[1])
+
+
+def _direction(value: str) -> str:
+    direction = value.upper()
+    if direction != "LEFT" and direction != "RIGHT":
+        raise ValueError("syntax error")
+    return direction
+
+
+@command("LMOVE", 5, [WRITE, DENYOOM, MULTI_KEY], last_key=2)
+def lmove_command(db, cmd):
+    """LMOVE source destination LEFT|RIGHT LEFT|RIGHT"""
+    return db.lmove(cmd[1], cmd[2], _direction(cmd[3]), _direction(cmd[4]))
+
+
+# Blocking commands. Here they never block: with nothing to pop the reply is
+# nil (a null array for BLPOP/BRPOP, as in Redis), which is also what they do
+# inside MULTI. On a client connection the session parks the client on its
+# keys instead (see server/blocking.py), and the same reply is its timeout reply.
+def blocking_timeout(cmd) -> float:
+    """The timeout of a blocking command (its last argument) in seconds; 0 waits forever"""
+    try:
+        timeout = float(cmd[-1])
+    except ValueError:
+        timeout = math.nan
+    if not math.isfinite(timeout):
+        raise ValueError("timeout is not a float or out of range")
+    if timeout < 0:
+        raise ValueError("timeout is negative")
+    return timeout
+
+
+def popped_nothing(reply) -> bool:
+    """Whether a blocking command's reply means there was nothing to pop"""
+    return reply is None or reply is NULL_ARRAY
+
+
+def _pop_first(pop, keys):
+    """[key, element] popped from the first non-empty list, or NULL_ARRAY"""
+    for key in keys:
+        element = pop(key)
+        if element is not None:
+            return [key, element]
+    return NULL_ARRAY
+
+
+@command("BLPOP", -3, [WRITE, MULTI_KEY, BLOCKING], last_key=-2)
+def blpop_command(db, cmd):
+    """BLPOP key [key ...] timeout"""
+    blocking_timeout(cmd)
+    return _pop_first(db.lpop, cmd[1:-1])
+
+
+@command("BRPOP", -3, [WRITE, MULTI_KEY, BLOCKING], last_key=-2)
+def brpop_command(db, cmd):
+    """BRPOP key [key ...] timeout"""
+    blocking_timeout(cmd)
+    return _pop_first(db.rpop, cmd[1:-1])
+
+
+@command("BLMOVE", 6, [WRITE, DENYOOM, MULTI_KEY, BLOCKING], last_key=2)
+def blmove_command(db, cmd):
+    """BLMOVE source destination LEFT|RIGHT LEFT|RIGHT timeout"""
+    blocking_timeout(cmd)
+    return db.lmove(cmd[1], cmd[2], _direction(cmd[3]), _direction(cmd[4]))
+
+
+@command("LRANGE", 4, [READONLY])
+def lrange_command(db, cmd):
+    return db.lrange(cmd[1], int(cmd[2]), int(cmd[3]))
+
+
+@command("LLEN", 2, [READONLY, FAST])
+def llen_command(db, cmd):
+    return db.llen(cmd[1])
+
+
+@command("LINDEX", 3, [READONLY])
+def lindex_command(db, cmd):
+    return db.lindex(cmd[1], int(cmd[2]))
+
+
+@command("LSET", 4, [WRITE, DENYOOM])
+def lset_command(db, cmd):
+    db.lset(cmd[1], int(cmd[2]), cmd[3])
+    return OK
+
+
+@command("LTRIM", 4, [WRITE])
+def ltrim_command(db, cmd):
+    db.ltrim(cmd[1], int(cmd[2]), int(cmd[3]))
+    return OK
+
+
+@command("LINSERT", 5, [WRITE, DENYOOM])
+def linsert_command(db, cmd):
+    where = cmd[2].upper()
+    if where not in ("BEFORE", "AFTER"):
+        return ErrorReply("ERR syntax error")
+    return db.linsert(cmd[1], where == "BEFORE", cmd[3], cmd[4])
+
+
+# Hash operations
+@command("HSET", -4, [WRITE, DENYOOM, FAST])
+def hset_command(db, cmd):
+    if len(cmd) % 2:
+        return ErrorReply("ERR wrong number of arguments for 'hset' command")
+    values = cmd[2:]
+    hash_dict = {}
+    for i in range(0, len(values), 2):
+        hash_dict[values[i]] = values[i + 1]
+    return db.hset(cmd[1], hash_dict)
+
+
+@command("HINCRBY", 4, [WRITE, DENYOOM, FAST])
+def hincrby_command(db, cmd):
+    return db.hincrby(cmd[1], cmd[2], int(cmd[3]))
+
+
+@command("HGET", 3, [READONLY, FAST])
+def hget_command(db, cmd):
+    return db.hget(cmd[1], cmd[2])
+
+
+@command("HMGET", -3, [READONLY, FAST])
+def hmget_command(db, cmd):
+    return db.hmget(cmd[1], *cmd[2:])
+
+
+@command("HGETALL", 2, [READONLY])
+def hgetall_command(db, cmd):
+    return dict(db.hgetall(cmd[1]).items())
+
+
+@command("HSCAN", -3, [READONLY])
+def hscan_command(db, cmd):
+    """HSCAN key cursor [MATCH pattern] [COUNT count]"""
+    options = _scan_options(cmd[3:], ("MATCH", "COUNT"))
+    cursor, pairs = db.hscan(cmd[1], _cursor(cmd[2]), options.get("MATCH"), options["COUNT"])
+    return [str(cursor), pairs]
+
+
+@command("HDEL", -3, [WRITE, FAST])
+def hdel_command(db, cmd):
+    return db.hdel(cmd[1], *cmd[2:])
+
+
+@command("HLEN", 2, [READONLY, FAST])
+def hlen_command(db, cmd):
+    return db.hlen(cmd[1])
+
+
+@command("HEXISTS", 3, [READONLY, FAST])
+def hexists_command(db, cmd):
+    return int(db.hexists(cmd[1], cmd[2]))
+
+
+# Set operations
+@command("SADD", -3, [WRITE, DENYOOM, FAST])
+def sadd_command(db, cmd):
+    return db.sadd(cmd[1], *cmd[2:])
+
+
+@command("SREM", -3, [WRITE, FAST])
+def srem_command(db, cmd):
+    return db.srem(cmd[1], *cmd[2:])
+
+
+@command("SISMEMBER", 3, [READONLY, FAST])
+def sismember_command(db, cmd):
+    return db.sismember(cmd[1], cmd[2])
+
+
+@command("SMISMEMBER", -3, [READONLY, FAST])
+def smismember_command(db, cmd):
+    return db.smismember(cmd[1], *cmd[2:])
+
+
+@command("SSCAN", -3, [READONLY])
+def sscan_command(db, cmd):
+    """SSCAN key cursor [MATCH pattern] [COUNT count]"""
+    options = _scan_options(cmd[3:], ("MATCH", "COUNT"))
+    cursor, members = db.sscan(cmd[1], _cursor(cmd[2]), options.get("MATCH"), options["COUNT"])
+    return [str(cursor), members]
+
+
+@command("SMEMBERS", 2, [READONLY])
+def smembers_command(db, cmd):
+    return set(db.smembers(cmd[1]))
+
+
+@command("SCARD", 2, [READONLY, FAST])
+def scard_command(db, cmd):
+    return db.scard(cmd[1])
+
+
+@command("SRANDMEMBER", -2, [READONLY], max_args=3)
+def srandmember_command(db, cmd):
+    count = int(cmd[2]) if len(cmd) == 3 else None
+    return db.srandmember(cmd[1], count)
+
+
+@command("SPOP", -2, [WRITE, FAST], max_args=3)
+def spop_command(db, cmd):
+    """SPOP key [count]"""
+    if len(cmd) == 2:
+        return db.spop(cmd[1])
+    count = int(cmd[2])
+    if count < 0:
+        raise ValueError("value is out of range, must be positive")
+    return db.spop(cmd[1], count)
+
+
+@command("SINTER", -2, [READONLY, MULTI_KEY], last_key=-1)
+def sinter_command(db, cmd):
+    return db.sinter(*cmd[1:])
+
+
+@command("SUNION", -2, [READONLY, MULTI_KEY], last_key=-1)
+def sunion_command(db, cmd):
+    return db.sunion(*cmd[1:])
+
+
+@command("SDIFF", -2, [READONLY, MULTI_KEY], last_key=-1)
+def sdiff_command(db, cmd):
+    return db.sdiff(*cmd[1:])
+
+
+@command("SINTERSTORE", -3, [WRITE, DENYOOM, MULTI_KEY], last_key=-1)
+def sinterstore_command(db, cmd):
+    return db.sinterstore(cmd[1], *cmd[2:])
+
+
+@command("SUNIONSTORE", -3, [WRITE, DENYOOM, MULTI_KEY], last_key=-1)
+def sunionstore_command(db, cmd):
+    return db.sunionstore(cmd[1], *cmd[2:])
+
+
+@command("SDIFFSTORE", -3, [WRITE, DENYOOM, MULTI_KEY], last_key=-1)
+def sdiffstore_command(db, cmd):
+    return db.sdiffstore(cmd[1], *cmd[2:])
+
+
+def _numkeys(cmd, position: int = 1) -> int:
+    """The numkeys argument of commands such as SINTERCARD, checked against the arguments"""
+    numkeys = int(cmd[position])
+    if numkeys <= 0:
+        raise ValueError("numkeys should be greater than 0")
+    if numkeys > len(cmd) - position - 1:
+        raise ValueError("Number of keys can't be greater than number of args")
+    return numkeys
+
+
+def _sintercard_keys(cmd):
+    try:
+        return cmd[2 : 2 + _numkeys(cmd)]
+    except ValueError:
+        return []
+
+
+@command("SINTERCARD", -3, [READONLY, MULTI_KEY], first_key=0, last_key=0, key_step=0, find_keys=_sintercard_keys)
+def sintercard_command(db, cmd):
+    """SINTERCARD numkeys key [key ...] [LIMIT limit]"""
+    numkeys = _numkeys(cmd)
+    keys = cmd[2 : 2 + numkeys]
+    options = cmd[2 + numkeys :]
+    limit = 0
+    if options:
+        if len(options) != 2 or options[0].upper() != "LIMIT":
+            return ErrorReply("ERR syntax error")
+        limit = int(options[1])
+        if limit < 0:
+            raise ValueError("LIMIT can't be negative")
+    return db.sintercard(*keys, limit=limit)
+
+
+# Sorted set operations
+ZADD_FLAGS = ("NX", "XX", "GT", "LT", "CH", "INCR")
+
+
+@command("ZADD", -4, [WRITE, DENYOOM, FAST])
+def zadd_command(db, cmd):
+    """ZADD key [NX | XX] [GT | LT] [CH] [INCR] score member [score member ...]"""
+    position = 2
+    flags = set()
+    while position < len(cmd) and cmd[position].upper() in ZADD_FLAGS:
+        flags.add(cmd[position].upper())
+        position += 1
+    pairs = cmd[position:]
+    if not pairs or len(pairs) % 2:
+        return ErrorReply("ERR syntax error")
+    if "NX" in flags and "XX" in flags:
+        return ErrorReply("ERR XX and NX options at the same time are not compatible")
+    if ("GT" in flags and "LT" in flags) or ("NX" in flags and ("GT" in flags or "LT" in flags)):
+        return ErrorReply("ERR GT, LT, and/or NX options at the same time are not compatible")
+    # Every score is parsed before anything is written
+    members = {member: parse_score(score) for score, member in zip(pairs[::2], pairs[1::2])}
+    options = {flag.lower(): True for flag in flags if flag != "INCR" and flag != "CH"}
+    if "INCR" in flags:
+        if len(pairs) != 2:
+            return ErrorReply("ERR INCR option supports a single increment-element pair")
+        (member, increment), = members.items()
+        return db.zincrby(cmd[1], increment, member, **options)
+    return db.zadd(cmd[1], members, ch="CH" in flags, **options)
+
+
+@command("ZINCRBY", 4, [WRITE, DENYOOM, FAST])
+def zincrby_command(db, cmd):
+    return db.zincrby(cmd[1], parse_score(cmd[2]), cmd[3])
+
+
+@command("ZREM", -3, [WRITE, FAST])
+def zrem_command(db, cmd):
+    return db.zrem(cmd[1], *cmd[2:])
+
+
+@command("ZSCORE", 3, [READONLY, FAST])
+def zscore_command(db, cmd):
+    return db.zscore(cmd[1], cmd[2])
+
+
+@command("ZRANK", 3, [READONLY, FAST])
+def zrank_command(db, cmd):
+    return db.zrank(cmd[1], cmd[2])
+
+
+@command("ZCARD", 2, [READONLY, FAST])
+def zcard_command(db, cmd):
+    return db.zcard(cmd[1])
+
+
+def _with_scores(pairs, withscores: bool) -> list:
+    """(member, score) pairs as a reply: members only, or member, score, member, score, ..."""
+    if not withscores:
+        return [member for member, _ in pairs]
+    reply = []
+    for member, score in pairs:
+        reply.append(member)
+        reply.append(score)
+    return reply
+
+
+def _range_options(args, allowed) -> dict:
+    """Trailing ZRANGE-style options: flags map to True, LIMIT to (offset, count)"""
+    options = {}
+    i = 0
+    while i < len(args):
+        name = args[i].upper()
+        if name not in allowed:
+            raise ValueError("syntax error")
+        if name == "LIMIT":
+            if i + 2 >= len(args):
+                raise ValueError("syntax error")
+            options[name] = (int(args[i + 1]), int(args[i + 2]))
+            i += 3
+        else:
+            options[name] = True
+            i += 1
+    return options
+
+
+@command("ZRANGE", -4, [READONLY])
+def zrange_command(db, cmd):
+    """ZRANGE key start stop [BYSCORE] [REV] [LIMIT offset count] [WITHSCORES]"""
+    options = _range_options(cmd[4:], ("BYSCORE", "REV", "LIMIT", "WITHSCORES"))
+    reverse = options.get("REV", False)
+    if options.get("BYSCORE"):
+        # With REV the range is written from the highest score down, as in Redis
+        start, stop = (cmd[3], cmd[2]) if reverse else (cmd[2], cmd[3])
+        offset, count = options.get("LIMIT", (0, -1))
+        pairs = db.zrangebyscore(cmd[1], ScoreRange.parse(start, stop), offset, count, reverse)
+    elif "LIMIT" in options:
+        return ErrorReply("ERR syntax error, LIMIT is only supported in combination with BYSCORE")
+    else:
+        pairs = db.zrange(cmd[1], int(cmd[2]), int(cmd[3]), reverse)
+    return _with_scores(pairs, options.get("WITHSCORES", False))
+
+
+@command("ZRANGEBYSCORE", -4, [READONLY])
+def zrangebyscore_command(db, cmd):
+    """ZRANGEBYSCORE key min max [WITHSCORES] [LIMIT offset count]"""
+    options = _range_options(cmd[4:], ("LIMIT", "WITHSCORES"))
+    offset, count = options.get("LIMIT", (0, -1))
+    pairs = db.zrangebyscore(cmd[1], ScoreRange.parse(cmd[2], cmd[3]), offset, count)
+    return _with_scores(pairs, options.get("WITHSCORES", False))
+
+
+@command("ZPOPMIN", -2, [WRITE, FAST], max_args=3)
+def zpopmin_command(db, cmd):
+    """ZPOPMIN key [count]"""
+    count = int(cmd[2]) if len(cmd) == 3 else 1
+    if count < 0:
+        raise ValueError("value is out of range, must be positive")
+    return _with_scores(db.zpopmin(cmd[1], count), True)
+
+
+# General operations
+@command("DEL", -2, [WRITE, MULTI_KEY], last_key=-1)
+def del_command(db, cmd):
+    if len(cmd) == 2:
+        return int(db.delete(cmd[1]))
+    return db.delete_many(*cmd[1:])
+
+
+@command("KEYS", 2, [READONLY, KEYSPACE], first_key=0, last_key=0, key_step=0)
+def keys_command(db, cmd):
+    return db.keys(cmd[1])
+
+
+def _cursor(value: str) -> int:
+    try:
+        cursor = int(value)
+    except ValueError:
+        cursor = -1
+    if cursor < 0:
+        raise ValueError("invalid cursor")
+    return cursor
+
+
+def _scan_options(args, allowed) -> dict:
+    """[MATCH pattern] [COUNT count] [TYPE type] options of the SCAN family"""
+    if len(args) % 2:
+        raise ValueError("syntax error")
+    options = {"COUNT": DEFAULT_SCAN_COUNT}
+    for i in range(0, len(args), 2):
+        name = args[i].upper()
+        if name not in allowed:
+            raise ValueError("syntax error")
+        options[name] = args[i + 1]
+    options["COUNT"] = int(options["COUNT"])
+    if options["COUNT"] < 1:
+        raise ValueError("syntax error")
+    return options
+
+
+@command("SCAN", -2, [READONLY, KEYSPACE], first_key=0, last_key=0, key_step=0)
+def scan_command(db, cmd):
+    """SCAN cursor [MATCH pattern] [COUNT count] [TYPE type]"""
+    options = _scan_options(cmd[2:], ("MATCH", "COUNT", "TYPE"))
+    type_name = options.get("TYPE")
+    cursor, keys = db.scan(_cursor(cmd[1]), options.get("MATCH"), options["COUNT"], type_name and type_name.lower())
+    return [str(cursor), keys]
+
+
+@command("TYPE", 2, [READONLY, FAST])
+def type_command(db, cmd):
+    return SimpleString(db.type(cmd[1]) or "none")
+
+
+@command("OBJECT", 3, [READONLY], first_key=2, last_key=2)
+def object_command(db, cmd):
+    """OBJECT ENCODING key"""
+    if cmd[1].upper() != "ENCODING":
+        return ErrorReply(f"ERR unknown subcommand '{cmd[1]}'")
+    return db.object_encoding(cmd[2])
+
+
+# Expiry
+@command("EXPIRE", 3, [WRITE, FAST])
+def expire_command(db, cmd):
+    return int(db.expire(cmd[1], int(cmd[2])))
+
+
+@command("PEXPIRE", 3, [WRITE, FAST])
+def pexpire_command(db, cmd):
+    return int(db.pexpire(cmd[1], int(cmd[2])))
+
+
+@command("PERSIST", 2, [WRITE, FAST])
+def persist_command(db, cmd):
+    return int(db.persist(cmd[1]))
+
+
+@command("TTL", 2, [READONLY, FAST])
+def ttl_command(db, cmd):
+    return db.ttl(cmd[1])
+
+
+@command("PTTL", 2, [READONLY, FAST])
+def pttl_command(db, cmd):
+    return db.pttl(cmd[1])
+
+
+# Persistence
+@command("SAVE", 1, [ADMIN, KEYSPACE], first_key=0, last_key=0, key_step=0)
+def save_command(db, cmd):
+    db.save()
+    return OK
+
+
+@command("BGSAVE", 1, [ADMIN, KEYSPACE], first_key=0, last_key=0, key_step=0)
+def bgsave_command(db, cmd):
+    db.bgsave()
+    return SimpleString("Background saving started")
+
+
+@command("INFO", -1, [READONLY, KEYSPACE], first_key=0, last_key=0, key_step=0, max_args=2)
+def info_command(db, cmd):
+    sections = db.info()
+    if len(cmd) == 2:
+        section = cmd[1].lower()
+        if section not in sections:
+            return ""
+        sections = {section: sections[section]}
+    return "\n\n".join(
+        f"# {name.capitalize()}\n"
+        + "\n".join(f"{field}:{value}" for field, value in fields.items())
+        for name, fields in sections.items()
+    )
+
+
+# Configuration: parameter -> (getter, setter)
+CONFIG_PARAMETERS = {
+    "maxmemory": (
+        lambda db: db.maxmemory,
+        lambda db, value: db.configure_memory(maxmemory=parse_memory(value)),
+    ),
+    "maxmemory-policy": (
+        lambda db: db.maxmemory_policy,
+        lambda db, value: db.configure_memory(policy=value.lower()),
+    ),
+    "maxmemory-samples": (
+        lambda db: db.maxmemory_samples,
+        lambda db, value: db.configure_memory(samples=int(value)),
+    ),
+}
+
+
+@command("CONFIG", -2, [ADMIN, KEYSPACE], first_key=0, last_key=0, key_step=0)
+def config_command(db, cmd):
+    """CONFIG GET pattern [pattern ...] | CONFIG SET parameter value [parameter value ...]"""
+    sub = cmd[1].upper()
+    if sub == "GET" and len(cmd) >= 3:
+        patterns = [pattern.lower() for pattern in cmd[2:]]
+        return {
+            name: str(getter(db))
+            for name, (getter, _) in CONFIG_PARAMETERS.items()
+            if any(fnmatchcase(name, pattern) for pattern in patterns)
+        }
+    if sub == "SET" and len(cmd) >= 4 and len(cmd) % 2 == 0:
+        pairs = [(cmd[i].lower(), cmd[i + 1]) for i in range(2, len(cmd), 2)]
+        for name, _ in pairs:
+            if name not in CONFIG_PARAMETERS:
+                return ErrorReply(f"ERR Unknown option or number of arguments for CONFIG SET - '{name}'")
+        for name, value in pairs:
+            CONFIG_PARAMETERS[name][1](db, value)
+        return OK
+    return ErrorReply(f"ERR unknown subcommand or wrong number of arguments for '{cmd[1]}'")
+
+
+# Connection
+@command("PING", -1, [FAST], first_key=0, last_key=0, key_step=0, max_args=2)
+def ping_command(db, cmd):
+    return cmd[1] if len(cmd) == 2 else SimpleString("PONG")
+
+
+@command("ECHO", 2, [FAST], first_key=0, last_key=0, key_step=0)
+def echo_command(db, cmd):
+    return cmd[1]
+
+
+# Session commands are executed by ClientContext; registered here for lookup and introspection
+for _name, _arity in (("MULTI", 1), ("EXEC", 1), ("DISCARD", 1), ("HELLO", -1)):
+    command(_name, _arity, [CONNECTION, FAST], first_key=0, last_key=0, key_step=0)(None)
+command("WATCH", -2, [CONNECTION, FAST], last_key=-1)(None)
+command("UNWATCH", 1, [CONNECTION, FAST], first_key=0, last_key=0, key_step=0)(None)
+
+# Pub/Sub lives in the server (server/pubSub.py), outside the keyspace
+for _name, _arity in (("SUBSCRIBE", -2), ("PSUBSCRIBE", -2), ("UNSUBSCRIBE", -1), ("PUNSUBSCRIBE", -1)):
+    command(_name, _arity, [CONNECTION], first_key=0, last_key=0, key_step=0)(None)
+command("PUBLISH", 3, [CONNECTION, FAST], first_key=0, last_key=0, key_step=0)(None)
+
+# Replication (server/replication.py)
+command("REPLICAOF", 3, [CONNECTION, ADMIN], first_key=0, last_key=0, key_step=0)(None)
+command("REPLCONF", -1, [CONNECTION, ADMIN], first_key=0, last_key=0, key_step=0)(None)
+command("SYNC", 1, [CONNECTION, ADMIN], first_key=0, last_key=0, key_step=0)(None)
+
+
+# Introspection
+@command("COMMAND", -1, [ADMIN], first_key=0, last_key=0, key_step=0)
+def command_command(db, cmd):
+    if len(cmd) == 1:
+        return [spec.info() for spec in COMMANDS.values()]
+    sub = cmd[1].upper()
+    if sub == "COUNT" and len(cmd) == 2:
+        return len(COMMANDS)
+    if sub == "LIST" and len(cmd) == 2:
+        return [name.lower() for name in COMMANDS]
+    if sub == "INFO":
+        names = cmd[2:] or list(COMMANDS)
+        return [spec.info() if (spec := COMMANDS.get(name.upper())) else None for name in names]
+    if sub == "DOCS":
+        # No documentation is bundled; clients such as redis-cli only use it for hints
+        return {}
+    return ErrorReply(f"ERR unknown subcommand '{cmd[1]}'")
@@ -0,0 +1,420 @@
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+# Magic header written at the start of every binary WAL file
+BINARY_MAGIC = b"PKWAL\x01\n"
+
+# Frame header: payload length, CRC32 of payload
+_FRAME = struct.Struct("<II")
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+# Opcode -> (operation, fields in encoding order). Entries whose fields do not
+# match the table are written with the generic opcode, which spells out the
+# operation name and every field.
+GENERIC_OPCODE = 0
+OPCODES: Dict[int, Tuple[str, Tuple[str, ...]]] = {
+    1: ("SET", ("value",)),
+    2: ("DEL", ()),
+    3: ("LPUSH", ("values",)),
+    4: ("RPUSH", ("values",)),
+    5: ("LPOP", ()),
+    6: ("RPOP", ()),
+    7: ("HSET", ("fields",)),
+    8: ("HDEL", ("fields",)),
+    9: ("SADD", ("members",)),
+    10: ("SREM", ("members",)),
+    11: ("SPOP", ("member",)),
+    12: ("LSET", ("index", "element")),
+    13: ("LTRIM", ("start", "stop")),
+    14: ("LINSERT", ("index", "element")),
+    15: ("PEXPIREAT", ("at",)),
+    16: ("PERSIST", ()),
+    17: ("INCRBY", ("delta",)),
+    18: ("INCRBYFLOAT", ("delta",)),
+    19: ("HINCRBY", ("field", "delta")),
+    # 20 is BATCH_OPCODE
+    21: ("ZADD", ("members",)),
+    22: ("ZREM", ("members",)),
+}
+# Several records written (and replayed) as one unit: {"operation": "BATCH", "key": "", "records": [...]}
+BATCH_OPERATION = "BATCH"
+BATCH_OPCODE = 20
+_OPCODES_BY_NAME = {name: (code, fields) for code, (name, fields) in OPCODES.items()}
+
+# Operations whose record alone determines the key's value
+FULL_STATE_OPERATIONS = ("SET", "DEL")
+
+# skip(key, end_offset) -> True to drop a record without decoding its payload.
+# Batches are never offered to it: their records are filtered one by one.
+SkipFn = Optional[Callable[[str, int], bool]]
+
+# Start of a line written by JsonWalCodec.encode: operation, key (JSON-escaped)
+# and whether a value object follows
+_JSON_HEAD = re.compile(rb'\{"operation": "([^"\\]*)", "key": "((?:[^"\\]|\\.)*)"(, "value": \{)?')
+
+
+def is_full_state_record(record: Dict) -> bool:
+    """True if the record alone determines its key's value (nothing logged before it matters)"""
+    if record.get("operation") in FULL_STATE_OPERATIONS:
+        return True
+    # Collection writes from before delta records carried the full typed value
+    value = record.get("value")
+    return isinstance(value, dict) and "type" in value
+
+
+def _encode_str(value: str) -> bytes:
+    # surrogatepass keeps arbitrary Python strings (including binary-safe ones) round-trippable
+    raw = value.encode("utf-8", "surrogatepass")
+    return _U32.pack(len(raw)) + raw
+
+
+def _encode_value(value: Any, out: list):
+    """Append a tagged encoding of a JSON-like value to out"""
+    if isinstance(value, str):
+        out.append(b"s")
+        out.append(_encode_str(value))
+    elif value is None:
+        out.append(b"n")
+    elif value is True:
+        out.append(b"t")
+    elif value is False:
+        out.append(b"f")
+    elif isinstance(value, int):
+        out.append(b"i")
+        out.append(_I64.pack(value))
+    elif isinstance(value, float):
+        out.append(b"d")
+        out.append(_F64.pack(value))
+    elif isinstance(value, (bytes, bytearray)):
+        out.append(b"b")
+        out.append(_U32.pack(len(value)))
+        out.append(bytes(value))
+    elif isinstance(value, dict):
+        out.append(b"m")
+        out.append(_U32.pack(len(value)))
+        for k, v in value.items():
+            out.append(_encode_str(k))
+            _encode_value(v, out)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        out.append(b"l")
+        out.append(_U32.pack(len(value)))
+        for item in value:
+            _encode_value(item, out)
+    else:
+        raise TypeError(f"cannot encode {type(value).__name__} in binary WAL")
+
+
+def _decode_str(buf: memoryview, pos: int) -> Tuple[str, int]:
+    (length,) = _U32.unpack_from(buf, pos)
+    pos += 4
+    return str(buf[pos : pos + length], "utf-8", "surrogatepass"), pos + length
+
+
+def _decode_value(buf: memoryview, pos: int) -> Tuple[Any, int]:
+    tag = buf[pos]
+    pos += 1
+    if tag == 0x73:  # s
+        return _decode_str(buf, pos)
+    if tag == 0x6E:  # n
+        return None, pos
+    if tag == 0x74:  # t
+        return True, pos
+    if tag == 0x66:  # f
+        return False, pos
+    if tag == 0x69:  # i
+        return _I64.unpack_from(buf, pos)[0], pos + 8
+    if tag == 0x64:  # d
+        return _F64.unpack_from(buf, pos)[0], pos + 8
+    if tag == 0x62:  # b
+        (length,) = _U32.unpack_from(buf, pos)
+        pos += 4
+        return bytes(buf[pos : pos + length]), pos + length
+    if tag == 0x6D:  # m
+        (count,) = _U32.unpack_from(buf, pos)
+        pos += 4
+        result = {}
+        for _ in range(count):
+            k, pos = _decode_str(buf, pos)
+            result[k], pos = _decode_value(buf, pos)
+        return result, pos
+    if tag == 0x6C:  # l
+        (count,) = _U32.unpack_from(buf, pos)
+        pos += 4
+        items = []
+        for _ in range(count):
+            item, pos = _decode_value(buf, pos)
+            items.append(item)
+        return items, pos
+    raise ValueError(f"unknown value tag {tag!r}")
+
+
+class JsonWalCodec:
+    """One JSON object per line (the original WAL format)"""
+
+    name = "json"
+    header = b""
+
+    def encode(self, entry: Dict) -> bytes:
+        return (json.dumps(entry) + "\n").encode()
+
+    @staticmethod
+    def peek(line: bytes) -> Optional[Tuple[str, str, bool]]:
+        """
+        (operation, key, whether a value object follows) of a line written by
+        encode, matched without parsing the rest of it; None for other lines
+        """
+        match = _JSON_HEAD.match(line)
+        if match is None:
+            return None
+        op, key, value = match.groups()
+        key = json.loads(b'"' + key + b'"') if b"\\" in key else key.decode()
+        return op.decode(), key, value is not None
+
+    def iter_records(self, wal_file: BinaryIO, skip: SkipFn = None) -> Iterator[Tuple[Dict, int]]:
+        """
+        Yield (record, end_offset) pairs. Corrupt lines are skipped. Lines
+        rejected by skip are dropped after matching only their operation and key.
+        """
+        offset = wal_file.tell()
+        for line in wal_file:
+            offset += len(line)
+            head = self.peek(line) if skip is not None else None
+            if head is not None and head[0] != BATCH_OPERATION and skip(head[1], offset):
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Skipping corrupt WAL entry.")
+                continue
+            if (
+                skip is None
+                or head is not None
+                or record.get("operation") == BATCH_OPERATION
+                or not skip(record.get("key"), offset)
+            ):
+                yield record, offset
+
+    def iter_keys(self, wal_file: BinaryIO) -> Iterator[Tuple[str, bool, int]]:
+        """
+        Yield (key, is_full_state, end_offset) for every record, and for each
+        record of a batch (at the batch's offset). Only batches and records
+        carrying a value object other than SET's are parsed in full.
+        """
+        offset = wal_file.tell()
+        for line in wal_file:
+            offset += len(line)
+            head = self.peek(line)
+            if head is not None:
+                op, key, has_value = head
+                if op in FULL_STATE_OPERATIONS or (op != BATCH_OPERATION and not has_value):
+                    yield key, op in FULL_STATE_OPERATIONS, offset
+                    continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            batched = record["records"] if record.get("operation") == BATCH_OPERATION else (record,)
+            for item in batched:
+                yield item.get("key"), is_full_state_record(item), offset
+
+
+class BinaryWalCodec:
+    """Length-prefixed, CRC32-checked frames with a compact opcode per record"""
+
+    name = "binary"
+    header = BINARY_MAGIC
+
+    def encode(self, entry: Dict) -> bytes:
+        payload = self._encode_payload(entry)
+        return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _encode_payload(self, entry: Dict) -> bytes:
+        out = []
+        op = entry["operation"]
+        spec = _OPCODES_BY_NAME.get(op)
+        extra = entry.keys() - {"operation", "key"}
+        if op == BATCH_OPERATION:
+            # Batched records keep their compact opcodes, nested as raw payloads in one frame
+            out.append(bytes((BATCH_OPCODE,)))
+            out.append(_encode_str(entry["key"]))
+            _encode_value([self._encode_payload(record) for record in entry["records"]], out)
+        elif spec is not None and extra.issubset(spec[1]):
+            code, fields = spec
+            out.append(bytes((code,)))
+            out.append(_encode_str(entry["key"]))
+            for field in fields:
+                _encode_value(entry.get(field), out)
+        else:
+            out.append(bytes((GENERIC_OPCODE,)))
+            out.append(_encode_str(op))
+            out.append(_encode_str(entry["key"]))
+            _encode_value({field: entry[field] for field in extra}, out)
+        return b"".join(out)
+
+    def decode(self, payload: memoryview) -> Dict:
+        code = payload[0]
+        if code == BATCH_OPCODE:
+            key, pos = _decode_str(payload, 1)
+            payloads, pos = _decode_value(payload, pos)
+            records = [self.decode(memoryview(record)) for record in payloads]
+            return {"operation": BATCH_OPERATION, "key": key, "records": records}
+        if code == GENERIC_OPCODE:
+            op, pos = _decode_str(payload, 1)
+            key, pos = _decode_str(payload, pos)
+            fields, pos = _decode_value(payload, pos)
+            entry = {"operation": op, "key": key}
+            entry.update(fields)
+            return entry
+
+        op, fields = OPCODES[code]
+        key, pos = _decode_str(payload, 1)
+        entry = {"operation": op, "key": key}
+        for field in fields:
+            value, pos = _decode_value(payload, pos)
+            if value is not None:
+                entry[field] = value
+        return entry
+
+    def peek(self, payload: memoryview) -> Tuple[str, str]:
+        """Decode only the (operation, key) of a payload"""
+        code = payload[0]
+        if code == GENERIC_OPCODE:
+            op, pos = _decode_str(payload, 1)
+            return op, _decode_str(payload, pos)[0]
+        if code == BATCH_OPCODE:
+            return BATCH_OPERATION, _decode_str(payload, 1)[0]
+        return OPCODES[code][0], _decode_str(payload, 1)[0]
+
+    def iter_records(self, wal_file: BinaryIO, skip: SkipFn = None) -> Iterator[Tuple[Dict, int]]:
+        """
+        Yield (record, end_offset) pairs. Iteration stops at the first frame that
+        is truncated or fails its checksum; callers can compare the last offset
+        with the file size to detect it, and find_frame tells a torn tail from
+        corruption with intact records after it. Records rejected by skip are
+        dropped after decoding only their key.
+        """
+        for payload, offset in self._iter_frames(wal_file):
+            try:
+                if skip is not None and payload[0] != BATCH_OPCODE and skip(self.peek(payload)[1], offset):
+                    continue
+                yield self.decode(payload), offset
+            except (ValueError, KeyError, struct.error) as e:
+                logger.warning(f"Skipping undecodable WAL entry at offset {offset}: {e}")
+
+    def iter_keys(self, wal_file: BinaryIO) -> Iterator[Tuple[str, bool, int]]:
+        """
+        Yield (key, is_full_state, end_offset) for every record, and for each
+        record of a batch (at the batch's offset), without decoding values
+        """
+        for payload, offset in self._iter_frames(wal_file):
+            try:
+                if payload[0] == BATCH_OPCODE:
+                    heads = [self.peek(batched) for batched in self._batched_payloads(payload)]
+                else:
+                    heads = [self.peek(payload)]
+            except (ValueError, KeyError, struct.error):
+                continue
+            for op, key in heads:
+                yield key, op in FULL_STATE_OPERATIONS, offset
+
+    @staticmethod
+    def _batched_payloads(payload: memoryview) -> Iterator[memoryview]:
+        """The record payloads nested in a BATCH payload, as views into it"""
+        _, pos = _decode_str(payload, 1)
+        # A list ("l", count) of byte strings ("b", length, payload)
+        (count,) = _U32.unpack_from(payload, pos + 1)
+        pos += 5
+        for _ in range(count):
+            (length,) = _U32.unpack_from(payload, pos + 1)
+            pos += 5
+            yield payload[pos : pos + length]
+            pos += length
+
+    def _iter_frames(self, wal_file: BinaryIO) -> Iterator[Tuple[memoryview, int]]:
+        offset = wal_file.tell()
+        while True:
+            frame = wal_file.read(_FRAME.size)
+            if not frame:
+                return
+            if len(frame) < _FRAME.size:
+                logger.warning(f"Torn WAL frame header at offset {offset}")
+                return
+            length, crc = _FRAME.unpack(frame)
+            payload = wal_file.read(length)
+            # Every record has an opcode, so an empty payload is as bad as a wrong CRC
+            if not length or len(payload) < length or zlib.crc32(payload) != crc:
+                logger.warning(f"WAL checksum mismatch at offset {offset}, stopping replay")
+                return
+            offset += _FRAME.size + length
+            yield memoryview(payload), offset
+
+    def find_frame(self, wal_file: BinaryIO, offset: int) -> Optional[int]:
+        """
+        Offset of the first intact frame after the bad one at offset, or None if
+        nothing valid follows it (a torn tail). The position the bad frame's
+        length points to is tried first, which finds the next record at once
+        when only a payload was damaged; otherwise every byte after it is.
+        """
+        size = os.fstat(wal_file.fileno()).st_size
+        if size <= offset + _FRAME.size:
+            return None
+        with mmap.mmap(wal_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            length, _ = _FRAME.unpack_from(data, offset)
+            declared = offset + _FRAME.size + length
+            if declared < size and self._is_frame(data, declared):
+                return declared
+            for position in range(offset + 1, size - _FRAME.size):
+                if self._is_frame(data, position):
+                    return position
+        return None
+
+    def _is_frame(self, data: mmap.mmap, position: int) -> bool:
+        """True if an intact, decodable frame starts at position"""
+        length, crc = _FRAME.unpack_from(data, position)
+        end = position + _FRAME.size + length
+        if not length or end > len(data):
+            return False
+        payload = data[position + _FRAME.size : end]
+        if zlib.crc32(payload) != crc:
+            return False
+        try:
+            self.peek(memoryview(payload))
+        except (ValueError, KeyError, IndexError, struct.error):
+            return False
+        return True
+
+
+WAL_CODECS = {
+    JsonWalCodec.name: JsonWalCodec,
+    BinaryWalCodec.name: BinaryWalCodec,
+}
+
+
+def get_wal_codec(wal_format: str):
+    """Return a codec instance for the given format name ("json" or "binary")"""
+    try:
+        return WAL_CODECS[wal_format]()
+    except KeyError:
+        raise ValueError(f"Unknown WAL format: {wal_format}") from None
+
+
+def detect_wal_format(path: str, default: str) -> str:
+    """Detect the format of an existing WAL file from its header"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(len(BINARY_MAGIC))
+    except FileNotFoundError:
+        return default
+    if not head:
+        return default
+    return BinaryWalCodec.name if head == BINARY_MAGIC else JsonWalCodec.name
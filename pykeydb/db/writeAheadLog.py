@@ -1,18 +1,33 @@
+import json
 import threading
 import os
-from typing import Dict, List, Optional, Any
-import json
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Any, Tuple
 from logging import getLogger
-from pykeydb.db.dataTypes import DataType
+from pykeydb.db.walCodec import BATCH_OPERATION, get_wal_codec, detect_wal_format
 
 logger = getLogger(__name__)
 
+# Durability policies (when WAL records reach the disk):
+#   always   - fsync before the write is acknowledged, batched across writers (group commit)
+#   everysec - fsync once per second in a background thread
+#   no       - never fsync, the OS decides when to write back
+FSYNC_POLICIES = ("always", "everysec", "no")
+EVERYSEC_INTERVAL = 1.0
+
+# First record of a rotated WAL. Its epoch tells replay which snapshot the log continues from.
+EPOCH_OPERATION = "EPOCH"
+
+
+class WalCorruptedError(RuntimeError):
+    """The WAL is damaged part way through, with intact records after the damage"""
+
 
 class WriteAheadLog:
     _instances: Dict[str, 'WriteAheadLog'] = {}
     _lock = threading.Lock()
 
-    def __new__(cls, path="wal.log", use_fsync=False):
+    def __new__(cls, path="wal.log", use_fsync=False, wal_format="json", fsync_policy=None):
         with cls._lock:
             if path not in cls._instances:
                 instance = super().__new__(cls)
@@ -20,18 +35,58 @@ class WriteAheadLog:
                 cls._instances[path] = instance
             return cls._instances[path]
 
-    def __init__(self, path="wal.log", use_fsync=False):
+    def __init__(self, path="wal.log", use_fsync=False, wal_format="json", fsync_policy=None):
         if self._initialized:
             return
 
         with type(self)._lock:
             if self._initialized:
                 return
+            # use_fsync is the older switch, equivalent to the "always" policy
+            if fsync_policy is None:
+                fsync_policy = "always" if use_fsync else "no"
+            if fsync_policy not in FSYNC_POLICIES:
+                raise ValueError(f"Unknown fsync policy: {fsync_policy}")
             self.path = path
-            self.use_fsync = use_fsync
-            self.file_writer = open(self.path, "a+", buffering=1)
-            logger.info(f"WriteAheadLog writer initialized for path: {path}")
+            self.fsync_policy = fsync_policy
+            self.use_fsync = fsync_policy == "always"
+            # An existing file keeps the format it was created with
+            detected_format = detect_wal_format(path, wal_format)
+            if detected_format != wal_format:
+                logger.warning(
+                    f"WAL {path} is in {detected_format} format, ignoring requested {wal_format}"
+                )
+            self.codec = get_wal_codec(detected_format)
+            self.wal_format = self.codec.name
+            self.file_writer = open(self.path, "ab")
+            if self.file_writer.tell() == 0 and self.codec.header:
+                self.file_writer.write(self.codec.header)
+                self.file_writer.flush()
+            # Bytes in the log, including records still waiting for group commit
+            self.size = self.file_writer.tell()
+            self.epoch = self._read_epoch()
+            logger.info(f"WriteAheadLog writer initialized for path: {path} ({self.wal_format})")
             self.wal_lock = threading.RLock()
+
+            # Group commit state: records are numbered as they are appended, and
+            # under "always" they wait in _pending until a single flusher fsyncs them.
+            self._pending: List[bytes] = []
+            self._appended_seq = 0
+            self._durable_seq = 0
+            self._flushing = False
+            self._commit_cond = threading.Condition()
+            self._local = threading.local()
+            # Called with every encoded record, in log order, under wal_lock; the
+            # server streams them to replicas (see server/replication.py)
+            self.on_append: Optional[Callable[[bytes], None]] = None
+
+            self._stop_flusher = threading.Event()
+            self._flusher = None
+            if fsync_policy == "everysec":
+                self._flusher = threading.Thread(
+                    target=self._everysec_loop, name=f"wal-fsync-{path}", daemon=True
+                )
+                self._flusher.start()
             self._initialized = True
 
     @classmethod
@@ -44,7 +99,7 @@ class WriteAheadLog:
                     instance = cls._instances[path]
                     try:
                         if getattr(instance, "file_writer", None):
-                            instance.file_writer.close()
+                            instance.close()
                             logger.info(f"WriteAheadLog closed for path: {path}")
                     except Exception as e:
                         logger.exception(f"Failed to close WriteAheadLog for {path}: {e}")
@@ -56,71 +111,400 @@ class WriteAheadLog:
                 for p, instance in list(cls._instances.items()):
                     try:
                         if getattr(instance, "file_writer", None):
-                            instance.file_writer.close()
+                            instance.close()
                             logger.info(f"WriteAheadLog closed for path: {p}")
                     except Exception as e:
                         logger.exception(f"Failed to close WriteAheadLog for {p}: {e}")
                 cls._instances.clear()
 
-    def log_operation(
-        self, operation: str, key: str, value_dict: Optional[Dict] = None, **kwargs
-    ):
-        """Generic operation logger with type info"""
+    def close(self):
+        """Stop the background flusher, make pending records durable and close the file"""
+        self._stop_flusher.set()
+        if self._flusher is not None:
+            self._flusher.join()
         with self.wal_lock:
-            entry: Dict[str, Any] = {
-                "operation": operation,
-                "key": key,
-            }
-            if value_dict is not None:
-                entry["value"] = value_dict
-            if kwargs:
-                entry.update(kwargs)
-            self.file_writer.write(json.dumps(entry) + "\n")
-            if self.use_fsync:
-                self.file_writer.flush()
+            self._write_pending()
+            if self.fsync_policy != "no":
                 os.fsync(self.file_writer.fileno())
+            self.file_writer.close()
+
+    def log_operation(
+        self, operation: str, key: str, value_dict: Optional[Dict] = None, **kwargs
+    ) -> int:
+        """Generic operation logger with type info. Returns the record's sequence number."""
+        entry: Dict[str, Any] = {
+            "operation": operation,
+            "key": key,
+        }
+        if value_dict is not None:
+            entry["value"] = value_dict
+        if kwargs:
+            entry.update(kwargs)
+        return self._append(entry)
 
     def log_set(self, key, value):
         """Legacy method - kept for backward compatibility"""
-        with self.wal_lock:
-            entry = {"operation": "SET", "key": key, "value": value}
-            self.file_writer.write(json.dumps(entry) + "\n")
-            if self.use_fsync:
-                self.file_writer.flush()
-                os.fsync(self.file_writer.fileno())
+        return self._append({"operation": "SET", "key": key, "value": value})
 
     def log_del(self, key):
         """Legacy method - kept for backward compatibility"""
+        return self._append({"operation": "DEL", "key": key})
+
+    @contextmanager
+    def atomic_batch(self):
+        """
+        Collect the records this thread logs inside the block into one BATCH
+        record, appended when the outermost block exits. A batch is one frame
+        (one line in JSON), so replay applies all of it or, if the tail was torn,
+        none of it. The caller must hold the locks of every key logged, so no
+        other record for those keys can be appended in between.
+        """
+        local = self._local
+        if getattr(local, "batch", None) is not None:
+            yield
+            return
+        local.batch = records = []
+        try:
+            yield
+        finally:
+            local.batch = None
+            # Whatever was logged has been applied in memory, so it is written even on error
+            self._append_batch(records)
+
+    def _append_batch(self, records: List[Dict]):
+        """Append records collected by atomic_batch as one frame; the caller has ended the batch"""
+        if len(records) == 1:
+            self._append(records[0])
+        elif records:
+            self._append({"operation": BATCH_OPERATION, "key": "", "records": records})
+
+    def _append(self, entry: Dict) -> int:
+        batch = getattr(self._local, "batch", None)
+        if batch is not None:
+            batch.append(entry)
+            return getattr(self._local, "last_seq", 0)
+        data = self.codec.encode(entry)
         with self.wal_lock:
-            entry = {"operation": "DEL", "key": key}
-            self.file_writer.write(json.dumps(entry) + "\n")
-            if self.use_fsync:
+            self._appended_seq += 1
+            self.size += len(data)
+            seq = self._appended_seq
+            if self.fsync_policy == "always":
+                # Left for the group commit flusher
+                self._pending.append(data)
+            else:
+                # Flush every record to the OS (what the old line-buffered text file did)
+                self.file_writer.write(data)
                 self.file_writer.flush()
-                os.fsync(self.file_writer.fileno())
+            if self.on_append is not None:
+                self.on_append(data)
+        self._local.last_seq = seq
+
+        # Callers outside deferred_sync() wait for durability right away
+        if not getattr(self._local, "defer_depth", 0):
+            self.sync(seq)
+        return seq
+
+    @contextmanager
+    def deferred_sync(self):
+        """
+        Postpone the fsync wait for records appended in this block until it exits.
+        PyKeyDB wraps its lock in this, so writers wait for the group commit
+        after releasing the DB lock instead of while holding it.
+        """
+        local = self._local
+        local.defer_depth = getattr(local, "defer_depth", 0) + 1
+        try:
+            yield
+        finally:
+            local.defer_depth -= 1
+            if local.defer_depth == 0:
+                self.sync()
+
+    def sync(self, seq: Optional[int] = None):
+        """
+        Block until the record with the given sequence number (default: the last one
+        appended by this thread) is on disk. Only the "always" policy waits.
+
+        The first waiter that finds no flush in progress becomes the flusher: it
+        writes every pending record and fsyncs them as one batch, then wakes all
+        waiters that batch covered. Writers arriving meanwhile queue up for the next batch.
+        """
+        if self.fsync_policy != "always":
+            return
+        if seq is None:
+            seq = getattr(self._local, "last_seq", 0)
 
-    def replay(self) -> List[Dict]:
-        operations = []
+        with self._commit_cond:
+            while self._durable_seq < seq and self._flushing:
+                self._commit_cond.wait()
+            if self._durable_seq >= seq:
+                return
+            self._flushing = True
+
+        durable_seq = None
+        try:
+            with self.wal_lock:
+                durable_seq = self._write_pending()
+            # fsync outside wal_lock so new records can be appended for the next batch
+            os.fsync(self.file_writer.fileno())
+        finally:
+            with self._commit_cond:
+                self._flushing = False
+                if durable_seq is not None:
+                    self._durable_seq = max(self._durable_seq, durable_seq)
+                self._commit_cond.notify_all()
+
+    def _write_pending(self) -> int:
+        """Write buffered group-commit records to the OS. Caller holds wal_lock."""
+        if self._pending:
+            self.file_writer.write(b"".join(self._pending))
+            self._pending.clear()
+        self.file_writer.flush()
+        return self._appended_seq
+
+    def _everysec_loop(self):
+        while not self._stop_flusher.wait(EVERYSEC_INTERVAL):
+            writer = self.file_writer
+            try:
+                os.fsync(writer.fileno())
+            except (OSError, ValueError) as e:
+                # The writer may have been swapped out by rotate() mid-fsync
+                if writer is self.file_writer:
+                    logger.error(f"Background WAL fsync failed for {self.path}: {e}")
+
+    def _read_epoch(self) -> int:
+        """Epoch of the current log file (0 for logs that were never rotated)"""
+        with open(self.path, "rb") as wal_file:
+            wal_file.seek(len(self.codec.header))
+            for record, _ in self.codec.iter_records(wal_file):
+                if record.get("operation") == EPOCH_OPERATION:
+                    return record["epoch"]
+                break
+        return 0
+
+    def checkpoint(self) -> Tuple[int, int]:
+        """
+        Hand every appended record to the OS and return the (epoch, offset) position
+        the log has reached. A snapshot taken at this position covers the log up to offset.
+        """
+        # A snapshot inside an atomic batch (SAVE in MULTI/EXEC) includes what the
+        # batch has applied so far: those records must land before the checkpoint
+        batch = getattr(self._local, "batch", None)
+        if batch:
+            self._local.batch = None
+            try:
+                self._append_batch(batch[:])
+            finally:
+                batch.clear()
+                self._local.batch = batch
+        with self.wal_lock:
+            self._write_pending()
+            return self.epoch, self.file_writer.tell()
+
+    def rotate(self, base_offset: int):
+        """
+        Start a new log epoch that keeps only the records after base_offset (the
+        checkpoint a snapshot was written at). The new file is built next to the old
+        one and atomically renamed over it.
+        """
+        # Keep group commit flushers away from the file while it is swapped
+        with self._commit_cond:
+            while self._flushing:
+                self._commit_cond.wait()
+            self._flushing = True
+
+        durable_seq = None
+        try:
+            with self.wal_lock:
+                seq = self._write_pending()
+                new_epoch = self.epoch + 1
+                tmp_path = self.path + ".rewrite"
+                with open(self.path, "rb") as old_file, open(tmp_path, "wb") as new_file:
+                    new_file.write(self.codec.header)
+                    new_file.write(
+                        self.codec.encode({"operation": EPOCH_OPERATION, "key": "", "epoch": new_epoch})
+                    )
+                    old_file.seek(base_offset)
+                    while True:
+                        chunk = old_file.read(1 << 20)
+                        if not chunk:
+                            break
+                        new_file.write(chunk)
+                    new_file.flush()
+                    os.fsync(new_file.fileno())
+
+                self.file_writer.close()
+                os.replace(tmp_path, self.path)
+                fsync_directory(self.path)
+                self.file_writer = open(self.path, "ab")
+                self.size = self.file_writer.tell()
+                self.epoch = new_epoch
+                durable_seq = seq
+                logger.info(f"WAL {self.path} rotated to epoch {new_epoch} ({self.size} bytes)")
+        finally:
+            with self._commit_cond:
+                self._flushing = False
+                if durable_seq is not None:
+                    self._durable_seq = max(self._durable_seq, durable_seq)
+                self._commit_cond.notify_all()
+
+    def replay(
+        self, since: Optional[Tuple[int, int]] = None, last_writer_wins: bool = False
+    ) -> Iterator[Dict]:
+        """
+        Yield the logged records one at a time, so replay never holds the whole log
+        in memory. since=(epoch, offset) is the checkpoint a snapshot was taken at:
+        records the snapshot already contains are skipped.
+
+        With last_writer_wins, a first pass over the log finds the last full-state
+        record (SET/DEL, also inside batches) of every key, and the second pass
+        skips everything logged for that key before it. Both passes read only the
+        operation and key of a record until it is known to be needed, so
+        superseded values are never materialized, in either format.
+        """
         if not os.path.exists(self.path):
-            return operations
+            return
         with self.wal_lock:
-            with open(self.path, "r") as wal_file:
-                for line in wal_file:
-                    try:
-                        operations.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        logger.warning("Skipping corrupt WAL entry.")
-        return operations
+            self._write_pending()
+            start = self._replay_start(since)
+        if start is None:
+            return
+
+        skip = None
+        if last_writer_wins:
+            last_full_state = self._last_full_state_offsets(start)
+
+            def skip(key, end):
+                return end < last_full_state.get(key, 0)
+
+        with open(self.path, "rb") as wal_file:
+            wal_file.seek(start)
+            end = start
+            for record, end in self.codec.iter_records(wal_file, skip):
+                if record.get("operation") == BATCH_OPERATION and skip is not None:
+                    # Batches are never skipped as a whole; drop their superseded records
+                    record["records"] = [r for r in record["records"] if not skip(r["key"], end)]
+                if record.get("operation") != EPOCH_OPERATION:
+                    yield record
+        with self.wal_lock:
+            self._truncate_torn_tail(end)
+
+    def _replay_start(self, since: Optional[Tuple[int, int]]) -> Optional[int]:
+        """File offset replay starts at, or None if the snapshot already covers the whole log"""
+        start = len(self.codec.header)
+        if since is None:
+            return start
+        since_epoch, since_offset = since
+        if self.epoch == since_epoch:
+            # The snapshot was taken part way through this log file
+            return max(start, since_offset)
+        if self.epoch < since_epoch:
+            logger.warning(
+                f"WAL {self.path} (epoch {self.epoch}) is older than the snapshot "
+                f"(epoch {since_epoch}), skipping it"
+            )
+            return None
+        return start
+
+    def _last_full_state_offsets(self, start: int) -> Dict[str, int]:
+        """Map each key to the end offset of its last full-state record"""
+        offsets: Dict[str, int] = {}
+        with open(self.path, "rb") as wal_file:
+            wal_file.seek(start)
+            for key, full_state, end in self.codec.iter_keys(wal_file):
+                if full_state:
+                    offsets[key] = end
+        return offsets
+
+    def _truncate_torn_tail(self, end: int):
+        """
+        Cut off a partially written tail so new records are appended after valid
+        data. Damage with intact records after it is not a torn tail: truncating
+        would throw those away, so the file is left as it is and replay fails.
+        """
+        size = os.path.getsize(self.path)
+        if not self.codec.header:
+            self._end_json_tail(size)
+            return
+        if end >= size:
+            return
+        with open(self.path, "rb") as wal_file:
+            intact = self.codec.find_frame(wal_file, end)
+        if intact is not None:
+            message = (
+                f"WAL {self.path} is corrupt at offset {end} but has intact records from offset "
+                f"{intact}; not truncating it. Repair or move the file aside to start."
+            )
+            logger.error(message)
+            raise WalCorruptedError(message)
+        logger.warning(f"Truncating torn WAL tail of {size - end} bytes in {self.path}")
+        self.file_writer.flush()
+        self.file_writer.truncate(end)
+        self.size = end
+
+    def _end_json_tail(self, size: int):
+        """
+        Make a JSON log end with a newline again, or the next record would be
+        appended to a torn last line and be skipped along with it. A last line
+        replay could not parse is cut off; one it applied just gets its newline.
+        """
+        with open(self.path, "rb") as wal_file:
+            # Walk back to the start of the last line
+            line_start = size
+            while line_start > 0:
+                chunk_start = max(0, line_start - (1 << 16))
+                wal_file.seek(chunk_start)
+                chunk = wal_file.read(line_start - chunk_start)
+                if line_start == size and chunk.endswith(b"\n"):
+                    return
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    line_start = chunk_start + newline + 1
+                    break
+                line_start = chunk_start
+            if line_start == size:
+                return
+            wal_file.seek(line_start)
+            tail = wal_file.read()
+        self.file_writer.flush()
+        try:
+            json.loads(tail)
+        except ValueError:
+            logger.warning(f"Truncating torn WAL tail of {size - line_start} bytes in {self.path}")
+            self.file_writer.truncate(line_start)
+            self.size = line_start
+            return
+        self.file_writer.write(b"\n")
+        self.file_writer.flush()
+        self.size = size + 1
+
+
+def fsync_directory(path: str):
+    """fsync the directory holding path so a rename into it survives a crash"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        # Not supported on every platform (e.g. Windows)
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
 
 _write_ahead_logs: Dict[str, WriteAheadLog] = {}
 _wal_factory_lock = threading.Lock()
 
 
-def get_write_ahead_log(path="wal.log", use_fsync=False) -> WriteAheadLog:
+def get_write_ahead_log(
+    path="wal.log", use_fsync=False, wal_format="json", fsync_policy=None
+) -> WriteAheadLog:
     """Get or create WAL instance for the given path (singleton per path)"""
     with _wal_factory_lock:
         if path not in _write_ahead_logs:
-            _write_ahead_logs[path] = WriteAheadLog(path, use_fsync)
+            _write_ahead_logs[path] = WriteAheadLog(path, use_fsync, wal_format, fsync_policy)
         return _write_ahead_logs[path]
 
 
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from pykeydb.db.commands import Command
+from pykeydb.db.utils import blocking_timeout, call_command, popped_nothing
+
+
+class BlockedClient:
+    """A client parked by BLPOP, BRPOP or BLMOVE until one of its keys can serve it"""
+
+    __slots__ = ("spec", "command", "keys", "future", "timeout", "timeout_reply")
+
+    def __init__(
+        self, spec: Command, command: List[str], future: asyncio.Future, timeout: Optional[float], timeout_reply: Any
+    ):
+        self.spec = spec
+        self.command = command
+        self.keys = list(dict.fromkeys(spec.keys(command)))
+        # Resolved with the command's reply once a push lets it succeed
+        self.future = future
+        # Seconds to wait (None = forever), and the reply once they pass: what the
+        # command answered with nothing to pop (a null array for BLPOP/BRPOP)
+        self.timeout = timeout
+        self.timeout_reply = timeout_reply
+
+
+class BlockingKeys:
+    """
+    Clients blocked on list keys, in one FIFO queue per key. PyKeyDB reports
+    every push through on_list_push; the key is only recorded as ready there
+    (under the shard lock, possibly on another thread), and the clients
+    blocked on it are served on the event loop by serve_ready, which the
+    server calls after every command. A push inside MULTI/EXEC is therefore
+    served after EXEC, so blocked clients never see half a transaction.
+    Serving a client re-runs its command, which pops (and logs) as usual.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._blocked: Dict[str, Deque[BlockedClient]] = {}
+        # Keys pushed to while clients were blocked on them (a dict as an ordered set)
+        self._ready: Dict[str, None] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        db.on_list_push = self.key_ready
+
+    def block(self, spec: Command, command: List[str], reply: Any = None) -> BlockedClient:
+        """Park a client whose blocking command found nothing to pop (replying reply); runs on the event loop"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+        client = BlockedClient(spec, command, self._loop.create_future(), blocking_timeout(command) or None, reply)
+        for key in client.keys:
+            self._blocked.setdefault(key, deque()).append(client)
+            # A push from another thread may have landed after the command found
+            # nothing but before the client was queued: look again once
+            self._ready[key] = None
+        return client
+
+    def unblock(self, client: BlockedClient):
+        """Take a client out of every queue (served, timed out or disconnected)"""
+        for key in client.keys:
+            queue = self._blocked.get(key)
+            if queue is None:
+                continue
+            try:
+                queue.remove(client)
+            except ValueError:
+                pass
+            if not queue:
+                del self._blocked[key]
+
+    def key_ready(self, key: str):
+        """PyKeyDB.on_list_push: must not block, it runs under the key's shard lock"""
+        if key not in self._blocked:
+            return
+        if threading.get_ident() == self._loop_thread:
+            self._ready[key] = None
+        else:
+            self._loop.call_soon_threadsafe(self._wake, key)
+
+    def _wake(self, key: str):
+        self._ready[key] = None
+        self.serve_ready()
+
+    def serve_ready(self):
+        """Serve, in arrival order, the clients blocked on every key pushed to since the last call"""
+        while self._ready:
+            key = next(iter(self._ready))
+            del self._ready[key]
+            # Serving BLMOVE pushes to its destination, which may make another key ready
+            for client in list(self._blocked.get(key, ())):
+                if client.future.done():
+                    continue
+                reply = call_command(self.db, client.spec, client.command)
+                # Nothing popped: the list is empty again, or this key cannot serve
+                # the client (BLMOVE's destination); it stays queued
+                if not popped_nothing(reply):
+                    self.unblock(client)
+                    client.future.set_result(reply)
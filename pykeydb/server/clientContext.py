@@ -1,53 +1,292 @@
 from collections import deque
-from pykeydb.db.utils import apply_command
+from pykeydb.db.commands import COMMANDS
+from pykeydb.db.replies import OK, QUEUED, ErrorReply, Push, Replies
+from pykeydb.db.utils import OOM_ERROR, call_command, popped_nothing
+from pykeydb.server.protocol import PROTOCOL_VERSIONS
+from pykeydb.server.pubSub import Subscriber
+from pykeydb.server.replication import FullSync
+
+SERVER_NAME = "pykeydb"
+SERVER_VERSION = "0.1.0"
+
+# Session commands MULTI queues like any other command instead of running them at once
+QUEUEABLE_SESSION_COMMANDS = frozenset({"PUBLISH"})
+# Changing subscriptions is refused inside MULTI
+SUBSCRIPTION_COMMANDS = frozenset({"SUBSCRIBE", "PSUBSCRIBE", "UNSUBSCRIBE", "PUNSUBSCRIBE"})
+# All a subscribed RESP2 connection may send: its replies share the stream with messages
+SUBSCRIBED_MODE_COMMANDS = SUBSCRIPTION_COMMANDS | {"PING"}
 
 
 class ClientContext:
-    def __init__(self, db):
+    def __init__(self, db, blocking=None, pubsub=None, transport=None, replication=None):
         self.in_txn: bool = False
+        # Queued (Command, args) pairs
         self.txn_queue = deque()
         self.db = db
+        # Where blocking commands park the client (server/blocking.py); without it they never block
+        self.blocking = blocking
+        # RESP version negotiated with HELLO
+        self.protocol: int = 2
+        # Commands executed by the session itself rather than the DB
+        self.session_commands = {
+            "MULTI": self.multi,
+            "EXEC": self.exec,
+            "DISCARD": self.discard,
+            "HELLO": self.hello,
+            "WATCH": self.watch,
+            "UNWATCH": self.unwatch,
+        }
+        # WATCHed keys and the versions they had when watched
+        self.watched = {}
+        # Leader/replica state (server/replication.py); a replica refuses writes
+        self.replication = replication
+        # Port a replica connecting to us listens on (REPLCONF listening-port)
+        self.replica_port = None
+        if replication is not None:
+            self.session_commands.update(
+                {"REPLICAOF": self.replicaof, "REPLCONF": self.replconf, "SYNC": self.sync}
+            )
+        # Channel subscriptions (server/pubSub.py), written straight to transport;
+        # without a PubSub the pub/sub commands are unavailable
+        self.pubsub = pubsub
+        self.subscriber = None
+        if pubsub is not None:
+            self.subscriber = Subscriber(transport)
+            self.session_commands.update(
+                {
+                    "SUBSCRIBE": self.subscribe,
+                    "PSUBSCRIBE": self.psubscribe,
+                    "UNSUBSCRIBE": self.unsubscribe,
+                    "PUNSUBSCRIBE": self.punsubscribe,
+                    "PUBLISH": self.publish,
+                }
+            )
+
+    @property
+    def subscribed(self) -> bool:
+        """Whether the connection holds subscriptions (and so receives pushed messages)"""
+        return self.subscriber is not None and self.subscriber.count > 0
 
     def execute_command(self, command):
-        op = command[0].upper()
-        # If client wants to begin a transcation block
-        if op == "MULTI":
-            if self.in_txn:
-                return "ERR: Cannot be in a Nested Transaction State"
-            # Clear any previous stale transaction state
-            self.in_txn = True
-            self.txn_queue.clear()
-            return "OK"
+        # One dict lookup resolves the handler, its arity and its flags
+        spec = COMMANDS.get(command[0].upper())
+        if spec is None:
+            return ErrorReply(f"ERR unknown command '{command[0]}'")
+        if not spec.min_argc <= len(command) <= spec.max_argc:
+            return ErrorReply(f"ERR wrong number of arguments for '{command[0].lower()}' command")
 
-        # If client wants to execute the transaction (all the previous commands will be executed as one atomic operation)
-        elif op == "EXEC":
-            if not self.in_txn:
-                return "ERR: Not in Transaction Mode for EXEC"
+        # A subscribed RESP2 connection is in push mode: only subscription commands and PING
+        if self.protocol == 2 and self.subscribed and spec.name not in SUBSCRIBED_MODE_COMMANDS:
+            return ErrorReply(
+                f"ERR Can't execute '{spec.name.lower()}': only (P)SUBSCRIBE / (P)UNSUBSCRIBE / PING "
+                "are allowed in this context"
+            )
+        if self.in_txn and spec.name in SUBSCRIPTION_COMMANDS:
+            return ErrorReply("ERR Command not allowed inside a transaction")
 
-            responses = []
-            while self.txn_queue:
-                cmd = self.txn_queue.popleft()
-                response = apply_command(self.db, cmd)
-                responses.append(response)
+        session_command = self.session_commands.get(spec.name)
+        if session_command is not None and not (self.in_txn and spec.name in QUEUEABLE_SESSION_COMMANDS):
+            return session_command(command)
+
+        if spec.is_write and self.replication is not None and self.replication.is_replica:
+            return ErrorReply("READONLY You can't write against a read only replica.")
+
+        # If already in transaction mode, queue the commands
+        if self.in_txn:
+            self.txn_queue.append((spec, command))
+            return QUEUED
+
+        if spec.name == "PING" and self.subscribed and self.protocol == 2:
+            # In push mode PING is answered in the same shape as messages
+            return ["pong", command[1] if len(command) == 2 else ""]
 
+        # If not in transction mode, just apply the commands
+        reply = call_command(self.db, spec, command)
+        # A blocking command with nothing to pop parks the client (in MULTI it never blocks)
+        if spec.is_blocking and self.blocking is not None and popped_nothing(reply):
+            return self.blocking.block(spec, command, reply)
+        return reply
+
+    def close(self):
+        """Release what the connection holds in shared state once it is gone"""
+        self._unwatch_all()
+        if self.pubsub is not None:
+            self.pubsub.remove(self.subscriber)
+
+    def multi(self, command):
+        """Begin a transcation block"""
+        if self.in_txn:
+            return ErrorReply("ERR: Cannot be in a Nested Transaction State")
+        # Clear any previous stale transaction state
+        self.in_txn = True
+        self.txn_queue.clear()
+        return OK
+
+    def exec(self, command):
+        """Execute the transaction (all the queued commands run as one atomic operation)"""
+        if not self.in_txn:
+            return ErrorReply("ERR: Not in Transaction Mode for EXEC")
+
+        # Lock every shard the queued commands touch (in the DB's fixed order),
+        # so threads using the DB directly cannot interleave with the transaction.
+        # Everything the transaction logs becomes one WAL batch record, so replay
+        # applies all of it or none; a transaction with writes waits for the
+        # fsync of that record once, after unlocking. A command working on the
+        # whole keyspace (SAVE, KEYS, ...) takes every shard lock itself, so with
+        # one queued, all of them are taken up front to keep the ascending order.
+        keys = []
+        write = False
+        denyoom = False
+        keyspace = False
+        for spec, cmd in self.txn_queue:
+            keys.extend(spec.keys(cmd))
+            write = write or spec.is_write
+            denyoom = denyoom or spec.is_denyoom
+            keyspace = keyspace or spec.is_keyspace
+
+        # Make room before locking: eviction cannot run while the transaction holds shard locks
+        if write and self.db.maxmemory and not self.db.free_memory_if_needed() and denyoom:
             self.in_txn = False
             self.txn_queue.clear()
-            return "\n".join(responses)
+            self._unwatch_all()
+            return ErrorReply(f"EXECABORT Transaction discarded because of: {OOM_ERROR}")
 
-        # If client wants to discard changes/quit transaction mode midway.
-        elif op == "DISCARD":
-            if self.in_txn:
-                self.in_txn = False
+        responses = []
+        # The watched keys are locked too, so none can change between the check and the commands
+        with self.db.locked(*keys, *self.watched, write=write, every_shard=keyspace), self.db.wal.atomic_batch():
+            if any(self.db.watched_version(key) != version for key, version in self.watched.items()):
+                # A watched key changed since WATCH: the transaction is not run (nil reply)
+                responses = None
                 self.txn_queue.clear()
-                return "OK"
-            else:
-                return "ERR: Not in Transaction Mode for DISCARD"
+            while self.txn_queue:
+                spec, cmd = self.txn_queue.popleft()
+                session_command = self.session_commands.get(spec.name)
+                responses.append(session_command(cmd) if session_command else call_command(self.db, spec, cmd))
 
-        # If already in transaction mode, queue the commands
+        self.in_txn = False
+        self.txn_queue.clear()
+        self._unwatch_all()
+        return responses
+
+    def discard(self, command):
+        """Discard changes/quit transaction mode midway"""
         if self.in_txn:
-            self.txn_queue.append(command)
-            return "QUEUED"
+            self.in_txn = False
+            self.txn_queue.clear()
+            self._unwatch_all()
+            return OK
+        else:
+            return ErrorReply("ERR: Not in Transaction Mode for DISCARD")
 
-        # If not in transction mode, just apply the commands
-        response = apply_command(self.db, command)
-        return str(response)
+    def watch(self, command):
+        """WATCH key [key ...]: make the next EXEC fail if any of the keys changes before it"""
+        if self.in_txn:
+            return ErrorReply("ERR WATCH inside MULTI is not allowed")
+        for key in command[1:]:
+            if key not in self.watched:
+                self.watched[key] = self.db.watch(key)
+        return OK
+
+    def unwatch(self, command):
+        """UNWATCH: forget every watched key"""
+        self._unwatch_all()
+        return OK
+
+    def replicaof(self, command):
+        """REPLICAOF host port: replicate another server; REPLICAOF NO ONE: stop and accept writes"""
+        host, port = command[1], command[2]
+        if host.upper() == "NO" and port.upper() == "ONE":
+            self.replication.promote()
+            return OK
+        try:
+            port_number = int(port)
+        except ValueError:
+            return ErrorReply("ERR Invalid master port")
+        self.replication.replicaof(host, port_number)
+        return OK
+
+    def replconf(self, command):
+        """REPLCONF listening-port port: sent by a replica before SYNC"""
+        options = command[1:]
+        if len(options) % 2:
+            return ErrorReply("ERR syntax error")
+        for option, value in zip(options[::2], options[1::2]):
+            if option.lower() == "listening-port":
+                try:
+                    self.replica_port = int(value)
+                except ValueError:
+                    return ErrorReply("ERR value is not an integer or out of range")
+        return OK
+
+    def sync(self, command):
+        """SYNC: turn the connection into a replica stream (the server runs the full sync)"""
+        if self.in_txn:
+            return ErrorReply("ERR Command not allowed inside a transaction")
+        return FullSync(self.replica_port)
+
+    def _unwatch_all(self):
+        for key in self.watched:
+            self.db.unwatch(key)
+        self.watched.clear()
+
+    def hello(self, command):
+        """HELLO [protover]: switch the connection's RESP version and describe the server"""
+        args = command[1:]
+        if args:
+            try:
+                version = int(args[0])
+            except ValueError:
+                return ErrorReply("ERR Protocol version is not an integer or out of range")
+            if version not in PROTOCOL_VERSIONS:
+                return ErrorReply("NOPROTO unsupported protocol version")
+            self.protocol = version
+            if self.subscriber is not None:
+                self.subscriber.protocol = version
+        return {
+            "server": SERVER_NAME,
+            "version": SERVER_VERSION,
+            "proto": self.protocol,
+            "mode": "standalone",
+            "role": "replica" if self.replication is not None and self.replication.is_replica else "master",
+            "modules": [],
+        }
+
+    def subscribe(self, command):
+        """SUBSCRIBE channel [channel ...]: one confirmation per channel"""
+        replies = Replies()
+        for channel in command[1:]:
+            self.pubsub.subscribe(self.subscriber, channel)
+            replies.append(Push(["subscribe", channel, self.subscriber.count]))
+        return replies
+
+    def psubscribe(self, command):
+        """PSUBSCRIBE pattern [pattern ...]: glob patterns, as in KEYS"""
+        replies = Replies()
+        for pattern in command[1:]:
+            self.pubsub.psubscribe(self.subscriber, pattern)
+            replies.append(Push(["psubscribe", pattern, self.subscriber.count]))
+        return replies
+
+    def unsubscribe(self, command):
+        """UNSUBSCRIBE [channel ...]: every channel when none is given"""
+        channels = command[1:] or sorted(self.subscriber.channels)
+        return self._unsubscribed("unsubscribe", channels, self.pubsub.unsubscribe)
+
+    def punsubscribe(self, command):
+        """PUNSUBSCRIBE [pattern ...]: every pattern when none is given"""
+        patterns = command[1:] or sorted(self.subscriber.patterns)
+        return self._unsubscribed("punsubscribe", patterns, self.pubsub.punsubscribe)
+
+    def _unsubscribed(self, kind, names, unsubscribe):
+        if not names:
+            # Nothing to leave: still one confirmation, with a null name
+            return Push([kind, None, self.subscriber.count])
+        replies = Replies()
+        for name in names:
+            unsubscribe(self.subscriber, name)
+            replies.append(Push([kind, name, self.subscriber.count]))
+        return replies
+
+    def publish(self, command):
+        """PUBLISH channel message: the number of subscribers that received it"""
+        return self.pubsub.publish(command[1], command[2])
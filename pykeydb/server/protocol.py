@@ -0,0 +1,203 @@
+import shlex
+from typing import Iterator, List, Tuple
+from pykeydb.db.dataTypes import format_number
+from pykeydb.db.replies import NULL_ARRAY, ErrorReply, Push, Replies, SimpleString
+
+# Values travel as bytes; surrogateescape maps undecodable bytes to lone
+# surrogates so binary data survives the round trip through str keys/values.
+ENCODING = "utf-8"
+ERRORS = "surrogateescape"
+
+# Limits that protect the server from malformed or hostile input (same as Redis)
+MAX_INLINE_SIZE = 64 * 1024
+MAX_MULTIBULK_LENGTH = 1024 * 1024
+MAX_BULK_LENGTH = 512 * 1024 * 1024
+
+PROTOCOL_VERSIONS = (2, 3)
+
+
+class ProtocolError(ValueError):
+    """The client sent something that is not valid RESP; the connection must be closed"""
+
+
+class RespParser:
+    """
+    Incremental request parser. Bytes read from the socket are fed in as they
+    arrive; commands() then yields every complete command in the buffer, so a
+    pipelined batch is decoded in one pass. A partial command stays buffered
+    until the rest of it arrives.
+
+    Requests are either RESP arrays of bulk strings (what client libraries send)
+    or inline commands: a text line split on whitespace, with "double" and
+    'single' quoted arguments (what nc/telnet users type).
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pos = 0
+
+    def feed(self, data: bytes):
+        self.buffer += data
+
+    def commands(self) -> Iterator[Tuple[List[str], bool]]:
+        """Yield (command, is_inline) for each complete command buffered"""
+        try:
+            while self.pos < len(self.buffer):
+                if self.buffer[self.pos] == 0x2A:  # *
+                    command = self._parse_multibulk()
+                    inline = False
+                else:
+                    command = self._parse_inline()
+                    inline = True
+                if command is None:
+                    break
+                if command:
+                    yield command, inline
+        finally:
+            # Drop consumed bytes once per batch rather than once per command
+            del self.buffer[: self.pos]
+            self.pos = 0
+
+    def _read_line(self) -> bytes:
+        """Return the next CRLF-terminated line (without CRLF), or None if incomplete"""
+        end = self.buffer.find(b"\r\n", self.pos)
+        if end == -1:
+            if len(self.buffer) - self.pos > MAX_INLINE_SIZE:
+                raise ProtocolError("too big inline request")
+            return None
+        line = bytes(self.buffer[self.pos : end])
+        self.pos = end + 2
+        return line
+
+    def _parse_multibulk(self):
+        start = self.pos
+        line = self._read_line()
+        if line is None:
+            return None
+        count = self._parse_length(line[1:], MAX_MULTIBULK_LENGTH, "multibulk")
+
+        buffer = self.buffer
+        command = []
+        for _ in range(count):
+            line = self._read_line()
+            if line is None:
+                self.pos = start
+                return None
+            if not line.startswith(b"$"):
+                raise ProtocolError(f"expected '$', got '{line[:1].decode(ENCODING, ERRORS)}'")
+            length = self._parse_length(line[1:], MAX_BULK_LENGTH, "bulk")
+            end = self.pos + length
+            if end + 2 > len(buffer):
+                self.pos = start
+                return None
+            if buffer[end : end + 2] != b"\r\n":
+                raise ProtocolError("bulk string is not terminated by CRLF")
+            command.append(buffer[self.pos : end].decode(ENCODING, ERRORS))
+            self.pos = end + 2
+        return command
+
+    @staticmethod
+    def _parse_length(raw: bytes, limit: int, kind: str) -> int:
+        try:
+            length = int(raw)
+        except ValueError:
+            raise ProtocolError(f"invalid {kind} length") from None
+        if length < 0 or length > limit:
+            raise ProtocolError(f"invalid {kind} length")
+        return length
+
+    def _parse_inline(self):
+        end = self.buffer.find(b"\n", self.pos)
+        if end == -1:
+            if len(self.buffer) - self.pos > MAX_INLINE_SIZE:
+                raise ProtocolError("too big inline request")
+            return None
+        line = self.buffer[self.pos : end].decode(ENCODING, ERRORS)
+        self.pos = end + 1
+        if '"' not in line and "'" not in line:
+            return line.split()
+        try:
+            return shlex.split(line)
+        except ValueError:
+            raise ProtocolError("unbalanced quotes in request") from None
+
+
+def encode_reply(reply, protocol: int = 2) -> bytes:
+    """Serialize a reply value as RESP2 or RESP3"""
+    out = []
+    _encode(reply, protocol, out)
+    return b"".join(out)
+
+
+def _encode(reply, protocol: int, out: list):
+    # Subclasses of str first: status and error replies are not bulk strings
+    if isinstance(reply, str):
+        if isinstance(reply, SimpleString):
+            out.append(b"+%s\r\n" % reply.encode(ENCODING, ERRORS))
+        elif isinstance(reply, ErrorReply):
+            out.append(b"-%s\r\n" % reply.encode(ENCODING, ERRORS))
+        else:
+            data = reply.encode(ENCODING, ERRORS)
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    elif reply is None:
+        out.append(b"_\r\n" if protocol == 3 else b"$-1\r\n")
+    elif reply is NULL_ARRAY:
+        out.append(b"_\r\n" if protocol == 3 else b"*-1\r\n")
+    elif isinstance(reply, int):
+        # bool included: Redis replies to predicates such as SISMEMBER with 1/0
+        out.append(b":%d\r\n" % reply)
+    elif isinstance(reply, float):
+        # RESP2 has no double type: send it as Redis does, without a trailing .0
+        data = (repr(reply) if protocol == 3 else format_number(reply)).encode()
+        out.append(b",%s\r\n" % data if protocol == 3 else b"$%d\r\n%s\r\n" % (len(data), data))
+    elif isinstance(reply, dict):
+        if protocol == 3:
+            out.append(b"%%%d\r\n" % len(reply))
+        else:
+            out.append(b"*%d\r\n" % (2 * len(reply)))
+        for field, value in reply.items():
+            _encode(field, protocol, out)
+            _encode(value, protocol, out)
+    elif isinstance(reply, (set, frozenset)):
+        out.append(b"%s%d\r\n" % (b"~" if protocol == 3 else b"*", len(reply)))
+        for item in reply:
+            _encode(item, protocol, out)
+    elif isinstance(reply, Replies):
+        for item in reply:
+            _encode(item, protocol, out)
+    elif isinstance(reply, (list, tuple)):
+        out.append(b"%s%d\r\n" % (b">" if protocol == 3 and isinstance(reply, Push) else b"*", len(reply)))
+        for item in reply:
+            _encode(item, protocol, out)
+    else:
+        _encode(str(reply), protocol, out)
+
+
+def format_inline(reply) -> str:
+    """Render a reply as human-readable text for inline (nc/telnet) clients"""
+    if reply is None or reply is NULL_ARRAY:
+        return "(nil)"
+    if isinstance(reply, bool):
+        return f"(bool) {reply}"
+    if isinstance(reply, int):
+        return f"(integer) {reply}"
+    if isinstance(reply, float):
+        return format_number(reply)
+    if isinstance(reply, dict):
+        if not reply:
+            return "(empty hash)"
+        return "\n".join(f"{i}) {k}: {v}" for i, (k, v) in enumerate(reply.items(), 1))
+    if isinstance(reply, Replies):
+        return "\n".join(format_inline(item) for item in reply)
+    if isinstance(reply, (list, tuple, set, frozenset)):
+        if not reply:
+            return "(empty set)" if isinstance(reply, (set, frozenset)) else "(empty list)"
+        lines = []
+        for i, item in enumerate(reply, 1):
+            prefix = f"{i}) "
+            # Nested arrays are indented under their index, like redis-cli
+            first, *rest = format_inline(item).split("\n")
+            lines.append(prefix + first)
+            lines.extend(" " * len(prefix) + line for line in rest)
+        return "\n".join(lines)
+    return str(reply)
@@ -0,0 +1,119 @@
+from typing import Callable, Dict, Optional, Set, Tuple
+from pykeydb.db.replies import Push
+from pykeydb.db.scan import compile_pattern
+from pykeydb.server.protocol import encode_reply
+
+# Bytes a subscriber may have waiting to be written before it is disconnected
+# (Redis' hard client-output-buffer-limit for pubsub clients)
+OUTPUT_BUFFER_LIMIT = 32 * 1024 * 1024
+
+
+class Subscriber:
+    """
+    A connection's subscriptions and the transport messages are written to.
+    The transport's write buffer is the subscriber's output queue: writing never
+    waits, and a consumer that lets it grow past OUTPUT_BUFFER_LIMIT is dropped,
+    so one slow reader cannot stall PUBLISH for everyone else.
+    """
+
+    __slots__ = ("transport", "protocol", "channels", "patterns", "closed")
+
+    def __init__(self, transport, protocol: int = 2):
+        self.transport = transport
+        # RESP version messages are encoded for (kept in step with HELLO)
+        self.protocol = protocol
+        self.channels: Set[str] = set()
+        self.patterns: Set[str] = set()
+        self.closed = False
+
+    @property
+    def count(self) -> int:
+        """Subscriptions held, as reported in (un)subscribe confirmations"""
+        return len(self.channels) + len(self.patterns)
+
+    def send(self, data: bytes) -> bool:
+        """Queue an encoded message; False if the subscriber is (now) disconnected"""
+        if self.closed:
+            return False
+        self.transport.write(data)
+        if self.transport.get_write_buffer_size() > OUTPUT_BUFFER_LIMIT:
+            self.closed = True
+            self.transport.abort()
+            return False
+        return True
+
+
+class PubSub:
+    """
+    Channel and pattern subscriptions, kept apart from the keyspace: nothing
+    here touches PyKeyDB or its locks, and everything runs on the event loop.
+    Channels map to their subscribers, so PUBLISH costs O(subscribers) plus one
+    precompiled matcher call per subscribed pattern. A message is encoded once
+    per RESP version, not once per subscriber.
+    """
+
+    def __init__(self):
+        # channel -> subscribers (dicts as ordered sets)
+        self.channels: Dict[str, Dict[Subscriber, None]] = {}
+        # pattern -> (matcher, subscribers); a None matcher matches every channel
+        self.patterns: Dict[str, Tuple[Optional[Callable[[str], bool]], Dict[Subscriber, None]]] = {}
+
+    def subscribe(self, subscriber: Subscriber, channel: str):
+        if channel not in subscriber.channels:
+            subscriber.channels.add(channel)
+            self.channels.setdefault(channel, {})[subscriber] = None
+
+    def unsubscribe(self, subscriber: Subscriber, channel: str):
+        if channel in subscriber.channels:
+            subscriber.channels.discard(channel)
+            subscribers = self.channels[channel]
+            del subscribers[subscriber]
+            if not subscribers:
+                del self.channels[channel]
+
+    def psubscribe(self, subscriber: Subscriber, pattern: str):
+        if pattern not in subscriber.patterns:
+            subscriber.patterns.add(pattern)
+            if pattern not in self.patterns:
+                self.patterns[pattern] = (compile_pattern(pattern), {})
+            self.patterns[pattern][1][subscriber] = None
+
+    def punsubscribe(self, subscriber: Subscriber, pattern: str):
+        if pattern in subscriber.patterns:
+            subscriber.patterns.discard(pattern)
+            subscribers = self.patterns[pattern][1]
+            del subscribers[subscriber]
+            if not subscribers:
+                del self.patterns[pattern]
+
+    def remove(self, subscriber: Subscriber):
+        """Drop every subscription of a connection that closed"""
+        for channel in list(subscriber.channels):
+            self.unsubscribe(subscriber, channel)
+        for pattern in list(subscriber.patterns):
+            self.punsubscribe(subscriber, pattern)
+
+    def publish(self, channel: str, message: str) -> int:
+        """Deliver message to the channel's and matching patterns' subscribers; returns how many got it"""
+        receivers = 0
+        subscribers = self.channels.get(channel)
+        if subscribers:
+            receivers += self._fan_out(subscribers, Push(["message", channel, message]))
+        for pattern, (match, subscribers) in list(self.patterns.items()):
+            if match is None or match(channel):
+                receivers += self._fan_out(subscribers, Push(["pmessage", pattern, channel, message]))
+        return receivers
+
+    def _fan_out(self, subscribers: Dict[Subscriber, None], push: Push) -> int:
+        encoded: Dict[int, bytes] = {}
+        receivers = 0
+        # A copy: dropping a slow subscriber changes the dict
+        for subscriber in list(subscribers):
+            data = encoded.get(subscriber.protocol)
+            if data is None:
+                data = encoded[subscriber.protocol] = encode_reply(push, subscriber.protocol)
+            if subscriber.send(data):
+                receivers += 1
+            else:
+                self.remove(subscriber)
+        return receivers
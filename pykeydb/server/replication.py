@@ -0,0 +1,414 @@
+import asyncio
+import itertools
+import os
+import socket
+import threading
+import time
+from collections import deque
+from logging import getLogger
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from pykeydb.db.snapshot import read_snapshot
+from pykeydb.db.walCodec import get_wal_codec
+from pykeydb.server.protocol import RespParser, encode_reply
+
+logger = getLogger(__name__)
+
+# Replication stream, leader -> replica, after the replica sends SYNC:
+#   +FULLRESYNC <offset> <wal format>\r\n
+#   $<length>\r\n<snapshot file>      the dataset at <offset>, in the leader's snapshot format
+#   <WAL record><WAL record>...       every record the leader logs from then on, as in its WAL
+# The offset counts bytes of WAL records since the leader started. Heartbeat
+# records (never written to the WAL) are part of the stream, so the replica
+# answers each one with REPLCONF ACK <offset>.
+HEARTBEAT_OPERATION = "REPLPING"
+# Seconds between heartbeats
+HEARTBEAT_INTERVAL = 1.0
+# Seconds without any data from the leader before a replica reconnects
+REPLICATION_TIMEOUT = 60.0
+# Seconds a replica waits before reconnecting after losing its leader
+RECONNECT_DELAY = 1.0
+# Seconds REPLICAOF waits for the previous link's thread to exit
+LINK_STOP_TIMEOUT = 5.0
+# Seconds between checks on the child writing a full sync snapshot
+SYNC_POLL_INTERVAL = 0.05
+# Unsent stream bytes a replica may have before it is disconnected (Redis' replica buffer hard limit)
+REPLICA_OUTPUT_LIMIT = 256 * 1024 * 1024
+# Bytes per write when sending a snapshot
+SYNC_CHUNK_SIZE = 1 << 20
+
+
+class FullSync:
+    """Reply marker: the connection is a replica asking for a full sync (see Replication.serve_replica)"""
+
+    __slots__ = ("listening_port",)
+
+    def __init__(self, listening_port: Optional[int]):
+        self.listening_port = listening_port
+
+
+class ReplicaFeed:
+    """
+    The stream to one connected replica. Records are pushed from whichever
+    thread logged them (under the WAL lock, so in log order) into a queue that
+    the event loop writes to the socket; until the snapshot has been sent they
+    only accumulate.
+    """
+
+    def __init__(self, transport, address: Tuple[str, Optional[int]]):
+        self.transport = transport
+        self.address = address
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._lock = threading.Lock()
+        self._pending: Deque[bytes] = deque()
+        self._pending_size = 0
+        self.streaming = False
+        self.closed = False
+        # Last offset the replica acknowledged, and when (time.monotonic())
+        self.ack_offset = 0
+        self.ack_time = time.monotonic()
+
+    def push(self, data: bytes):
+        with self._lock:
+            if self.closed:
+                return
+            self._pending.append(data)
+            self._pending_size += len(data)
+            overflow = self._pending_size > REPLICA_OUTPUT_LIMIT
+        if overflow:
+            self._call(self.close)
+        elif self.streaming:
+            self._call(self.flush)
+
+    def _call(self, callback: Callable[[], None]):
+        if threading.get_ident() == self._loop_thread:
+            callback()
+        else:
+            self._loop.call_soon_threadsafe(callback)
+
+    def start_streaming(self):
+        self.streaming = True
+        self.flush()
+
+    def flush(self):
+        """Write everything queued to the socket; runs on the event loop"""
+        with self._lock:
+            if self.closed or not self._pending:
+                return
+            data = b"".join(self._pending)
+            self._pending.clear()
+            self._pending_size = 0
+        self.transport.write(data)
+        if self.transport.get_write_buffer_size() > REPLICA_OUTPUT_LIMIT:
+            self.close()
+
+    def disconnect(self):
+        """Close the connection from any thread; the replica reconnects and syncs again"""
+        self._call(self.transport.abort)
+
+    def close(self):
+        """Drop a replica that fell too far behind; it reconnects and syncs again"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._pending.clear()
+        logger.warning(f"Disconnecting replica {self.address}: output buffer limit reached")
+        self.transport.abort()
+
+
+class ReplicaLink:
+    """
+    A replica's connection to its leader, run on a thread of its own: connect,
+    load the snapshot, then apply the streamed records through PyKeyDB's
+    replay path until the link breaks, and start over after RECONNECT_DELAY.
+    """
+
+    def __init__(self, db, host: str, port: int, listening_port: Optional[int], on_sync: Callable[[], None]):
+        self.db = db
+        self.host = host
+        self.port = port
+        self.listening_port = listening_port
+        # Called after each full sync (the replica's own replicas have to sync again)
+        self.on_sync = on_sync
+        # "connect", "sync" or "connected"
+        self.state = "connect"
+        # Leader offset of the last record applied, and when data last arrived
+        self.offset = 0
+        self.last_io: Optional[float] = None
+        self._sock: Optional[socket.socket] = None
+        self._stop = threading.Event()
+        # Held while the link changes the dataset and while it is stopped, so once
+        # stop() returns nothing from this leader is applied any more
+        self._apply_lock = threading.RLock()
+        self._thread = threading.Thread(target=self._run, name=f"replica-of-{host}:{port}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: float = LINK_STOP_TIMEOUT):
+        """
+        Break the link. Waits for a record or snapshot being applied to finish (no
+        more are applied after it) and then, up to timeout, for the thread to exit.
+        """
+        with self._apply_lock:
+            self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Replication link to {self.host}:{self.port} did not stop in {timeout}s")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._sync_and_stream()
+            except (OSError, ValueError) as e:
+                if not self._stop.is_set():
+                    logger.warning(f"Replication link to {self.host}:{self.port} lost: {e}")
+            except Exception:
+                # Anything else (e.g. failing to load or save the dataset) must not end
+                # the thread: the replica would silently stop following its leader
+                if not self._stop.is_set():
+                    logger.exception(f"Replication link to {self.host}:{self.port} failed")
+            finally:
+                self.state = "connect"
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+            self._stop.wait(RECONNECT_DELAY)
+
+    def _sync_and_stream(self):
+        self._sock = sock = socket.create_connection((self.host, self.port), timeout=REPLICATION_TIMEOUT)
+        if self._stop.is_set():
+            return
+        stream = sock.makefile("rb")
+        if self.listening_port is not None:
+            sock.sendall(encode_reply(["REPLCONF", "listening-port", str(self.listening_port)]))
+            self._expect(stream, b"+OK")
+        sock.sendall(encode_reply(["SYNC"]))
+        self.state = "sync"
+        _, offset, wal_format = self._expect(stream, b"+FULLRESYNC").split()
+        self._load_snapshot(stream, int(self._expect(stream, b"$")[1:]))
+        self.offset = base = int(offset)
+        self.last_io = time.monotonic()
+        self.state = "connected"
+        logger.info(f"Replica synced with {self.host}:{self.port} at offset {base}")
+        self.on_sync()
+
+        codec = get_wal_codec(wal_format.decode())
+        # Record offsets count from the start of the stream (the snapshot's end)
+        for record, end in codec.iter_records(_SocketStream(stream)):
+            self.offset = base + end
+            self.last_io = time.monotonic()
+            if record["operation"] == HEARTBEAT_OPERATION:
+                sock.sendall(encode_reply(["REPLCONF", "ACK", str(self.offset)]))
+                continue
+            # Records already read into the stream's buffer must not outlive stop()
+            with self._apply_lock:
+                if self._stop.is_set():
+                    return
+                self.db.apply_replicated(record)
+        if not self._stop.is_set():
+            raise ConnectionError("leader closed the connection")
+
+    @staticmethod
+    def _expect(stream, prefix: bytes) -> bytes:
+        line = stream.readline()
+        # Empty lines are the leader's keepalives while it writes the snapshot
+        while line in (b"\n", b"\r\n"):
+            line = stream.readline()
+        line = line.rstrip(b"\r\n")
+        if not line.startswith(prefix):
+            raise ValueError(f"unexpected reply from leader: {line[:100]!r}")
+        return line
+
+    def _load_snapshot(self, stream, length: int):
+        # Spooled to disk, so a large dataset is never held in memory twice; the
+        # name is the thread's own, in case an old link has not exited yet
+        path = f"{self.db.snapshot_path}.replica-sync{threading.get_ident()}"
+        with open(path, "wb") as f:
+            while length:
+                chunk = stream.read(min(length, SYNC_CHUNK_SIZE))
+                if not chunk:
+                    raise ConnectionError("leader closed the connection during sync")
+                f.write(chunk)
+                length -= len(chunk)
+        try:
+            with self._apply_lock:
+                if self._stop.is_set():
+                    raise ConnectionError("link stopped during sync")
+                _, records = read_snapshot(path)
+                count = self.db.replace_dataset(records)
+        finally:
+            os.remove(path)
+        logger.info(f"Loaded {count} keys from {self.host}:{self.port}")
+
+
+class _SocketStream:
+    """A socket's read side, as the file object WAL codecs read records from"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def tell(self) -> int:
+        return 0
+
+    def read(self, size: int) -> bytes:
+        return self._stream.read(size)
+
+    def __iter__(self):
+        return iter(self._stream)
+
+
+class Replication:
+    """
+    Both sides of leader -> follower replication. As a leader, every record the
+    WAL appends is streamed to the connected replicas (WriteAheadLog.on_append);
+    a new replica first gets a snapshot taken at an exact stream offset. After
+    REPLICAOF this server is also a replica: a ReplicaLink keeps the dataset in
+    step with the leader and clients may only read.
+    """
+
+    def __init__(self, db, listening_port: Optional[int] = None):
+        self.db = db
+        self.listening_port = listening_port
+        # Bytes of WAL records streamed since start (master_repl_offset)
+        self.offset = 0
+        # Connected replicas; replaced, never mutated, as _feed reads it from any thread
+        self.replicas: Tuple[ReplicaFeed, ...] = ()
+        self.link: Optional[ReplicaLink] = None
+        self._sync_ids = itertools.count(1)
+        self._last_heartbeat = 0.0
+        db.wal.on_append = self._feed
+        db.replication_info = self.info
+
+    @property
+    def is_replica(self) -> bool:
+        return self.link is not None
+
+    def _feed(self, data: bytes):
+        """WriteAheadLog.on_append: runs under the WAL lock, on any thread"""
+        self.offset += len(data)
+        for replica in self.replicas:
+            replica.push(data)
+
+    def replicaof(self, host: str, port: int):
+        """Become a replica of host:port; the dataset is replaced once the first sync completes"""
+        self.promote()
+        self.db.replica = True
+        self.link = ReplicaLink(self.db, host, port, self.listening_port, self._drop_replicas)
+        self.link.start()
+        logger.info(f"Replicating {host}:{port}")
+
+    def promote(self):
+        """
+        Stop replicating (REPLICAOF NO ONE); the data replicated so far is kept.
+        The old link applies nothing more once this returns.
+        """
+        if self.link is not None:
+            self.link.stop()
+            self.link = None
+        self.db.replica = False
+
+    def _drop_replicas(self):
+        # Called from the link's thread after a full sync: our replicas hold the old dataset
+        for replica in self.replicas:
+            replica.disconnect()
+
+    def heartbeat(self):
+        """Send a heartbeat to every replica once per HEARTBEAT_INTERVAL; called by the server cron"""
+        now = time.monotonic()
+        if not self.replicas or now - self._last_heartbeat < HEARTBEAT_INTERVAL:
+            return
+        self._last_heartbeat = now
+        wal = self.db.wal
+        data = wal.codec.encode({"operation": HEARTBEAT_OPERATION, "key": ""})
+        with wal.wal_lock:
+            self._feed(data)
+
+    async def serve_replica(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, parser: RespParser, sync: FullSync
+    ):
+        """Full sync, then stream records to a replica and read its acknowledgements until it disconnects"""
+        host = writer.get_extra_info("peername")[0]
+        feed = ReplicaFeed(writer.transport, (host, sync.listening_port))
+        path = f"{self.db.snapshot_path}.sync{next(self._sync_ids)}"
+
+        def start() -> int:
+            # Every shard is locked, so nothing is logged in between: the snapshot
+            # holds exactly the records before this offset and the feed the rest
+            with self.db.wal.wal_lock:
+                self.replicas += (feed,)
+                feed.ack_offset = self.offset
+                return self.offset
+
+        try:
+            background = self.db.replication_snapshot(path, start)
+            if background is not None:
+                waited = 0.0
+                while (succeeded := background.poll()) is None:
+                    await asyncio.sleep(SYNC_POLL_INTERVAL)
+                    waited += SYNC_POLL_INTERVAL
+                    if waited >= HEARTBEAT_INTERVAL:
+                        # Keeps the replica's read timeout from expiring during a long snapshot
+                        writer.write(b"\n")
+                        waited = 0.0
+                if not succeeded:
+                    raise RuntimeError(f"snapshot for replica {feed.address} failed")
+            writer.write(
+                b"+FULLRESYNC %d %s\r\n$%d\r\n"
+                % (feed.ack_offset, self.db.wal.wal_format.encode(), os.path.getsize(path))
+            )
+            with open(path, "rb") as f:
+                while chunk := f.read(SYNC_CHUNK_SIZE):
+                    writer.write(chunk)
+                    await writer.drain()
+            feed.start_streaming()
+            logger.info(f"Replica {feed.address} synced at offset {feed.ack_offset}")
+
+            while data := await reader.read(SYNC_CHUNK_SIZE):
+                parser.feed(data)
+                for command, _ in parser.commands():
+                    if len(command) == 3 and command[0].upper() == "REPLCONF" and command[1].upper() == "ACK":
+                        feed.ack_offset = int(command[2])
+                        feed.ack_time = time.monotonic()
+        finally:
+            self.replicas = tuple(replica for replica in self.replicas if replica is not feed)
+            if os.path.exists(path):
+                os.remove(path)
+            logger.info(f"Replica {feed.address} disconnected")
+
+    def info(self) -> Dict[str, Any]:
+        """INFO replication (field names as in Redis)"""
+        link = self.link
+        fields: Dict[str, Any] = {"role": "slave" if link else "master"}
+        if link is not None:
+            fields.update(
+                {
+                    "master_host": link.host,
+                    "master_port": link.port,
+                    "master_link_status": "up" if link.state == "connected" else "down",
+                    "master_last_io_seconds_ago": (
+                        int(time.monotonic() - link.last_io) if link.last_io is not None else -1
+                    ),
+                    "master_sync_in_progress": int(link.state == "sync"),
+                    "slave_repl_offset": link.offset,
+                }
+            )
+        now = time.monotonic()
+        fields["connected_slaves"] = len(self.replicas)
+        for i, replica in enumerate(self.replicas):
+            host, port = replica.address
+            state = "online" if replica.streaming else "wait_bgsave"
+            fields[f"slave{i}"] = (
+                f"ip={host},port={port or 0},state={state},offset={replica.ack_offset},"
+                f"lag={int(now - replica.ack_time)}"
+            )
+        fields["master_repl_offset"] = self.offset
+        return fields
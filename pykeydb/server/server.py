@@ -1,54 +1,190 @@
+import argparse
 import asyncio
+import os
 from pykeydb.db.pyKeyDB import get_pykey_db
+from pykeydb.db.replies import ErrorReply
+from pykeydb.server.blocking import BlockedClient, BlockingKeys
 from pykeydb.server.clientContext import ClientContext
+from pykeydb.server.protocol import ENCODING, ERRORS, ProtocolError, RespParser, encode_reply, format_inline
+from pykeydb.server.pubSub import PubSub
+from pykeydb.server.replication import FullSync, Replication
 
 HOST = "127.0.0.1"
 PORT = 6379
-
-
-db = get_pykey_db()
+# Seconds between runs of the periodic housekeeping task
+CRON_INTERVAL = 0.1
+# Bytes requested from the socket per read
+READ_SIZE = 64 * 1024
+# Where the WAL (and the snapshot next to it) is kept unless --dir/--wal say otherwise
+DATA_DIR = "."
+WAL_FILE = "wal.log"
+
+
+# The store and the server state bound to it, set up by open_store() before serving
+db = None
+# Clients blocked in BLPOP/BRPOP/BLMOVE, woken by pushes
+blocking = None
+# Channel subscriptions; PUBLISH writes to subscribers' sockets directly
+pubsub = PubSub()
+# Streams the WAL to replicas, and follows a leader after REPLICAOF
+replication = None
+
+
+def open_store(data_dir: str = DATA_DIR, wal_file: str = WAL_FILE):
+    """
+    Load the store from data_dir (created if missing): the WAL is wal_file there
+    (an absolute path is used as is), and the snapshot sits next to it
+    """
+    global db, blocking, replication
+    os.makedirs(data_dir, exist_ok=True)
+    db = get_pykey_db(wal_path=os.path.join(data_dir, wal_file))
+    blocking = BlockingKeys(db)
+    replication = Replication(db)
+
+
+async def wait_blocked(client: BlockedClient, reader: asyncio.StreamReader, parser: RespParser):
+    """
+    Wait for a blocked client's reply; its timeout_reply once the timeout
+    passes. The socket is read meanwhile: commands the client pipelines are
+    buffered in parser, and EOF raises ConnectionResetError, so a client that
+    went away is taken out of the queues instead of being handed an element
+    nobody will receive.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if client.timeout is None else loop.time() + client.timeout
+    read = None
+    try:
+        while not client.future.done():
+            if read is None:
+                read = asyncio.ensure_future(reader.read(READ_SIZE))
+            remaining = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait(
+                (client.future, read), timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            if read in done:
+                data = read.result()
+                read = None
+                if not data:
+                    raise ConnectionResetError("connection closed while blocked")
+                parser.feed(data)
+            elif not done:
+                return client.timeout_reply
+        return client.future.result()
+    finally:
+        blocking.unblock(client)
+        if read is not None:
+            # A cancelled read leaves unread bytes in the reader's buffer; it has
+            # to finish cancelling before the connection can be read again
+            read.cancel()
+            await asyncio.gather(read, return_exceptions=True)
+            if not read.cancelled() and read.exception() is None:
+                parser.feed(read.result())
 
 
 async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
 
     addr = writer.get_extra_info("peername")
-    client_context = ClientContext(db)
+    client_context = ClientContext(db, blocking, pubsub, writer.transport, replication)
     print(f"Client connected: {addr}")
     print(f"Client context initialized for {addr}")
 
+    parser = RespParser()
     try:
         while True:
-            data = await reader.readline()
+            data = await reader.read(READ_SIZE)
             if not data:
                 break
+            parser.feed(data)
+
+            # Execute every command that arrived in this read back to back and
+            # answer the whole pipeline with a single write
+            replies = []
+            try:
+                for command, inline in parser.commands():
+                    response = client_context.execute_command(command)
+                    # Wake clients blocked on lists this command pushed to
+                    blocking.serve_ready()
+                    if isinstance(response, BlockedClient):
+                        # Answer the commands before it, then park until a push or the timeout
+                        if replies:
+                            writer.write(b"".join(replies))
+                            replies = []
+                            await writer.drain()
+                        response = await wait_blocked(response, reader, parser)
+                    elif isinstance(response, FullSync):
+                        # The connection is a replica now: it only receives the replication stream
+                        if replies:
+                            writer.write(b"".join(replies))
+                        await replication.serve_replica(reader, writer, parser, response)
+                        return
+                    if inline:
+                        replies.append((format_inline(response) + "\n").encode(ENCODING, ERRORS))
+                    else:
+                        replies.append(encode_reply(response, client_context.protocol))
+                    if client_context.subscribed:
+                        # Messages go out as soon as they are published: write the
+                        # replies now too, so the stream keeps its order
+                        writer.write(b"".join(replies))
+                        replies = []
+            except ProtocolError as e:
+                replies.append(encode_reply(ErrorReply(f"ERR Protocol error: {e}")))
+                writer.write(b"".join(replies))
+                await writer.drain()
+                break
 
-            command = data.decode().strip().split()
-            if not command:
-                continue
-
-            response = client_context.execute_command(command)
-            writer.write((response + "\n").encode())
+            if replies:
+                writer.write(b"".join(replies))
             await writer.drain()
 
     except Exception as e:
         print(f"Client error {addr}: {e}")
 
     finally:
+        client_context.close()
         writer.close()
         await writer.wait_closed()
         print(f"Client disconnected: {addr}")
 
 
-async def main():
-    server = await asyncio.start_server(handle_client, HOST, PORT)
-    print(f"PyKeyDB server listening on {HOST}:{PORT}")
+async def server_cron():
+    """Periodic housekeeping on the event loop (finishing background saves, expiring keys)"""
+    while True:
+        await asyncio.sleep(CRON_INTERVAL)
+        try:
+            db.poll_background_save()
+            # Bounded work per tick, so a mass expiry cannot stall the event loop.
+            # A replica leaves expiry to its leader, whose DELs it receives.
+            if not replication.is_replica:
+                db.active_expire_cycle()
+            replication.heartbeat()
+        except Exception as e:
+            print(f"Server cron error: {e}")
+
+
+async def main(host: str = HOST, port: int = PORT, replicaof=None, data_dir: str = DATA_DIR, wal_file: str = WAL_FILE):
+    open_store(data_dir, wal_file)
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"PyKeyDB server listening on {host}:{port}")
+    cron = asyncio.create_task(server_cron())
+    replication.listening_port = port
+    if replicaof:
+        replication.replicaof(replicaof[0], int(replicaof[1]))
 
     try:
         async with server:
             await server.serve_forever()
     except asyncio.CancelledError:
         print("\nShutting down PyKeyDB server...")
+    finally:
+        cron.cancel()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="PyKeyDB server")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--replicaof", nargs=2, metavar=("HOST", "PORT"), help="start as a replica of a leader")
+    parser.add_argument("--dir", default=DATA_DIR, help="directory holding the WAL and snapshot")
+    parser.add_argument("--wal", default=WAL_FILE, help="WAL file name, relative to --dir")
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.replicaof, args.dir, args.wal))
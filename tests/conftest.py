@@ -0,0 +1,30 @@
+import pytest
+from pykeydb.db.pyKeyDB import PyKeyDB, dispose_pykey_db
+from pykeydb.db.writeAheadLog import WriteAheadLog, dispose_write_ahead_log
+
+
+def close_db(path: str):
+    dispose_pykey_db(path)
+    dispose_write_ahead_log(path)
+
+
+@pytest.fixture
+def wal_path(tmp_path) -> str:
+    path = str(tmp_path / "wal.log")
+    yield path
+    close_db(path)
+
+
+@pytest.fixture
+def open_db(wal_path):
+    """
+    open_db(**kwargs) opens a PyKeyDB on wal_path, closing the one opened before
+    it first, so calling it again is a restart that replays the log
+    """
+
+    def open_db(wal_format: str = "json", fsync_policy=None, **kwargs) -> PyKeyDB:
+        close_db(wal_path)
+        wal = WriteAheadLog(wal_path, wal_format=wal_format, fsync_policy=fsync_policy)
+        return PyKeyDB(wal, **kwargs)
+
+    return open_db
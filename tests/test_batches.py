@@ -0,0 +1,57 @@
+import os
+import pytest
+from pykeydb.db.utils import apply_command
+
+
+def test_msetnx_writes_nothing_if_any_key_exists(open_db):
+    db = open_db()
+    db.rpush("list", "x")
+    assert apply_command(db, ["MSETNX", "a", "1", "list", "2"]) == 0
+    assert db.get("a") is None and db.lrange("list", 0, -1) == ["x"]
+    assert apply_command(db, ["MSETNX", "a", "1", "b", "2"]) == 1
+    assert apply_command(db, ["MSETNX", "c", "3", "b", "4"]) == 0
+    assert (db.get("a"), db.get("b"), db.get("c")) == ("1", "2", None)
+    assert apply_command(db, ["MSETNX", "a", "1", "b"]).startswith("ERR wrong number of arguments")
+    records = list(db.wal.replay())
+    assert [record["operation"] for record in records] == ["RPUSH", "BATCH"]
+    assert [(r["operation"], r["key"]) for r in records[1]["records"]] == [("SET", "a"), ("SET", "b")]
+
+
+def test_del_counts_the_keys_it_removed(open_db):
+    db = open_db()
+    db.mset({"a": "1", "b": "2"})
+    db.sadd("s", "x")
+    assert apply_command(db, ["DEL", "a", "missing", "s", "a"]) == 2
+    assert apply_command(db, ["DEL", "missing"]) == 0
+    assert apply_command(db, ["DEL", "b"]) == 1
+    assert db.keys() == []
+    # Only the keys that existed are logged, the multi-key DEL as one batch
+    records = list(db.wal.replay())[1:]
+    assert [record["operation"] for record in records] == ["SADD", "BATCH", "DEL"]
+    assert [(r["operation"], r["key"]) for r in records[1]["records"]] == [("DEL", "a"), ("DEL", "s")]
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_torn_batch_is_dropped_whole(open_db, wal_format):
+    db = open_db(wal_format)
+    db.set("before", "1")
+    db.rpush("list", "x")
+    size = os.path.getsize(db.wal.path)
+    db.mset({"a": "1", "b": "2", "c": "3"})
+    db.delete_many("before", "list")
+    batch_end = os.path.getsize(db.wal.path)
+
+    # Cut the last batch (the DEL of before and list) short
+    with open(db.wal.path, "r+b") as f:
+        f.truncate(batch_end - 5)
+    db = open_db(wal_format)
+    assert sorted(db.keys()) == ["a", "b", "before", "c", "list"]
+
+    # And the MSET batch, mid-record
+    with open(db.wal.path, "r+b") as f:
+        f.truncate(size + (os.path.getsize(db.wal.path) - size) // 2)
+    db = open_db(wal_format)
+    assert sorted(db.keys()) == ["before", "list"]
+    assert os.path.getsize(db.wal.path) == size
+    db.set("after", "1")
+    assert sorted(open_db(wal_format).keys()) == ["after", "before", "list"]
@@ -0,0 +1,138 @@
+import asyncio
+import pytest
+from pykeydb.db.pyKeyDB import dispose_pykey_db
+from pykeydb.db.writeAheadLog import dispose_write_ahead_log
+from pykeydb.server import server
+from pykeydb.server.protocol import encode_reply
+
+
+class Connection:
+    """A client connection to the in-process server, reading raw reply bytes"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, *command: str):
+        self.writer.write(encode_reply(list(command)))
+        await self.writer.drain()
+
+    async def reply(self) -> bytes:
+        """One reply, as sent"""
+        line = await self.reader.readline()
+        kind = line[:1]
+        if line in (b"$-1\r\n", b"*-1\r\n"):
+            return line
+        if kind == b"$":
+            return line + await self.reader.readexactly(int(line[1:]) + 2)
+        if kind in (b"*", b"~", b">", b"%"):
+            count = int(line[1:]) * (2 if kind == b"%" else 1)
+            return line + b"".join([await self.reply() for _ in range(count)])
+        return line
+
+    async def call(self, *command: str) -> bytes:
+        await self.send(*command)
+        return await self.reply()
+
+    def close(self):
+        self.writer.close()
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """serve(scenario) runs the coroutine scenario(connect) against a server with its data in tmp_path"""
+
+    def serve(scenario):
+        async def run():
+            server.open_store(str(tmp_path))
+            listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+            port = listener.sockets[0].getsockname()[1]
+
+            async def connect() -> Connection:
+                return Connection(*await asyncio.open_connection("127.0.0.1", port))
+
+            async with listener:
+                return await asyncio.wait_for(scenario(connect), 10)
+
+        return asyncio.run(run())
+
+    yield serve
+    path = str(tmp_path / server.WAL_FILE)
+    dispose_pykey_db(path)
+    dispose_write_ahead_log(path)
+
+
+async def blocked_on(key: str, count: int):
+    """Wait until count clients are queued on key"""
+    while len(server.blocking._blocked.get(key, ())) != count:
+        await asyncio.sleep(0.01)
+
+
+def bulk_array(*items: str) -> bytes:
+    return encode_reply(list(items))
+
+
+def test_clients_are_served_in_the_order_they_blocked(serve):
+    async def scenario(connect):
+        clients = [await connect() for _ in range(3)]
+        for i, client in enumerate(clients):
+            await client.send("BLPOP", "jobs", "0")
+            await blocked_on("jobs", i + 1)
+        pusher = await connect()
+        assert await pusher.call("RPUSH", "jobs", "a", "b", "c") == b":3\r\n"
+        return [await client.reply() for client in clients]
+
+    assert serve(scenario) == [bulk_array("jobs", "a"), bulk_array("jobs", "b"), bulk_array("jobs", "c")]
+
+
+def test_timeout_replies_like_redis(serve):
+    async def scenario(connect):
+        client = await connect()
+        replies = [
+            await client.call("BLPOP", "missing", "0.05"),
+            await client.call("BRPOP", "missing", "other", "0.05"),
+            await client.call("BLMOVE", "missing", "dst", "LEFT", "RIGHT", "0.05"),
+        ]
+        await client.call("HELLO", "3")
+        replies.append(await client.call("BLPOP", "missing", "0.05"))
+        # Inside MULTI nothing blocks: the same nil replies, at once
+        await client.call("MULTI")
+        await client.call("BLPOP", "missing", "0")
+        replies.append(await client.call("EXEC"))
+        return replies, server.blocking._blocked
+
+    replies, blocked = serve(scenario)
+    assert replies == [b"*-1\r\n", b"*-1\r\n", b"$-1\r\n", b"_\r\n", b"*1\r\n_\r\n"]
+    assert not blocked
+
+
+def test_disconnect_while_blocked_loses_no_element(serve):
+    async def scenario(connect):
+        gone = await connect()
+        await gone.send("BLPOP", "jobs", "0")
+        await blocked_on("jobs", 1)
+        gone.close()
+        await blocked_on("jobs", 0)
+        waiting = await connect()
+        await waiting.send("BRPOP", "jobs", "0")
+        await blocked_on("jobs", 1)
+        pusher = await connect()
+        await pusher.call("RPUSH", "jobs", "x", "y")
+        return await waiting.reply(), await pusher.call("LRANGE", "jobs", "0", "-1")
+
+    assert serve(scenario) == (bulk_array("jobs", "y"), bulk_array("x"))
+
+
+def test_blmove_is_served_and_logged_as_one_batch(serve):
+    async def scenario(connect):
+        client = await connect()
+        await client.send("BLMOVE", "src", "dst", "LEFT", "RIGHT", "0")
+        await blocked_on("src", 1)
+        pusher = await connect()
+        await pusher.call("RPUSH", "src", "x")
+        return await client.reply(), await pusher.call("LRANGE", "dst", "0", "-1")
+
+    assert serve(scenario) == (b"$1\r\nx\r\n", bulk_array("x"))
+    records = list(server.db.wal.replay())
+    assert [r["operation"] for r in records] == ["RPUSH", "BATCH"]
+    assert [(r["operation"], r["key"]) for r in records[1]["records"]] == [("LPOP", "src"), ("RPUSH", "dst")]
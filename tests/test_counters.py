@@ -0,0 +1,106 @@
+import pytest
+from pykeydb.db.encodings import INT64_MAX, INT64_MIN
+from pykeydb.db.utils import apply_command
+from pykeydb.db.walCodec import BINARY_MAGIC, BinaryWalCodec
+
+
+def logged(db) -> list:
+    return [record["operation"] for record in db.wal.replay()]
+
+
+def test_overflow_is_refused_and_not_logged(open_db):
+    db = open_db()
+    db.set("max", str(INT64_MAX))
+    db.incrby("min", INT64_MIN)
+    db.hincrby("h", "f", INT64_MAX)
+    before = logged(db)
+    with pytest.raises(ValueError, match="overflow"):
+        db.incrby("max", 1)
+    with pytest.raises(ValueError, match="overflow"):
+        db.incrby("min", -1)
+    with pytest.raises(ValueError, match="overflow"):
+        db.hincrby("h", "f", 1)
+    assert apply_command(db, ["INCR", "max"]) == "ERR invalid argument: increment or decrement would overflow"
+    assert apply_command(db, ["INCRBYFLOAT", "k", "inf"]) == "ERR value is not a valid float"
+    assert logged(db) == before
+    assert (db.get("max"), db.get("min"), db.hget("h", "f")) == (str(INT64_MAX), str(INT64_MIN), str(INT64_MAX))
+
+
+def test_non_numbers_are_refused(open_db):
+    db = open_db()
+    db.set("text", "abc")
+    db.set("float", "1.5")
+    db.set("padded", "007")
+    db.hset("h", {"f": "x"})
+    db.rpush("list", "1")
+    for key in ("text", "float", "padded"):
+        with pytest.raises(ValueError, match="not an integer"):
+            db.incrby(key, 1)
+    with pytest.raises(ValueError, match="not a valid float"):
+        db.incrbyfloat("text", 1.0)
+    with pytest.raises(ValueError, match="not an integer"):
+        db.hincrby("h", "f", 1)
+    with pytest.raises(TypeError):
+        db.incrby("list", 1)
+    with pytest.raises(TypeError):
+        db.hincrby("text", "f", 1)
+    # A float that holds an integer can be incremented as one
+    assert db.incrbyfloat("float", 0.5) == "2"
+    assert db.incrby("float", 1) == 3
+    assert db.get("padded") == "007"
+
+
+def test_string_keeps_its_ttl_when_it_becomes_a_counter(open_db):
+    db = open_db()
+    db.set("k", "10")
+    db.expire("k", 100)
+    assert db.incrby("k", 5) == 15
+    assert db.incrbyfloat("k", 0.5) == "15.5"
+    assert 0 < db.ttl("k") <= 100
+    db = open_db()
+    assert db.get("k") == "15.5" and 0 < db.ttl("k") <= 100
+    # SET replaces the counter and drops the TTL
+    db.set("k", "1")
+    assert db.ttl("k") == -1 and db.incrby("k", 1) == 2
+
+
+@pytest.mark.parametrize(
+    "increments, expected",
+    [
+        ([0.1, 0.2], "0.30000000000000004"),
+        ([1.5, 1.5], "3"),
+        ([1e20], "100000000000000000000"),
+        ([-2.5e-5], "-0.000025"),
+        ([5, -10], "-5"),
+    ],
+)
+def test_get_formats_counters_like_redis(open_db, increments, expected):
+    db = open_db()
+    for increment in increments:
+        if isinstance(increment, int):
+            db.incrby("k", increment)
+        else:
+            db.incrbyfloat("k", increment)
+    assert db.get("k") == expected
+    assert apply_command(db, ["GET", "k"]) == expected
+
+
+def test_counters_replay_from_compact_binary_records(open_db):
+    db = open_db("binary")
+    db.set("s", "41")
+    db.incrby("s", 1)
+    db.incrby("n", -7)
+    db.incrbyfloat("f", 2.5)
+    db.incrbyfloat("f", 0.25)
+    db.hincrby("h", "f", 3)
+    db.hincrby("h", "f", 4)
+    expected = (db.get("s"), db.get("n"), db.get("f"), db.hgetall("h"))
+    assert expected == ("42", "-7", "2.75", {"f": "7"})
+
+    with open(db.wal.path, "rb") as f:
+        f.seek(len(BINARY_MAGIC))
+        opcodes = [payload[0] for payload, _ in BinaryWalCodec()._iter_frames(f)]
+    assert opcodes == [1, 17, 17, 18, 18, 19, 19]
+
+    db = open_db("binary")
+    assert (db.get("s"), db.get("n"), db.get("f"), db.hgetall("h")) == expected
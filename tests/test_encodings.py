@@ -0,0 +1,82 @@
+import pytest
+from pykeydb.db.encodings import (
+    HASH_MAX_ENTRIES,
+    LIST_MAX_ENTRIES,
+    MAX_VALUE_LENGTH,
+    SET_MAX_ENTRIES,
+    SET_MAX_INTSET_ENTRIES,
+)
+from pykeydb.db.replies import ErrorReply
+from pykeydb.db.utils import apply_command
+
+LONG = "x" * (MAX_VALUE_LENGTH + 1)
+
+
+def numbers(count: int, start: int = 0) -> list:
+    return [str(i) for i in range(start, start + count)]
+
+
+def fields(count: int) -> list:
+    return [item for i in range(count) for item in (f"f{i}", str(i))]
+
+
+# (commands, the encoding after each one)
+CONVERSIONS = {
+    "list by size": (
+        [["RPUSH", "k", *numbers(LIST_MAX_ENTRIES)], ["RPUSH", "k", "one more"]],
+        ["listpack", "quicklist"],
+    ),
+    "list by length": ([["RPUSH", "k", "a"], ["LPUSH", "k", LONG]], ["listpack", "quicklist"]),
+    "list by lset": ([["RPUSH", "k", "a", "b"], ["LSET", "k", "0", LONG]], ["listpack", "quicklist"]),
+    "list by linsert": ([["RPUSH", "k", "a"], ["LINSERT", "k", "BEFORE", "a", LONG]], ["listpack", "quicklist"]),
+    "hash by size": (
+        [["HSET", "k", *fields(HASH_MAX_ENTRIES)], ["HSET", "k", "extra", "1"]],
+        ["listpack", "hashtable"],
+    ),
+    "full hash rewriting a field": (
+        [["HSET", "k", *fields(HASH_MAX_ENTRIES)], ["HSET", "k", "f0", "new"]],
+        ["listpack", "listpack"],
+    ),
+    "hash by value length": ([["HSET", "k", "f", "1"], ["HSET", "k", "g", LONG]], ["listpack", "hashtable"]),
+    "hash by field length": ([["HSET", "k", "f", "1"], ["HSET", "k", LONG, "1"]], ["listpack", "hashtable"]),
+    "hash by hincrby": ([["HSET", "k", "f", "1"], ["HINCRBY", "k", LONG, "1"]], ["listpack", "hashtable"]),
+    "set by non-integer": (
+        [["SADD", "k", "1", "2"], ["SADD", "k", "a"], ["SADD", "k", *numbers(SET_MAX_ENTRIES)]],
+        ["intset", "listpack", "hashtable"],
+    ),
+    "set by member length": ([["SADD", "k", "1"], ["SADD", "k", LONG]], ["intset", "hashtable"]),
+    "intset by size": (
+        [["SADD", "k", *numbers(SET_MAX_INTSET_ENTRIES)], ["SADD", "k", str(SET_MAX_INTSET_ENTRIES)]],
+        ["intset", "hashtable"],
+    ),
+    "new large sets": (
+        [["SADD", "k", *numbers(SET_MAX_INTSET_ENTRIES + 1)], ["SADD", "j", *numbers(SET_MAX_ENTRIES), "a"]],
+        ["hashtable", "hashtable"],
+    ),
+    "duplicates": (
+        [["SADD", "k", *["a"] * (SET_MAX_ENTRIES + 1)], ["HSET", "j", *["f", "1"] * (HASH_MAX_ENTRIES + 1)]],
+        ["listpack", "listpack"],
+    ),
+}
+
+
+def encodings(db) -> dict:
+    return {key: db.object_encoding(key) for key in db.keys()}
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+@pytest.mark.parametrize("case", list(CONVERSIONS))
+def test_encoding_conversions_survive_replay_and_snapshots(open_db, wal_format, case):
+    commands, expected = CONVERSIONS[case]
+    db = open_db(wal_format)
+    for command, encoding in zip(commands, expected):
+        assert not isinstance(apply_command(db, command), ErrorReply)
+        assert apply_command(db, ["OBJECT", "ENCODING", command[1]]) == encoding, command[0]
+    live = encodings(db)
+
+    # Replay of the logged deltas picks the encoding the live writes picked
+    db = open_db(wal_format)
+    assert encodings(db) == live
+    # And so does loading a snapshot
+    db.save()
+    assert encodings(open_db(wal_format)) == live
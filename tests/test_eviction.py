@@ -0,0 +1,71 @@
+import sys
+import threading
+from pykeydb.db.encodings import IndexedDict
+from pykeydb.db.pyKeyDB import get_pykey_db
+
+
+def test_indexed_dict_picks_only_live_keys():
+    data = IndexedDict({f"k{i}": i for i in range(100)})
+    for i in range(90):
+        del data[f"k{i}"]
+    data.pop("k90")
+    assert {data.random_key() for _ in range(200)} <= {f"k{i}" for i in range(91, 100)}
+    data.clear()
+    assert data.random_key() is None
+
+
+def test_indexed_dict_index_stays_bounded():
+    data = IndexedDict()
+    for round in range(20):
+        for i in range(1000):
+            data[f"k{i}"] = round
+        for i in range(1000):
+            del data[f"k{i}"]
+    data["last"] = 0
+    assert len(data._keys) <= 2 * len(data) + 1024
+    assert data.random_key() == "last"
+    # One list slot per key, not a second dict
+    assert sys.getsizeof(data._keys) < sys.getsizeof(dict(data)) + 8 * 1100
+
+
+def test_used_memory_matches_dataset_after_concurrent_writes(open_db):
+    db = open_db(maxmemory=1 << 30, maxmemory_policy="allkeys-lru")
+
+    def write(thread):
+        for i in range(2000):
+            key = f"t{thread}:{i % 300}"
+            if i % 7 == 0:
+                db.delete(key)
+            elif i % 3 == 0:
+                db.rpush(key + ":list", "x" * (i % 50))
+            else:
+                db.set(key, "v" * (i % 100))
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    tracked = db.used_memory
+    with db._all_locked():
+        db._measure_dataset()
+    assert tracked == db.used_memory > 0
+
+
+def test_eviction_keeps_used_memory_under_the_limit(open_db):
+    db = open_db(maxmemory=200_000, maxmemory_policy="allkeys-random")
+    for i in range(5000):
+        assert db.free_memory_if_needed()
+        db.set(f"key{i}", "x" * 100)
+    assert db.free_memory_if_needed()
+    assert db.used_memory <= 200_000
+    assert db.evicted_keys > 0
+    assert db.dbsize() + db.evicted_keys == 5000
+
+
+def test_get_pykey_db_passes_memory_settings_through(wal_path):
+    db = get_pykey_db(
+        wal_path=wal_path, maxmemory=1 << 20, maxmemory_policy="allkeys-lfu", maxmemory_samples=11
+    )
+    assert (db.maxmemory, db.maxmemory_policy, db.maxmemory_samples) == (1 << 20, "allkeys-lfu", 11)
@@ -0,0 +1,90 @@
+import pytest
+from pykeydb.db import pyKeyDB
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The Unix time in ms expiry reads; tests move it forward by hand"""
+
+    class Clock:
+        now = 1_700_000_000_000
+
+    monkeypatch.setattr(pyKeyDB, "now_ms", lambda: Clock.now)
+    return Clock
+
+
+def records(db):
+    return [(r["operation"], r["key"]) for r in db.wal.replay()]
+
+
+def test_expired_key_is_removed_when_read(open_db, clock):
+    db = open_db()
+    db.set("k", "v")
+    db.rpush("l", "x")
+    db.pexpire("k", 100)
+    db.pexpire("l", 100)
+    assert db.pttl("k") == 100
+    clock.now += 100
+    assert db.get("k") is None and db.pttl("k") == -2
+    assert db.lrange("l", 0, -1) == []
+    assert db.expired_keys == 2
+    # The removal is logged, so replay never brings the keys back
+    assert records(db)[-2:] == [("DEL", "k"), ("DEL", "l")]
+
+
+def test_active_expire_cycle_examines_at_most_max_keys(open_db, clock):
+    db = open_db()
+    for i in range(50):
+        db.set(f"k{i}", "v")
+        db.pexpire(f"k{i}", 10)
+    db.set("kept", "v")
+    clock.now += 10
+
+    def stored():
+        return sum(len(shard.data) for shard in db._shards)
+
+    assert db.active_expire_cycle(max_keys=20) == 20
+    assert stored() == 31
+    assert db.active_expire_cycle(max_keys=20) == 20
+    assert db.active_expire_cycle(max_keys=20) == 10
+    assert db.active_expire_cycle() == 0
+    assert stored() == 1 and db.expired_keys == 50
+    assert not any(shard.expiry_heap for shard in db._shards)
+
+
+def test_stale_expiry_entries_do_not_remove_keys(open_db, clock):
+    db = open_db()
+    db.set("extended", "v")
+    db.expire("extended", 10)
+    db.expire("extended", 100)
+    db.set("persisted", "v")
+    db.expire("persisted", 10)
+    db.persist("persisted")
+    db.set("replaced", "v")
+    db.expire("replaced", 10)
+    db.set("replaced", "w")
+    clock.now += 10_000
+    # Each key left an entry due now in the heap; none of them expires
+    assert db.active_expire_cycle() == 0
+    assert db.get("extended") == "v" and db.ttl("extended") == 90
+    assert db.get("persisted") == "v" and db.ttl("persisted") == -1
+    assert db.get("replaced") == "w" and db.ttl("replaced") == -1
+    clock.now += 90_000
+    assert db.active_expire_cycle() == 1
+    assert sorted(db.keys()) == ["persisted", "replaced"]
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_key_expired_while_down_stays_gone(open_db, clock, wal_format):
+    db = open_db(wal_format)
+    db.set("k", "v")
+    db.set("other", "v")
+    db.pexpire("k", 1000)
+    db = open_db(wal_format)
+    assert db.pttl("k") == 1000
+
+    clock.now += 5000
+    db = open_db(wal_format)
+    assert db.get("k") is None and db.keys() == ["other"]
+    db = open_db(wal_format)
+    assert db.get("k") is None and db.ttl("k") == -2 and db.dbsize() == 1
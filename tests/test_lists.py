@@ -0,0 +1,75 @@
+import pytest
+from pykeydb.db.utils import apply_command
+
+
+def model_range(items: list, start: int, stop: int) -> list:
+    """LRANGE as Redis defines it: inclusive stop, negative from the end, clamped"""
+    length = len(items)
+    if start < 0:
+        start = max(length + start, 0)
+    if stop < 0:
+        stop = length + stop
+    return items[start : stop + 1]
+
+
+@pytest.mark.parametrize("length", [3, 300], ids=["listpack", "quicklist"])
+def test_lrange_and_lindex_match_the_model(open_db, length):
+    db = open_db()
+    items = [f"v{i}" for i in range(length)]
+    db.rpush("l", *items)
+    indexes = [0, 1, 2, length // 2, length - 2, length - 1, length, length + 5, -1, -2, -length, -length - 1, -1000]
+    for start in indexes:
+        # Ranges near the head and near the tail, and out of range ones
+        for stop in indexes:
+            assert db.lrange("l", start, stop) == model_range(items, start, stop), (start, stop)
+        in_range = -length <= start < length
+        assert db.lindex("l", start) == (items[start] if in_range else None)
+    assert db.lrange("missing", 0, -1) == [] and db.lindex("missing", 0) is None
+
+
+def test_lset_resolves_negative_indexes(open_db):
+    db = open_db()
+    db.rpush("l", "a", "b", "c")
+    assert apply_command(db, ["LSET", "l", "-1", "z"]) == "OK"
+    assert apply_command(db, ["LSET", "l", "0", "x"]) == "OK"
+    assert apply_command(db, ["LSET", "l", "3", "y"]) == "ERR index out of range"
+    assert apply_command(db, ["LSET", "l", "-4", "y"]) == "ERR index out of range"
+    assert apply_command(db, ["LSET", "missing", "0", "y"]) == "ERR no such key"
+    assert db.lrange("l", 0, -1) == ["x", "b", "z"]
+    # The resolved index is logged
+    assert [r["index"] for r in db.wal.replay() if r["operation"] == "LSET"] == [2, 0]
+
+
+@pytest.mark.parametrize(
+    "start, stop, kept",
+    [(1, -2, ["b", "c", "d"]), (-2, 100, ["d", "e"]), (-100, 0, ["a"]), (3, 1, []), (5, 10, []), (0, -6, [])],
+)
+def test_ltrim(open_db, start, stop, kept):
+    db = open_db()
+    db.rpush("l", "a", "b", "c", "d", "e")
+    assert apply_command(db, ["LTRIM", "l", str(start), str(stop)]) == "OK"
+    assert db.lrange("l", 0, -1) == kept
+    # A trim that empties the list removes the key, after a restart too
+    assert db.type("l") == ("list" if kept else None)
+    db = open_db()
+    assert db.lrange("l", 0, -1) == kept
+    assert db.type("l") == ("list" if kept else None)
+
+
+def test_linsert(open_db):
+    db = open_db()
+    db.rpush("l", "a", "b", "a")
+    assert db.linsert("l", True, "a", "x") == 4
+    assert db.linsert("l", False, "a", "y") == 5
+    assert db.linsert("l", False, "a", "z") == 6
+    assert db.linsert("l", True, "missing", "w") == -1
+    assert db.linsert("nokey", True, "a", "w") == 0
+    assert db.type("nokey") is None
+    assert apply_command(db, ["LINSERT", "l", "AFTER", "b", "c"]) == 7
+    expected = ["x", "a", "z", "y", "b", "c", "a"]
+    assert db.lrange("l", 0, -1) == expected
+
+    # Replay inserts at the logged index instead of searching for the pivot again
+    inserts = [(r["index"], r["element"]) for r in db.wal.replay() if r["operation"] == "LINSERT"]
+    assert inserts == [(0, "x"), (2, "y"), (2, "z"), (5, "c")]
+    assert open_db().lrange("l", 0, -1) == expected
@@ -0,0 +1,99 @@
+import pytest
+from pykeydb.db.replies import ErrorReply, Push, Replies, SimpleString
+from pykeydb.server.protocol import ENCODING, ERRORS, ProtocolError, RespParser, encode_reply
+
+
+def parse(*chunks: bytes) -> list:
+    """Feed chunks one at a time, collecting what each step yields"""
+    parser = RespParser()
+    commands = []
+    for chunk in chunks:
+        parser.feed(chunk)
+        commands.extend(parser.commands())
+    return commands
+
+
+SET_REQUEST = b"*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$5\r\nvalue\r\n"
+
+
+def test_command_split_at_every_byte_boundary():
+    for i in range(1, len(SET_REQUEST)):
+        assert parse(SET_REQUEST[:i], SET_REQUEST[i:]) == [(["SET", "key", "value"], False)]
+    # And one byte at a time, which leaves the parser holding a partial command each step
+    assert parse(*(SET_REQUEST[i : i + 1] for i in range(len(SET_REQUEST)))) == [(["SET", "key", "value"], False)]
+
+
+def test_pipelined_commands_in_one_buffer():
+    data = SET_REQUEST + b"*2\r\n$3\r\nGET\r\n$3\r\nkey\r\n" + b"PING\r\n"
+    assert parse(data) == [(["SET", "key", "value"], False), (["GET", "key"], False), (["PING"], True)]
+
+
+def test_partial_command_stays_buffered_after_complete_ones():
+    parser = RespParser()
+    parser.feed(SET_REQUEST + SET_REQUEST[:10])
+    assert list(parser.commands()) == [(["SET", "key", "value"], False)]
+    parser.feed(SET_REQUEST[10:])
+    assert list(parser.commands()) == [(["SET", "key", "value"], False)]
+    assert not parser.buffer
+
+
+def test_bulk_strings_are_binary_safe():
+    value = b"line1\r\nline2\xff\xfe\x00"
+    request = b"*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$%d\r\n%s\r\n" % (len(value), value)
+    [(command, _)] = parse(request)
+    assert command[2].encode(ENCODING, ERRORS) == value
+    # The same bytes go back out in a reply
+    assert encode_reply(command[2]) == b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def test_inline_commands_with_quotes():
+    assert parse(b"SET k 'hello world'\r\n") == [(["SET", "k", "hello world"], True)]
+    assert parse(b'SET k "a \\"b\\" c"\n') == [(["SET", "k", 'a "b" c'], True)]
+    assert parse(b"  GET   k  \n") == [(["GET", "k"], True)]
+    # Blank lines are skipped
+    assert parse(b"\r\n\nPING\n") == [(["PING"], True)]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"*x\r\n",
+        b"*-2\r\n",
+        b"*1\r\n:3\r\n",
+        b"*1\r\n$abc\r\n",
+        b"*1\r\n$3\r\nabcde\r\n",
+        b"*%d\r\n" % (1024 * 1024 + 1),
+        b"SET k 'unbalanced\n",
+        b"x" * (64 * 1024 + 1),
+    ],
+)
+def test_malformed_input_raises_protocol_error(data):
+    with pytest.raises(ProtocolError):
+        parse(data)
+
+
+@pytest.mark.parametrize(
+    "reply, resp2, resp3",
+    [
+        (None, b"$-1\r\n", b"_\r\n"),
+        ("hi", b"$2\r\nhi\r\n", b"$2\r\nhi\r\n"),
+        (SimpleString("OK"), b"+OK\r\n", b"+OK\r\n"),
+        (ErrorReply("ERR bad"), b"-ERR bad\r\n", b"-ERR bad\r\n"),
+        (7, b":7\r\n", b":7\r\n"),
+        (True, b":1\r\n", b":1\r\n"),
+        (1.5, b"$3\r\n1.5\r\n", b",1.5\r\n"),
+        (3.0, b"$1\r\n3\r\n", b",3.0\r\n"),
+        ({"f": "v"}, b"*2\r\n$1\r\nf\r\n$1\r\nv\r\n", b"%1\r\n$1\r\nf\r\n$1\r\nv\r\n"),
+        ({"m"}, b"*1\r\n$1\r\nm\r\n", b"~1\r\n$1\r\nm\r\n"),
+        (["a", None], b"*2\r\n$1\r\na\r\n$-1\r\n", b"*2\r\n$1\r\na\r\n_\r\n"),
+        (
+            Push(["message", "ch", "hi"]),
+            b"*3\r\n$7\r\nmessage\r\n$2\r\nch\r\n$2\r\nhi\r\n",
+            b">3\r\n$7\r\nmessage\r\n$2\r\nch\r\n$2\r\nhi\r\n",
+        ),
+        (Replies([1, 2]), b":1\r\n:2\r\n", b":1\r\n:2\r\n"),
+    ],
+)
+def test_encode_reply_resp2_and_resp3(reply, resp2, resp3):
+    assert encode_reply(reply, 2) == resp2
+    assert encode_reply(reply, 3) == resp3
@@ -0,0 +1,111 @@
+from pykeydb.db.replies import Push
+from pykeydb.server.clientContext import ClientContext
+from pykeydb.server.protocol import encode_reply
+from pykeydb.server.pubSub import OUTPUT_BUFFER_LIMIT, PubSub, Subscriber
+
+
+class FakeTransport:
+    """Records what is written; buffer_size is what the socket still has to send"""
+
+    def __init__(self, buffer_size: int = 0):
+        self.written = []
+        self.buffer_size = buffer_size
+        self.aborted = False
+
+    def write(self, data: bytes):
+        self.written.append(data)
+
+    def get_write_buffer_size(self) -> int:
+        return self.buffer_size
+
+    def abort(self):
+        self.aborted = True
+
+
+def subscriber(pubsub: PubSub, channels=(), patterns=(), protocol: int = 2, buffer_size: int = 0) -> Subscriber:
+    sub = Subscriber(FakeTransport(buffer_size), protocol)
+    for channel in channels:
+        pubsub.subscribe(sub, channel)
+    for pattern in patterns:
+        pubsub.psubscribe(sub, pattern)
+    return sub
+
+
+def test_publish_counts_channel_and_pattern_deliveries():
+    pubsub = PubSub()
+    exact = subscriber(pubsub, channels=["news.tech"])
+    both = subscriber(pubsub, channels=["news.tech"], patterns=["news.*"])
+    everything = subscriber(pubsub, patterns=["*"], protocol=3)
+    other = subscriber(pubsub, channels=["sport"])
+
+    # both gets the message twice: once for the channel, once for the pattern
+    assert pubsub.publish("news.tech", "hi") == 4
+    assert pubsub.publish("sport", "goal") == 2
+    assert pubsub.publish("nobody", "x") == 1
+
+    message = Push(["message", "news.tech", "hi"])
+    assert exact.transport.written == [encode_reply(message)]
+    assert both.transport.written == [encode_reply(message), encode_reply(Push(["pmessage", "news.*", "news.tech", "hi"]))]
+    assert everything.transport.written[0] == encode_reply(Push(["pmessage", "*", "news.tech", "hi"]), 3)
+    assert other.transport.written == [encode_reply(Push(["message", "sport", "goal"]))]
+
+
+def test_remove_drops_every_subscription():
+    pubsub = PubSub()
+    sub = subscriber(pubsub, channels=["a", "b"], patterns=["c*"])
+    stays = subscriber(pubsub, channels=["a"])
+    pubsub.remove(sub)
+    assert sub.count == 0
+    assert pubsub.channels == {"a": {stays: None}} and pubsub.patterns == {}
+    assert pubsub.publish("a", "x") == 1 and pubsub.publish("cat", "x") == 0
+
+
+def test_slow_subscriber_is_aborted_and_dropped_everywhere():
+    pubsub = PubSub()
+    slow = subscriber(pubsub, channels=["a", "b"], patterns=["*"], buffer_size=OUTPUT_BUFFER_LIMIT + 1)
+    fast = subscriber(pubsub, channels=["a"])
+
+    assert pubsub.publish("a", "x") == 1
+    assert slow.closed and slow.transport.aborted
+    assert not slow.channels and not slow.patterns
+    assert pubsub.channels == {"a": {fast: None}} and pubsub.patterns == {}
+    # Nothing more is written to it
+    assert len(slow.transport.written) == 1 and not slow.send(b"late")
+
+
+def context(pubsub: PubSub, open_db) -> ClientContext:
+    return ClientContext(open_db(), pubsub=pubsub, transport=FakeTransport())
+
+
+def test_resp2_subscriber_may_only_manage_subscriptions_and_ping(open_db):
+    pubsub = PubSub()
+    client = context(pubsub, open_db)
+    assert client.execute_command(["SUBSCRIBE", "a", "b"]) == [
+        Push(["subscribe", "a", 1]),
+        Push(["subscribe", "b", 2]),
+    ]
+    assert client.execute_command(["GET", "k"]).startswith("ERR Can't execute 'get'")
+    assert client.execute_command(["PING"]) == ["pong", ""]
+    assert client.execute_command(["PSUBSCRIBE", "x*"]) == [Push(["psubscribe", "x*", 3])]
+    client.execute_command(["UNSUBSCRIBE"])
+    client.execute_command(["PUNSUBSCRIBE"])
+    assert not client.subscribed
+    assert client.execute_command(["SET", "k", "v"]) == "OK"
+
+    # RESP3 connections keep running any command while subscribed
+    client.execute_command(["HELLO", "3"])
+    client.execute_command(["SUBSCRIBE", "a"])
+    assert client.execute_command(["GET", "k"]) == "v"
+
+
+def test_publish_inside_multi_is_sent_by_exec(open_db):
+    pubsub = PubSub()
+    listener = subscriber(pubsub, channels=["events"])
+    client = context(pubsub, open_db)
+    client.execute_command(["MULTI"])
+    assert client.execute_command(["SET", "k", "v"]) == "QUEUED"
+    assert client.execute_command(["PUBLISH", "events", "k set"]) == "QUEUED"
+    assert client.execute_command(["SUBSCRIBE", "x"]).startswith("ERR Command not allowed inside a transaction")
+    assert listener.transport.written == []
+    assert client.execute_command(["EXEC"]) == ["OK", 1]
+    assert listener.transport.written == [encode_reply(Push(["message", "events", "k set"]))]
@@ -0,0 +1,297 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import pytest
+from pykeydb.db.dataTypes import DataType, TypedValue
+from pykeydb.db.pyKeyDB import now_ms
+from pykeydb.db.snapshot import write_snapshot
+from pykeydb.db.walCodec import get_wal_codec
+from pykeydb.server import replication
+from pykeydb.server.protocol import encode_reply
+from pykeydb.server.replication import ReplicaLink, Replication
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def set_record(key: str, value: str, expire_at=None) -> dict:
+    return {"operation": "SET", "key": key, "value": TypedValue(value, DataType.STRING, expire_at).to_dict()}
+
+
+def test_replica_hides_expired_key_until_leader_deletes_it(open_db):
+    db = open_db()
+    db.replica = True
+    db.apply_replicated(set_record("k", "v", expire_at=now_ms() - 1000))
+    wal_size = db.wal.size
+
+    assert db.get("k") is None
+    assert db.ttl("k") == -2 and db.keys() == []
+    assert db.active_expire_cycle() == 0
+    # Still there, and nothing was logged: only the leader's DEL removes it
+    assert "k" in db._raw_shard("k").data
+    assert db.wal.size == wal_size and db.expired_keys == 0
+
+    db.apply_replicated({"operation": "DEL", "key": "k"})
+    assert "k" not in db._raw_shard("k").data
+
+
+def test_promoted_replica_expires_keys_itself(open_db):
+    db = open_db()
+    db.replica = True
+    db.apply_replicated(set_record("k", "v", expire_at=now_ms() - 1000))
+    db.replica = False
+    assert db.get("k") is None
+    assert "k" not in db._raw_shard("k").data and db.expired_keys == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="BGSAVE needs fork")
+def test_full_sync_cancels_background_save(open_db):
+    db = open_db()
+    for i in range(1000):
+        db.set(f"old{i}", "x")
+    db.bgsave()
+    bgsave_path = db._bgsave.path
+
+    assert db.replace_dataset([set_record("new", "y")]) == 1
+    assert db._bgsave is None and not os.path.exists(bgsave_path)
+    assert db.get("new") == "y" and db.get("old1") is None
+
+
+def test_replica_link_survives_unexpected_errors(open_db, monkeypatch):
+    monkeypatch.setattr(replication, "RECONNECT_DELAY", 0)
+    link = ReplicaLink(open_db(), "localhost", 0, None, lambda: None)
+    attempts = []
+
+    def sync_and_stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("Background save already in progress")
+        link._stop.set()
+
+    link._sync_and_stream = sync_and_stream
+    link._run()
+    assert len(attempts) == 2
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_replicated_records_survive_a_restart(open_db, wal_format):
+    """Records applied from a leader go to the replica's own WAL and replay as they were applied"""
+    db = open_db(wal_format)
+    db.replica = True
+    db.apply_replicated(set_record("s", "v"))
+    db.apply_replicated({"operation": "RPUSH", "key": "l", "values": ["a", "b"]})
+    db.apply_replicated(
+        {
+            "operation": "BATCH",
+            "key": "",
+            "records": [
+                {"operation": "HSET", "key": "h", "fields": {"f": "1"}},
+                {"operation": "INCRBY", "key": "n", "delta": 5},
+                {"operation": "DEL", "key": "s"},
+            ],
+        }
+    )
+    expected = (db.get("s"), db.lrange("l", 0, -1), db.hget("h", "f"), db.get("n"))
+    assert expected == (None, ["a", "b"], "1", "5")
+
+    db = open_db(wal_format)
+    assert (db.get("s"), db.lrange("l", 0, -1), db.hget("h", "f"), db.get("n")) == expected
+
+
+def test_full_sync_replaces_dataset_and_survives_a_restart(open_db):
+    db = open_db()
+    db.set("stale", "x")
+    db.set("watched", "x")
+    version = db.watch("watched")
+    db.replace_dataset([set_record("fresh", "y")])
+    assert db.keys() == ["fresh"]
+    assert db.watched_version("watched") != version
+    db.unwatch("watched")
+
+    db = open_db()
+    assert db.keys() == ["fresh"] and db.get("fresh") == "y"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Client:
+    """Just enough of a RESP2 client for the replies these tests read"""
+
+    def __init__(self, port: int, timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.sock = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        self.stream = self.sock.makefile("rb")
+
+    def __call__(self, *command):
+        self.sock.sendall(encode_reply(list(command)))
+        return self._read()
+
+    def _read(self):
+        line = self.stream.readline().rstrip(b"\r\n")
+        kind, rest = line[:1], line[1:].decode()
+        if kind in (b"+", b"-"):
+            return rest
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            return None if rest == "-1" else self.stream.read(int(rest) + 2)[:-2].decode()
+        if kind == b"*":
+            return None if rest == "-1" else [self._read() for _ in range(int(rest))]
+        raise ValueError(f"unexpected reply {line!r}")
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    """start_server(name, *args) runs a server with its data in tmp_path/name; returns (process, port)"""
+    processes = []
+
+    def start_server(name: str, *args: str):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "pykeydb.server.server", "--port", str(port), "--dir", str(tmp_path / name), *args],
+            env={**os.environ, "PYTHONPATH": REPO_ROOT},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        processes.append(process)
+        return process, port
+
+    yield start_server
+    for process in processes:
+        process.kill()
+        process.wait()
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_replica_follows_leader_and_keeps_data_after_restart(start_server):
+    _, leader_port = start_server("leader")
+    leader = Client(leader_port)
+    # Before the replica connects: sent in the full sync snapshot
+    leader("SET", "before", "1")
+    leader("RPUSH", "list", "a", "b")
+    leader("SET", "ttl", "x", "PX", "300")
+
+    replica_process, replica_port = start_server("replica", "--replicaof", "127.0.0.1", str(leader_port))
+    replica = Client(replica_port)
+    wait_for(lambda: replica("GET", "before") == "1")
+    assert replica("LRANGE", "list", "0", "-1") == ["a", "b"]
+
+    # After it: streamed as WAL records, a transaction as one batch
+    leader("MULTI")
+    leader("HSET", "hash", "f", "v")
+    leader("INCRBY", "n", "5")
+    leader("DEL", "before")
+    leader("EXEC")
+    wait_for(lambda: replica("GET", "n") == "5")
+    assert replica("HGET", "hash", "f") == "v" and replica("GET", "before") is None
+    assert replica("SET", "k", "v").startswith("READONLY")
+    # The leader expires the key and its DEL reaches the replica (INFO counts keys
+    # hidden on the replica because their TTL passed, until that DEL removes them)
+    wait_for(lambda: "keys:3" in replica("INFO", "keyspace"))
+    assert replica("TTL", "ttl") == -2
+
+    # A restarted replica (no longer following) replays what it was sent from its own WAL
+    replica.close()
+    replica_process.kill()
+    replica_process.wait()
+    _, replica_port = start_server("replica")
+    replica = Client(replica_port)
+    assert replica("GET", "n") == "5" and replica("HGET", "hash", "f") == "v"
+    assert replica("LRANGE", "list", "0", "-1") == ["a", "b"] and replica("GET", "before") is None
+    replica.close()
+    leader.close()
+
+
+class FakeLeader:
+    """Answers one SYNC with a snapshot of snapshot_items followed by records, then keeps the connection open"""
+
+    def __init__(self, tmp_path, snapshot_items, records):
+        path = str(tmp_path / "leader.snapshot")
+        write_snapshot(path, snapshot_items, 0, 0, "json")
+        with open(path, "rb") as f:
+            snapshot = f.read()
+        codec = get_wal_codec("json")
+        self.payload = b"+FULLRESYNC 0 json\r\n$%d\r\n" % len(snapshot) + snapshot
+        self.payload += b"".join(codec.encode(record) for record in records)
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.done = threading.Event()
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.listener.accept()
+        with conn:
+            conn.recv(1024)
+            conn.sendall(self.payload)
+            self.done.wait(10)
+
+    def close(self):
+        self.done.set()
+        self.listener.close()
+
+
+def test_promote_mid_stream_applies_no_later_record(open_db, tmp_path):
+    db = open_db()
+    repl = Replication(db)
+    leader = FakeLeader(
+        tmp_path,
+        [("snap", TypedValue("x", DataType.STRING))],
+        [set_record("a", "1"), set_record("b", "2"), set_record("c", "3")],
+    )
+    apply_replicated = db.apply_replicated
+
+    def apply_then_promote(record):
+        apply_replicated(record)
+        # REPLICAOF NO ONE right after the first record; the rest is already buffered
+        if record["key"] == "a":
+            repl.promote()
+
+    db.apply_replicated = apply_then_promote
+    try:
+        repl.replicaof("127.0.0.1", leader.port)
+        link = repl.link
+        link._thread.join(10)
+        assert not link._thread.is_alive()
+        assert db.get("snap") == "x" and db.get("a") == "1"
+        assert db.get("b") is None and db.get("c") is None
+        assert not db.replica
+    finally:
+        del db.apply_replicated
+        leader.close()
+
+
+def test_promote_waits_for_link_thread(open_db, tmp_path):
+    db = open_db()
+    repl = Replication(db)
+    leader = FakeLeader(tmp_path, [("snap", TypedValue("x", DataType.STRING))], [])
+    try:
+        repl.replicaof("127.0.0.1", leader.port)
+        link = repl.link
+        wait_for(lambda: link.state == "connected")
+        repl.promote()
+        assert not link._thread.is_alive()
+        assert db.set("k", "v") and db.get("snap") == "x"
+    finally:
+        leader.close()
@@ -0,0 +1,109 @@
+import pytest
+
+
+def full_scan(step, count=10, churn=None) -> list:
+    """Run an iteration to its end, calling churn() between steps; returns everything it produced"""
+    cursor, found = step(0, count)
+    results = list(found)
+    while cursor:
+        if churn is not None:
+            churn()
+        cursor, found = step(cursor, count)
+        assert len(found) <= count * 2
+        results.extend(found)
+    return results
+
+
+def test_scan_returns_every_key_present_throughout(open_db):
+    db = open_db()
+    for i in range(3000):
+        db.set(f"stable{i}", "x")
+    counter = iter(range(10**6))
+
+    def churn():
+        # Inserts, deletes and enough turnover to rebuild key lists mid-iteration
+        for _ in range(40):
+            n = next(counter)
+            db.set(f"temp{n}", "x")
+            db.delete(f"temp{n - 20}")
+
+    keys = full_scan(lambda cursor, count: db.scan(cursor, count=count), churn=churn)
+    assert {f"stable{i}" for i in range(3000)} <= set(keys)
+    assert any(shard.data.generation for shard in db._shards)
+
+
+def test_scan_filters_and_bounds_work_per_call(open_db):
+    db = open_db()
+    for i in range(500):
+        db.set(f"user:{i}", "x")
+        db.rpush(f"queue:{i}", "x")
+    keys = full_scan(lambda cursor, count: db.scan(cursor, "user:*", count))
+    assert sorted(keys) == sorted(f"user:{i}" for i in range(500))
+    lists = full_scan(lambda cursor, count: db.scan(cursor, count=count, type_name="list"))
+    assert len(lists) == 500
+
+
+def test_scan_cursors_need_no_server_state(open_db):
+    db = open_db()
+    for i in range(200):
+        db.set(f"k{i}", "x")
+    first_cursor, first_page = db.scan(0, count=5)
+    for _ in range(2000):
+        db.scan(0, count=5)
+
+    # Still good after thousands of other iterations, and can be resumed twice
+    assert db.scan(first_cursor, count=5) == db.scan(first_cursor, count=5)
+    keys = list(first_page)
+    cursor = first_cursor
+    while cursor:
+        cursor, found = db.scan(cursor, count=5)
+        keys.extend(found)
+    assert sorted(keys) == sorted(f"k{i}" for i in range(200))
+
+    # A cursor from before a restart resumes instead of failing
+    db = open_db()
+    cursor = first_cursor
+    while cursor:
+        cursor, _ = db.scan(cursor, count=50)
+
+
+def test_hscan_large_hash_under_writes(open_db):
+    db = open_db()
+    db.hset("hash", {f"f{i}": str(i) for i in range(2000)})
+    counter = iter(range(10**6))
+
+    def churn():
+        # Fewer inserts per step than the step examines, or the iteration could never end
+        for _ in range(5):
+            n = next(counter)
+            db.hset("hash", {f"temp{n}": "x"})
+            db.hdel("hash", f"temp{n - 10}")
+
+    pairs = full_scan(lambda cursor, count: db.hscan("hash", cursor, count=count), churn=churn)
+    fields = dict(zip(pairs[::2], pairs[1::2]))
+    assert all(fields[f"f{i}"] == str(i) for i in range(2000))
+
+
+def test_sscan_large_set_under_removals(open_db):
+    db = open_db()
+    members = [f"m{i}" for i in range(2000)]
+    db.sadd("set", *members)
+    removed = iter(members[::3])
+
+    def churn():
+        # Each removal swaps the set's last member into the hole
+        db.srem("set", next(removed, "none"))
+        db.sadd("set", f"new{next(removed, 'x')}")
+
+    found = set(full_scan(lambda cursor, count: db.sscan("set", cursor, count=count), churn=churn))
+    assert set(db.smembers("set")) & set(members) <= found
+
+
+@pytest.mark.parametrize("command", ["hscan", "sscan"])
+def test_small_collections_scan_in_one_call(open_db, command):
+    db = open_db()
+    db.hset("hash", {"a": "1", "b": "2"})
+    db.sadd("set", "a", "b")
+    cursor, found = getattr(db, command)(command[0] == "h" and "hash" or "set", 0, count=1)
+    assert cursor == 0
+    assert len(found) == (4 if command == "hscan" else 2)
@@ -0,0 +1,149 @@
+import random
+import pytest
+from pykeydb.db.commands import COMMANDS, MOVABLE_KEYS
+from pykeydb.db.encodings import RandomSet
+from pykeydb.db.utils import apply_command
+
+# Members that make SADD pick each set encoding
+ENCODED = {
+    "intset": [str(i) for i in range(10)],
+    "listpack": [f"m{i}" for i in range(10)],
+    "hashtable": [f"m{i}" for i in range(200)],
+}
+
+
+@pytest.mark.parametrize("encoding", list(ENCODED))
+def test_spop_count_larger_than_the_set_deletes_the_key(open_db, encoding):
+    db = open_db()
+    members = ENCODED[encoding]
+    db.sadd("s", *members)
+    assert db.object_encoding("s") == encoding
+    assert sorted(db.spop("s", len(members) + 5)) == sorted(members)
+    assert db.type("s") is None and db.spop("s", 3) == [] and db.spop("s") is None
+    assert open_db().type("s") is None
+
+
+@pytest.mark.parametrize("encoding", list(ENCODED))
+def test_srandmember_count_sign_decides_repeats(open_db, encoding):
+    db = open_db()
+    members = ENCODED[encoding][:3]
+    db.sadd("s", *members)
+    repeated = db.srandmember("s", -50)
+    assert len(repeated) == 50 and set(repeated) == set(members)
+    distinct = db.srandmember("s", 2)
+    assert len(set(distinct)) == 2 and set(distinct) <= set(members)
+    assert sorted(db.srandmember("s", 10)) == sorted(members)
+    assert db.srandmember("s") in members
+    # Nothing is removed
+    assert db.scard("s") == 3
+
+
+def test_random_set_swap_remove_keeps_its_index():
+    rng = random.Random(7)
+    model = set()
+    members = RandomSet()
+    for _ in range(5000):
+        member = str(rng.randrange(300))
+        if rng.random() < 0.5:
+            members.add(member)
+            model.add(member)
+        elif rng.random() < 0.5:
+            members.discard(member)
+            model.discard(member)
+        elif model:
+            popped = members.sample(min(len(model), 5))
+            members.difference_update(popped)
+            model.difference_update(popped)
+        assert len(members) == len(model)
+    assert set(members) == model
+    assert all(members._members[i] == member for member, i in members._positions.items())
+    assert len(members._positions) == len(members._members)
+    assert {members.random_member() for _ in range(2000)} == model
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_spop_is_replayed_as_the_members_it_removed(open_db, wal_format):
+    db = open_db(wal_format)
+    db.sadd("s", *ENCODED["hashtable"])
+    single = db.spop("s")
+    several = db.spop("s", 20)
+    assert single not in several and db.scard("s") == 179
+    records = list(db.wal.replay())
+    assert [record["operation"] for record in records] == ["SADD", "SPOP", "SREM"]
+    assert records[1]["member"] == single
+    # A multi-pop is one SREM of exactly the popped members
+    assert records[2]["members"] == several
+    expected = db.smembers("s")
+    assert open_db(wal_format).smembers("s") == expected
+
+
+def mixed_sets(db) -> dict:
+    """One set of each encoding, overlapping, and the same members as Python sets"""
+    sets = {
+        "ints": {str(i) for i in range(10)},
+        "small": {"3", "4", "9", "a", "b"},
+        "big": {str(i) for i in range(5)} | {f"m{i}" for i in range(200)} | {"a"},
+    }
+    for key, members in sets.items():
+        db.sadd(key, *members)
+    assert [db.object_encoding(key) for key in sets] == ["intset", "listpack", "hashtable"]
+    return sets
+
+
+def test_set_operations_across_encodings(open_db):
+    db = open_db()
+    sets = mixed_sets(db)
+    orders = [("ints", "small"), ("big", "ints"), ("small", "big", "ints"), ("ints", "missing"), ("big", "small")]
+    for keys in orders:
+        values = [sets.get(key, set()) for key in keys]
+        assert db.sinter(*keys) == set.intersection(*values), keys
+        assert db.sunion(*keys) == set.union(*values), keys
+        assert db.sdiff(*keys) == values[0].difference(*values[1:]), keys
+        assert db.sintercard(*keys) == len(set.intersection(*values)), keys
+    db.rpush("list", "1")
+    assert apply_command(db, ["SINTER", "ints", "list"]).startswith("ERR")
+
+
+def test_sintercard_limit_and_keys(open_db):
+    db = open_db()
+    mixed_sets(db)
+    # ints and big share 0-4
+    assert apply_command(db, ["SINTERCARD", "2", "ints", "big"]) == 5
+    assert apply_command(db, ["SINTERCARD", "2", "ints", "big", "LIMIT", "3"]) == 3
+    assert apply_command(db, ["SINTERCARD", "2", "ints", "big", "LIMIT", "0"]) == 5
+    assert apply_command(db, ["SINTERCARD", "2", "ints", "big", "LIMIT", "50"]) == 5
+    assert apply_command(db, ["SINTERCARD", "1", "big", "LIMIT", "7"]) == 7
+    assert apply_command(db, ["SINTERCARD", "2", "ints", "big", "LIMIT", "-1"]).startswith("ERR")
+    assert apply_command(db, ["SINTERCARD", "2", "ints", "big", "LIMT", "1"]) == "ERR syntax error"
+    assert apply_command(db, ["SINTERCARD", "3", "ints", "big"]).startswith("ERR")
+    assert apply_command(db, ["SINTERCARD", "0", "ints"]).startswith("ERR")
+
+    spec = COMMANDS["SINTERCARD"]
+    assert MOVABLE_KEYS in spec.flags
+    assert spec.keys(["SINTERCARD", "2", "a", "b", "LIMIT", "1"]) == ["a", "b"]
+    assert spec.keys(["SINTERCARD", "1", "a", "b"]) == ["a"]
+    # An invalid numkeys takes no keys (the command then fails)
+    assert spec.keys(["SINTERCARD", "5", "a"]) == [] and spec.keys(["SINTERCARD", "x", "a"]) == []
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_store_with_an_empty_result_deletes_the_destination(open_db, wal_format):
+    db = open_db(wal_format)
+    mixed_sets(db)
+    db.sadd("other", "z")
+    assert db.sinterstore("dest", "ints", "big") == 5
+    assert db.sunionstore("union", "small", "other") == 6
+    assert db.object_encoding("dest") == "intset"
+    assert db.sinterstore("dest", "ints", "other") == 0
+    assert db.sdiffstore("union", "small", "small") == 0
+    # Nothing to delete, nothing logged
+    assert db.sinterstore("never", "ints", "missing") == 0
+    operations = [(record["operation"], record["key"]) for record in db.wal.replay()]
+    assert operations[-4:] == [("SET", "dest"), ("SET", "union"), ("DEL", "dest"), ("DEL", "union")]
+
+    # A destination that is one of the sources
+    assert db.sdiffstore("ints", "ints", "small") == 7
+    expected = {key: db.smembers(key) for key in db.keys()}
+    assert set(expected) == {"ints", "small", "big", "other"}
+    db = open_db(wal_format)
+    assert {key: db.smembers(key) for key in db.keys()} == expected
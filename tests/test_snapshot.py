@@ -0,0 +1,169 @@
+import os
+import time
+import pytest
+from pykeydb.db import snapshot
+from pykeydb.db.snapshot import SNAPSHOT_END_OPERATION, read_snapshot
+from pykeydb.db.utils import apply_command
+from pykeydb.db.walCodec import get_wal_codec
+
+needs_fork = pytest.mark.skipif(not hasattr(os, "fork"), reason="BGSAVE needs fork")
+
+
+def write(db, round: int):
+    """Deltas that change the result if any of them is applied twice"""
+    db.set(f"s{round}", str(round))
+    db.rpush("list", f"a{round}", f"b{round}")
+    db.incrby("counter", 10)
+    db.hincrby("hash", "f", 1)
+    db.sadd("set", f"m{round}")
+    db.delete(f"s{round - 1}")
+
+
+def state(db) -> dict:
+    return {
+        "keys": sorted(db.keys()),
+        "list": db.lrange("list", 0, -1),
+        "counter": db.get("counter"),
+        "hash": db.hgetall("hash"),
+        "set": db.smembers("set"),
+    }
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_restart_loads_snapshot_plus_later_records(open_db, wal_format):
+    db = open_db(wal_format)
+    write(db, 0)
+    assert db.save() == 5
+    write(db, 1)
+    write(db, 2)
+    expected = state(db)
+    assert expected["counter"] == "30" and expected["list"] == ["a0", "b0", "a1", "b1", "a2", "b2"]
+
+    db = open_db(wal_format)
+    assert state(db) == expected
+    db.save()
+    write(db, 3)
+    expected = state(db)
+    assert state(open_db(wal_format)) == expected
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_crash_between_snapshot_and_rotate_applies_no_delta_twice(open_db, wal_format, monkeypatch):
+    db = open_db(wal_format)
+    write(db, 0)
+    write(db, 1)
+    expected = state(db)
+
+    def crash(base_offset):
+        raise SystemExit("killed before the WAL was rotated")
+
+    # The new snapshot is in place but the WAL still holds every record it covers
+    monkeypatch.setattr(db.wal, "rotate", crash)
+    with pytest.raises(SystemExit):
+        db.save()
+    monkeypatch.undo()
+    assert read_snapshot(db.snapshot_path) is not None
+
+    db = open_db(wal_format)
+    assert state(db) == expected
+    write(db, 2)
+    expected = state(db)
+    db.save()
+    assert state(open_db(wal_format)) == expected
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+@pytest.mark.parametrize("damage", ["missing record", "missing end"])
+def test_truncated_snapshot_is_refused(open_db, wal_format, damage):
+    db = open_db(wal_format)
+    for i in range(5):
+        db.set(f"k{i}", str(i))
+    db.save()
+    path = db.snapshot_path
+
+    codec = get_wal_codec(wal_format)
+    with open(path, "rb") as f:
+        f.seek(len(codec.header))
+        frames = []
+        start = f.tell()
+        for record, end in codec.iter_records(f):
+            frames.append((record, start, end))
+            start = end
+    with open(path, "rb") as f:
+        data = f.read()
+    if damage == "missing record":
+        # Drop one SET: SNAPSHOT_END's count no longer matches
+        _, start, end = frames[2]
+        data = data[:start] + data[end:]
+    else:
+        assert frames[-1][0]["operation"] == SNAPSHOT_END_OPERATION
+        data = data[: frames[-1][1]]
+    with open(path, "wb") as f:
+        f.write(data)
+
+    with pytest.raises(ValueError, match="expected 5" if damage == "missing record" else "truncated after 5"):
+        open_db(wal_format)
+
+
+def finish_background_save(db) -> bool:
+    while True:
+        done = db.poll_background_save()
+        if done is not None:
+            return done
+        time.sleep(0.01)
+
+
+@needs_fork
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_writes_during_bgsave_survive_in_the_rotated_wal(open_db, wal_format, monkeypatch):
+    db = open_db(wal_format)
+    write(db, 0)
+    write_snapshot = snapshot.write_snapshot
+
+    def slow_write_snapshot(*args, **kwargs):
+        time.sleep(0.3)
+        return write_snapshot(*args, **kwargs)
+
+    # Patched before the fork, so the child writes slowly
+    monkeypatch.setattr(snapshot, "write_snapshot", slow_write_snapshot)
+    assert apply_command(db, ["BGSAVE"]) == "Background saving started"
+    write(db, 1)
+    write(db, 2)
+    assert apply_command(db, ["SAVE"]) == "ERR Background save already in progress"
+    assert apply_command(db, ["BGSAVE"]) == "ERR Background save already in progress"
+    expected = state(db)
+
+    assert finish_background_save(db)
+    assert db.last_bgsave_status == "ok"
+    # Only what was written after the fork is left in the WAL
+    logged = [(record["operation"], record["key"]) for record in db.wal.replay()]
+    assert ("SET", "s0") not in logged and ("SET", "s1") in logged
+    assert logged.count(("INCRBY", "counter")) == 2
+    assert state(open_db(wal_format)) == expected
+
+
+@needs_fork
+def test_failed_bgsave_keeps_the_old_snapshot(open_db, monkeypatch):
+    db = open_db()
+    write(db, 0)
+    db.save()
+    with open(db.snapshot_path, "rb") as f:
+        saved = f.read()
+    write(db, 1)
+    wal_size = os.path.getsize(db.wal.path)
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(snapshot, "write_snapshot", fail)
+    db.bgsave()
+    assert finish_background_save(db) is False
+    assert db.last_bgsave_status == "err"
+    with open(db.snapshot_path, "rb") as f:
+        assert f.read() == saved
+    assert os.path.getsize(db.wal.path) == wal_size
+    assert not os.path.exists(db.snapshot_path + ".bgsave")
+
+    expected = state(db)
+    monkeypatch.undo()
+    assert state(open_db()) == expected
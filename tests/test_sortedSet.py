@@ -0,0 +1,159 @@
+import math
+import random
+import pytest
+from pykeydb.db.sortedSet import ScoreRange, SortedSet
+from pykeydb.db.utils import apply_command
+
+INF = math.inf
+
+
+def model_order(model: dict) -> list:
+    return sorted(model.items(), key=lambda item: (item[1], item[0]))
+
+
+def model_range(model: dict, score_range: ScoreRange, offset: int, count: int, reverse: bool) -> list:
+    pairs = [p for p in model_order(model) if score_range.above_min(p[1]) and score_range.below_max(p[1])]
+    if reverse:
+        pairs.reverse()
+    if offset < 0 or count == 0:
+        return []
+    return pairs[offset:] if count < 0 else pairs[offset : offset + count]
+
+
+def random_bound(rng: random.Random):
+    kind = rng.random()
+    if kind < 0.1:
+        return -INF
+    if kind < 0.2:
+        return INF
+    return float(rng.randint(0, 30))
+
+
+def test_skiplist_matches_sorted_list_model():
+    rng = random.Random(1234)
+    zset = SortedSet()
+    model = {}
+    for step in range(4000):
+        member = f"m{rng.randint(0, 150)}"
+        if rng.random() < 0.3:
+            assert zset.discard(member) == (model.pop(member, None) is not None)
+        else:
+            # Few distinct scores, so ties are ordered by member
+            score = float(rng.randint(0, 30))
+            assert zset.add(member, score) == (member not in model)
+            model[member] = score
+
+        if step % 50:
+            continue
+        order = model_order(model)
+        assert list(zset.items()) == order and len(zset) == len(model)
+        # Ranks follow the spans: every member, both directions
+        for rank, (member, score) in enumerate(order):
+            assert zset.rank(member) == rank
+            assert zset.rank(member, reverse=True) == len(order) - 1 - rank
+            assert zset.score(member) == score
+        assert zset.rank("missing") is None
+        for _ in range(20):
+            start, stop = rng.randint(-200, 200), rng.randint(-200, 200)
+            # Model of ZRANGE's inclusive, negative-from-the-end ranks
+            length = len(order)
+            first = max(length + start, 0) if start < 0 else start
+            last = min(length + stop if stop < 0 else stop, length - 1)
+            expected = order[first : last + 1] if first <= last else []
+            assert zset.range_by_rank(start, stop) == expected
+            assert zset.range_by_rank(start, stop, reverse=True) == (
+                list(reversed(order))[first : last + 1] if first <= last else []
+            )
+        for _ in range(20):
+            score_range = ScoreRange(
+                random_bound(rng), random_bound(rng), rng.random() < 0.5, rng.random() < 0.5
+            )
+            offset = rng.choice([0, 0, 1, 3, 10, 200, -1])
+            count = rng.choice([-1, -1, 0, 1, 5, 50])
+            reverse = rng.random() < 0.5
+            assert zset.range_by_score(score_range, offset, count, reverse) == model_range(
+                model, score_range, offset, count, reverse
+            )
+
+
+def test_pop_min_and_copy():
+    zset = SortedSet([("b", 2), ("a", 1), ("c", 3)])
+    copy = zset.copy()
+    assert zset.pop_min(2) == [("a", 1.0), ("b", 2.0)]
+    assert list(zset.items()) == [("c", 3.0)]
+    assert list(copy) == ["a", "b", "c"]
+
+
+def test_score_bounds_parse_exclusive_and_infinite():
+    score_range = ScoreRange.parse("(1", "+inf")
+    assert not score_range.above_min(1) and score_range.above_min(1.5) and score_range.below_max(INF)
+    assert ScoreRange.parse("-inf", "(2").below_max(1.9) and not ScoreRange.parse("-inf", "(2").below_max(2)
+    assert ScoreRange.parse("(1", "1").is_empty() and not ScoreRange.parse("1", "1").is_empty()
+    with pytest.raises(ValueError):
+        ScoreRange.parse("nan", "1")
+
+
+def zadd(db, *args):
+    return apply_command(db, ["ZADD", "z", *map(str, args)])
+
+
+def test_zadd_flags(open_db):
+    db = open_db()
+    assert zadd(db, 1, "a", 2, "b") == 2
+    # NX: only new members
+    assert zadd(db, "NX", 10, "a", 3, "c") == 1
+    assert db.zscore("z", "a") == 1.0 and db.zscore("z", "c") == 3.0
+    # XX: only existing members, CH counts the changed ones
+    assert zadd(db, "XX", 5, "a", 4, "d") == 0
+    assert db.zscore("z", "a") == 5.0 and db.zscore("z", "d") is None
+    assert zadd(db, "XX", "CH", 6, "a", 2, "b") == 1
+    # GT/LT only move scores one way, but still add new members
+    assert zadd(db, "GT", "CH", 1, "a", 9, "b", 7, "e") == 2
+    assert (db.zscore("z", "a"), db.zscore("z", "b"), db.zscore("z", "e")) == (6.0, 9.0, 7.0)
+    assert zadd(db, "LT", "CH", 8, "a", 1, "b") == 1
+    assert (db.zscore("z", "a"), db.zscore("z", "b")) == (6.0, 1.0)
+    # INCR returns the new score, or nil when a flag vetoes it
+    assert zadd(db, "INCR", 2.5, "a") == 8.5
+    assert zadd(db, "NX", "INCR", 1, "a") is None
+    assert zadd(db, "XX", "INCR", 1, "missing") is None
+    assert zadd(db, "GT", "INCR", -1, "a") is None and db.zscore("z", "a") == 8.5
+    assert zadd(db, "LT", "INCR", -1, "a") == 7.5
+    # Invalid combinations write nothing
+    for args in (("NX", "XX", 1, "a"), ("GT", "LT", 1, "a"), ("NX", "GT", 1, "a"), ("INCR", 1, "a", 2, "b")):
+        assert zadd(db, *args).startswith("ERR")
+    assert zadd(db, 1, "x", "nope", "y").startswith("ERR") and db.zscore("z", "x") is None
+    assert db.zcard("z") == 4
+
+
+def test_zrange_command_options(open_db):
+    db = open_db()
+    zadd(db, 1, "a", 2, "b", 3, "c", 4, "d", 5, "e")
+    assert apply_command(db, ["ZRANGE", "z", "0", "-1"]) == ["a", "b", "c", "d", "e"]
+    assert apply_command(db, ["ZRANGE", "z", "-2", "100", "REV"]) == ["b", "a"]
+    assert apply_command(db, ["ZRANGE", "z", "(1", "+inf", "BYSCORE", "LIMIT", "1", "2"]) == ["c", "d"]
+    reply = apply_command(db, ["ZRANGE", "z", "(5", "-inf", "BYSCORE", "REV", "LIMIT", "0", "2", "WITHSCORES"])
+    assert reply == ["d", 4.0, "c", 3.0]
+    assert apply_command(db, ["ZRANGEBYSCORE", "z", "-inf", "(3"]) == ["a", "b"]
+    assert apply_command(db, ["ZRANGE", "z", "0", "1", "LIMIT", "0", "1"]).startswith("ERR")
+    assert apply_command(db, ["ZRANK", "z", "c"]) == 2
+    assert apply_command(db, ["ZPOPMIN", "z", "2"]) == ["a", 1.0, "b", 2.0]
+    assert apply_command(db, ["ZREM", "z", "c", "d", "e", "x"]) == 3
+    assert db.zcard("z") == 0 and db.type("z") is None
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_zset_survives_restart_and_zincrby_logs_its_result(open_db, wal_format):
+    db = open_db(wal_format)
+    zadd(db, 1, "a", 2, "b", 3, "c")
+    assert db.zincrby("z", 2.5, "a") == 3.5
+    assert db.zincrby("z", 1, "new") == 1.0
+    db.zrem("z", "b")
+    db.zpopmin("z")
+    live = list(db.zrange("z", 0, -1))
+
+    zadds = [r for r in db.wal.replay() if r["operation"] == "ZADD"]
+    # The increment is logged as the score it produced, not as a delta
+    assert zadds[1]["members"] == {"a": 3.5} and zadds[2]["members"] == {"new": 1.0}
+
+    db = open_db(wal_format)
+    assert db.zrange("z", 0, -1) == live == [("c", 3.0), ("a", 3.5)]
@@ -0,0 +1,117 @@
+import threading
+import time
+from pykeydb.server.clientContext import ClientContext
+
+
+def keys_in_shards(db):
+    """A key in the first shard and one in a later shard"""
+    by_shard = {}
+    for i in range(1000):
+        by_shard.setdefault(db._raw_shard(f"k{i}"), f"k{i}")
+    return by_shard[db._shards[0]], by_shard[db._shards[-1]]
+
+
+def test_exec_with_keyspace_command_keeps_lock_order(open_db):
+    db = open_db()
+    low, high = keys_in_shards(db)
+    client = ClientContext(db)
+    client.execute_command(["MULTI"])
+    client.execute_command(["SET", high, "x"])
+    client.execute_command(["KEYS", "*"])
+
+    holding_low = threading.Event()
+    got_high = []
+
+    def other_thread():
+        # Holds the first shard, then wants the last: EXEC must not hold the
+        # last shard while it waits for the first one
+        with db._raw_shard(low).lock:
+            holding_low.set()
+            time.sleep(0.2)
+            lock = db._raw_shard(high).lock
+            got_high.append(lock.acquire(timeout=2))
+            if got_high[0]:
+                lock.release()
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    holding_low.wait()
+    replies = client.execute_command(["EXEC"])
+    thread.join()
+    assert got_high == [True]
+    assert replies[1] == [high]
+
+
+def watching(db, *keys):
+    """A client that WATCHed keys and queued SET tx 1 in MULTI"""
+    client = ClientContext(db)
+    assert client.execute_command(["WATCH", *keys]) == "OK"
+    client.execute_command(["MULTI"])
+    client.execute_command(["SET", "tx", "1"])
+    return client
+
+
+def test_write_by_another_client_aborts_exec(open_db):
+    db = open_db()
+    db.set("k", "v")
+    client = watching(db, "k", "other")
+    assert ClientContext(db).execute_command(["RPUSH", "k2", "w"]) == 1
+    assert ClientContext(db).execute_command(["SET", "k", "w"]) == "OK"
+    assert client.execute_command(["EXEC"]) is None
+    assert db.get("tx") is None
+    # The abort unwatched: the next transaction runs
+    client.execute_command(["MULTI"])
+    client.execute_command(["SET", "tx", "2"])
+    assert client.execute_command(["EXEC"]) == ["OK"]
+
+
+def test_expiry_and_eviction_abort_exec(open_db):
+    db = open_db()
+    db.set("k", "v")
+    db.pexpire("k", 50)
+    client = watching(db, "k")
+    time.sleep(0.1)
+    assert client.execute_command(["EXEC"]) is None
+
+    db = open_db(maxmemory=1 << 20, maxmemory_policy="allkeys-random")
+    keys = [f"key{i}" for i in range(200)]
+    db.mset({key: "x" * 100 for key in keys})
+    client = watching(db, *keys)
+    # EXEC makes room first, evicting one of the watched keys
+    db.configure_memory(maxmemory=db.used_memory - 1)
+    assert client.execute_command(["EXEC"]) is None
+    assert db.evicted_keys >= 1 and db.get("tx") is None
+
+
+def test_no_op_write_does_not_abort_exec(open_db):
+    db = open_db()
+    db.sadd("s", "a")
+    client = watching(db, "s", "missing")
+    other = ClientContext(db)
+    assert other.execute_command(["SREM", "s", "b"]) == 0
+    assert other.execute_command(["DEL", "missing"]) == 0
+    assert other.execute_command(["SMEMBERS", "s"]) == {"a"}
+    assert client.execute_command(["EXEC"]) == ["OK"]
+
+
+def test_watched_versions_are_freed(open_db):
+    db = open_db()
+
+    def entries():
+        return {key: entry for shard in db._shards for key, entry in shard.watched.items()}
+
+    first, second, third = ClientContext(db), ClientContext(db), ClientContext(db)
+    for client in (first, second, third):
+        client.execute_command(["WATCH", "k"])
+    first.execute_command(["WATCH", "k", "j"])
+    assert entries() == {"k": [0, 3], "j": [0, 1]}
+    first.execute_command(["UNWATCH"])
+    assert entries() == {"k": [0, 2]}
+    second.execute_command(["MULTI"])
+    second.execute_command(["DISCARD"])
+    assert entries() == {"k": [0, 1]}
+    third.close()
+    assert entries() == {}
+    # Without watchers a write keeps no version
+    db.set("k", "v")
+    assert entries() == {}
@@ -0,0 +1,45 @@
+def big_hash(db, key="h"):
+    db.hset(key, {f"field-{i}": str(i) for i in range(1000)})
+    return db._shard(key).data[key]
+
+
+def test_hash_write_after_view_released_is_in_place(open_db):
+    db = open_db()
+    typed_val = big_hash(db)
+    value = typed_val.value
+    view = db.hgetall("h")
+    assert view["field-1"] == "1"
+    view = None
+    db.hset("h", {"field-1": "changed"})
+    assert typed_val.value is value
+    assert db.hget("h", "field-1") == "changed"
+
+
+def test_hash_view_held_across_write_is_unchanged(open_db):
+    db = open_db()
+    typed_val = big_hash(db)
+    value = typed_val.value
+    view = db.hgetall("h")
+    db.hset("h", {"field-1": "changed", "new": "x"})
+    db.hdel("h", "field-2")
+    assert typed_val.value is not value
+    assert view["field-1"] == "1" and "new" not in view and "field-2" in view
+    assert db.hget("h", "field-1") == "changed"
+    # Only the first write after a read copies
+    copied = typed_val.value
+    db.hset("h", {"field-3": "changed"})
+    assert typed_val.value is copied
+
+
+def test_set_view_copies_only_while_held(open_db):
+    db = open_db()
+    db.sadd("s", *[f"m{i}" for i in range(1000)])
+    typed_val = db._shard("s").data["s"]
+    value = typed_val.value
+    db.smembers("s")
+    db.sadd("s", "new")
+    assert typed_val.value is value
+    view = db.smembers("s")
+    db.srem("s", "m1")
+    assert typed_val.value is not value
+    assert "m1" in view and "m1" not in db.smembers("s")
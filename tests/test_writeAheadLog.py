@@ -0,0 +1,260 @@
+import json
+import os
+import struct
+import threading
+import time
+import pytest
+from pykeydb.db import walCodec, writeAheadLog
+from pykeydb.db.walCodec import BINARY_MAGIC
+from pykeydb.db.writeAheadLog import WalCorruptedError, WriteAheadLog, dispose_write_ahead_log
+
+_FRAME = struct.Struct("<II")
+
+
+def frame_offsets(path: str) -> list:
+    """Start offset of every frame in a binary WAL"""
+    with open(path, "rb") as f:
+        data = f.read()
+    offsets = []
+    position = len(BINARY_MAGIC)
+    while position < len(data):
+        offsets.append(position)
+        length, _ = _FRAME.unpack_from(data, position)
+        position += _FRAME.size + length
+    return offsets
+
+
+def write_keys(open_db, count: int) -> str:
+    db = open_db(wal_format="binary")
+    for i in range(count):
+        db.set(f"key{i}", f"value{i}")
+    return db.wal.path
+
+
+def corrupt(path: str, offset: int):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes((byte[0] ^ 0xFF,)))
+
+
+def test_torn_tail_is_truncated(open_db):
+    path = write_keys(open_db, 5)
+    size = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(_FRAME.pack(100, 0) + b"partial")
+
+    db = open_db(wal_format="binary")
+    assert [db.get(f"key{i}") for i in range(5)] == [f"value{i}" for i in range(5)]
+    assert os.path.getsize(path) == size
+    db.set("after", "restart")
+
+    db = open_db(wal_format="binary")
+    assert db.get("after") == "restart"
+
+
+def test_damaged_last_frame_is_truncated(open_db):
+    path = write_keys(open_db, 5)
+    last = frame_offsets(path)[-1]
+    corrupt(path, os.path.getsize(path) - 1)
+
+    db = open_db(wal_format="binary")
+    assert db.get("key3") == "value3"
+    assert db.get("key4") is None
+    assert os.path.getsize(path) == last
+
+
+@pytest.mark.parametrize(
+    "torn, a_after",
+    [
+        (b'{"operation": "SET", "key": "b", "val', "1"),
+        # A complete record that only lost its newline was applied, and is kept
+        (b'{"operation": "DEL", "key": "a"}', None),
+    ],
+    ids=["partial", "unterminated"],
+)
+def test_torn_json_last_line_does_not_swallow_the_next_record(open_db, torn, a_after):
+    db = open_db()
+    db.set("a", "1")
+    path = db.wal.path
+    with open(path, "ab") as f:
+        f.write(torn)
+
+    db = open_db()
+    assert db.get("a") == a_after
+    db.set("c", "3")
+    db = open_db()
+    assert db.get("c") == "3" and db.get("a") == a_after
+    with open(path, "rb") as f:
+        assert all(json.loads(line) for line in f.read().splitlines())
+
+
+@pytest.mark.parametrize("where", [_FRAME.size + 2, 0], ids=["payload", "length"])
+def test_damage_before_intact_records_refuses_to_replay(open_db, where):
+    path = write_keys(open_db, 5)
+    corrupt(path, frame_offsets(path)[1] + where)
+    with open(path, "rb") as f:
+        damaged = f.read()
+
+    with pytest.raises(WalCorruptedError):
+        open_db(wal_format="binary")
+    with open(path, "rb") as f:
+        assert f.read() == damaged
+
+
+def populate(db):
+    """Overwrite keys with SET, MSET, MULTI-style batches and deltas, leaving a known final state"""
+    for round in range(3):
+        db.set("plain", f"v{round}")
+        db.rpush("list", f"a{round}", f"b{round}")
+        db.mset({"m1": f"x{round}", "m2": f"y{round}"})
+        with db.locked("list", "plain", write=True), db.wal.atomic_batch():
+            db.delete("list")
+            db.rpush("list", f"batched{round}")
+            db.set("plain", f"batched{round}")
+    db.hset("hash", {"f": "1"})
+    db.hincrby("hash", "f", 5)
+    db.set("gone", "soon")
+    db.delete_many("gone", "m2")
+
+
+def dump(db) -> dict:
+    """Every key's type and value, for comparing two stores"""
+    dumped = {}
+    for key in db.keys():
+        key_type = db.type(key)
+        if key_type == "list":
+            dumped[key] = db.lrange(key, 0, -1)
+        elif key_type == "hash":
+            dumped[key] = dict(db.hgetall(key))
+        elif key_type == "set":
+            dumped[key] = db.smembers(key)
+        else:
+            dumped[key] = db.get(key)
+    return dumped
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_last_writer_wins_replays_to_the_same_state(open_db, wal_format):
+    db = open_db(wal_format=wal_format)
+    populate(db)
+    expected = dump(db)
+    assert expected["hash"] == {"f": "6"}
+    assert dump(open_db(wal_format=wal_format)) == expected
+    assert dump(open_db(wal_format=wal_format, replay_last_writer_wins=True)) == expected
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_every_delta_record_replays_to_the_live_state(open_db, wal_format):
+    db = open_db(wal_format=wal_format)
+    # A collection write from an older WAL, which logged the whole value
+    db.wal.log_operation("RPUSH", "legacy", {"type": "list", "value": ["old1", "old2"]})
+    db = open_db(wal_format=wal_format)
+    assert db.lrange("legacy", 0, -1) == ["old1", "old2"]
+    start = len(list(db.wal.replay()))
+
+    db.rpush("legacy", "new")
+    db.lpush("list", "a", "b", "c")
+    db.rpush("list", "d", "e")
+    db.lpop("list")
+    db.rpop("list")
+    db.hset("hash", {"f1": "1", "f2": "2", "f3": "3"})
+    db.hset("hash", {"f1": "one"})
+    db.hdel("hash", "f2", "missing")
+    db.sadd("set", *[f"m{i}" for i in range(20)])
+    db.srem("set", "m0", "m1")
+    db.spop("set")
+    db.spop("set", 3)
+    db.sadd("gone", "x")
+    db.spop("gone")
+    expected = dump(db)
+    assert "gone" not in expected and len(expected["set"]) == 14
+
+    logged = {record["operation"] for record in list(db.wal.replay())[start:]}
+    assert logged >= {"LPUSH", "RPUSH", "LPOP", "RPOP", "HSET", "HDEL", "SADD", "SREM", "SPOP"}
+    assert dump(open_db(wal_format=wal_format)) == expected
+
+
+@pytest.mark.parametrize("wal_format", ["json", "binary"])
+def test_last_writer_wins_skips_records_superseded_inside_batches(open_db, wal_format):
+    db = open_db(wal_format=wal_format)
+    for round in range(10):
+        db.rpush("list", str(round))
+    db.mset({"list": "replaced", "other": "x"})
+
+    replayed = list(db.wal.replay(last_writer_wins=True))
+    assert [record["operation"] for record in replayed] == ["BATCH"]
+    assert dump(open_db(wal_format=wal_format, replay_last_writer_wins=True)) == {"list": "replaced", "other": "x"}
+
+
+def test_json_last_writer_wins_parses_only_needed_lines(open_db, monkeypatch):
+
+    db = open_db()
+    for round in range(50):
+        db.set("key", "x" * 1000 + str(round))
+        db.rpush("list", str(round))
+    db.set("list", "last")
+
+    parsed = []
+
+    class CountingJson:
+        JSONDecodeError = json.JSONDecodeError
+        dumps = staticmethod(json.dumps)
+
+        @staticmethod
+        def loads(line):
+            parsed.append(line)
+            return json.loads(line)
+
+    monkeypatch.setattr(walCodec, "json", CountingJson)
+    replayed = list(db.wal.replay(last_writer_wins=True))
+    assert [record["key"] for record in replayed] == ["key", "list"]
+    assert len(parsed) == 2
+
+
+def test_group_commit_makes_every_record_durable_with_fewer_fsyncs(wal_path, monkeypatch):
+    wal = WriteAheadLog(wal_path, fsync_policy="always")
+    durable = [b""]
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        fsync(fd)
+        # What a crash right now would leave on disk
+        with open(wal_path, "rb") as f:
+            durable.append(f.read())
+        time.sleep(0.02)
+
+    monkeypatch.setattr(writeAheadLog.os, "fsync", slow_fsync)
+    writers = 16
+    start = threading.Barrier(writers)
+    lost = []
+
+    def write(n):
+        value = {"type": "string", "value": f"value{n}"}
+        start.wait()
+        wal.log_operation("SET", f"key{n}", value)
+        if wal.codec.encode({"operation": "SET", "key": f"key{n}", "value": value}) not in durable[-1]:
+            lost.append(n)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert lost == []
+    assert 1 <= len(durable) - 1 < writers
+
+
+def test_everysec_flusher_stops_on_close(wal_path):
+    wal = WriteAheadLog(wal_path, fsync_policy="everysec")
+    flusher = wal._flusher
+    assert flusher.is_alive()
+    wal.log_operation("SET", "key", {"type": "string", "value": "value"})
+    started = time.monotonic()
+    # dispose closes the log
+    dispose_write_ahead_log(wal_path)
+    assert not flusher.is_alive()
+    assert time.monotonic() - started < writeAheadLog.EVERYSEC_INTERVAL
+    with open(wal_path, "rb") as f:
+        assert b'"key"' in f.read()